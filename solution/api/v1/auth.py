@@ -1,7 +1,13 @@
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from typing import Any
 
 import jwt
 from django.conf import settings
+from django.core.cache import cache
+from django.db import models, router, transaction
 from django.http import HttpRequest
 from ninja.security import HttpBearer
 from pydantic import BaseModel, ValidationError
@@ -10,6 +16,153 @@ import apps.business.models
 import apps.user.models
 
 
+class PrincipalCache:
+    # Short-lived in-process copy in front of the shared Django cache.
+    # Entries hold the loaded column values rather than model instances,
+    # so every request gets its own object to mutate. A local entry is
+    # only served while the shared generation it was read under is
+    # current, so invalidations are seen by every worker right away.
+
+    def __init__(
+        self,
+        model: type[models.Model],
+        local_ttl: float,
+        shared_ttl: int,
+        max_size: int,
+        exclude: tuple[str, ...] = (),
+    ) -> None:
+        self.model = model
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.max_size = max_size
+        self.exclude = exclude
+
+        self._entries: OrderedDict[
+            uuid.UUID, tuple[float, int, tuple[Any, ...]]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def field_names(self) -> list[str]:
+        concrete_fields = self.model._meta.concrete_fields  # noqa: SLF001
+
+        return [
+            field.attname
+            for field in concrete_fields
+            if field.name not in self.exclude
+        ]
+
+    def get_generation_key(self, pk: uuid.UUID) -> str:
+        return f"principal:{self.model.__name__.lower()}:{pk}:generation"
+
+    def get_generation(self, pk: uuid.UUID) -> int:
+        generation_key = self.get_generation_key(pk)
+        generation = cache.get(generation_key)
+
+        if generation is None:
+            # Never restart from a number values may still be cached under
+            cache.add(generation_key, time.time_ns(), timeout=self.shared_ttl)
+            generation = cache.get(generation_key)
+
+        return generation
+
+    def get_key(self, pk: uuid.UUID, generation: int) -> str:
+        return f"principal:{self.model.__name__.lower()}:{pk}:{generation}"
+
+    def get(self, pk: uuid.UUID) -> models.Model | None:
+        now = time.monotonic()
+        generation = self.get_generation(pk)
+
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is not None and (
+                entry[0] <= now or entry[1] != generation
+            ):
+                del self._entries[pk]
+                entry = None
+
+        if entry is not None:
+            values = entry[2]
+        else:
+            # A row read before an invalidation commits is cached under
+            # the previous generation, which is no longer read.
+            key = self.get_key(pk, generation)
+            values = cache.get(key)
+
+            if values is None:
+                values = self._load_values(pk)
+                if values is None:
+                    return None
+
+                cache.set(key, values, timeout=self.shared_ttl)
+
+            self._set_local(pk, generation, values, now)
+
+        return self.model.from_db(
+            router.db_for_read(self.model),
+            self.field_names,
+            values,
+        )
+
+    def invalidate(self, pk: uuid.UUID) -> None:
+        generation_key = self.get_generation_key(pk)
+
+        def bump() -> None:
+            with self._lock:
+                self._entries.pop(pk, None)
+
+            try:
+                cache.incr(generation_key)
+            except ValueError:
+                cache.add(
+                    generation_key, time.time_ns(), timeout=self.shared_ttl
+                )
+
+        transaction.on_commit(bump)
+
+    def _load_values(self, pk: uuid.UUID) -> tuple[Any, ...] | None:
+        try:
+            return self.model.objects.values_list(*self.field_names).get(
+                pk=pk,
+            )
+        except self.model.DoesNotExist:
+            return None
+
+    def _set_local(
+        self,
+        pk: uuid.UUID,
+        generation: int,
+        values: tuple[Any, ...],
+        now: float,
+    ) -> None:
+        if self.local_ttl <= 0 or self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[pk] = (now + self.local_ttl, generation, values)
+            self._entries.move_to_end(pk)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+business_principals = PrincipalCache(
+    apps.business.models.Business,
+    local_ttl=settings.AUTH_PRINCIPAL_LOCAL_TTL,
+    shared_ttl=settings.AUTH_PRINCIPAL_CACHE_TTL,
+    max_size=settings.AUTH_PRINCIPAL_LOCAL_CACHE_SIZE,
+    exclude=("password",),
+)
+
+user_principals = PrincipalCache(
+    apps.user.models.User,
+    local_ttl=settings.AUTH_PRINCIPAL_LOCAL_TTL,
+    shared_ttl=settings.AUTH_PRINCIPAL_CACHE_TTL,
+    max_size=settings.AUTH_PRINCIPAL_LOCAL_CACHE_SIZE,
+    exclude=("password",),
+)
+
+
 class BusinessToken(BaseModel):
     business_id: uuid.UUID
     token_version: int
@@ -27,11 +180,8 @@ class BusinessAuth(HttpBearer):
         except (jwt.PyJWTError, ValidationError):
             return None
 
-        try:
-            business = apps.business.models.Business.objects.get(
-                id=token_payload.business_id,
-            )
-        except apps.business.models.Business.DoesNotExist:
+        business = business_principals.get(token_payload.business_id)
+        if business is None:
             return None
 
         if business.token_version != token_payload.token_version:
@@ -57,9 +207,8 @@ class UserAuth(HttpBearer):
         except (jwt.PyJWTError, ValidationError):
             return None
 
-        try:
-            user = apps.user.models.User.objects.get(id=token_payload.user_id)
-        except apps.user.models.User.DoesNotExist:
+        user = user_principals.get(token_payload.user_id)
+        if user is None:
             return None
 
         if user.token_version != token_payload.token_version:
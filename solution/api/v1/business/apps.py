@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
-class PingConfig(AppConfig):
+class BusinessConfig(AppConfig):
     name = "api.v1.business"
     label = "api_v1_business"
+
+    def ready(self) -> None:
+        from api.v1.business.schemas import PromocodeViewOut  # noqa: PLC0415
+
+        # A typo would otherwise silently drop the field from every list
+        unknown_fields = set(settings.PROMOCODE_LIST_DEFAULT_FIELDS) - set(
+            PromocodeViewOut.model_fields
+        )
+        if unknown_fields:
+            err = (
+                "PROMOCODE_LIST_DEFAULT_FIELDS has unknown fields: "
+                f"{', '.join(sorted(unknown_fields))}"
+            )
+            raise ImproperlyConfigured(err)
@@ -79,6 +79,17 @@ class CreatePromocodeOut(Schema):
     id: uuid.UUID
 
 
+class BulkCreatePromocodeItemOut(Schema):
+    index: int
+    id: uuid.UUID | None = None
+    errors: Any | None = None
+
+
+class BulkCreatePromocodeOut(Schema):
+    created_count: int
+    items: list[BulkCreatePromocodeItemOut]
+
+
 class PromocodeListFilters(Schema):
     limit: int = Field(
         10, ge=0, description="Limit must be greater than or equal 0"
@@ -86,6 +97,10 @@ class PromocodeListFilters(Schema):
     offset: int = Field(
         0, ge=0, description="Offset must be greater than or equal to 0"
     )
+    cursor: str | None = Field(
+        None, description="Keyset pagination cursor, empty for first page"
+    )
+    with_total: bool = True
     sort_by: Literal["active_from", "active_until", None] = None
     country__in: list[CountryAlpha2] | str = Field(None, alias="country")
 
@@ -96,6 +111,30 @@ class PromocodeListFilters(Schema):
 
         return value
 
+    fields: list[str] | None = Field(
+        None,
+        description="Comma separated fields to return, all by default",
+    )
+
+    @field_validator("fields", mode="before")
+    def split_fields(cls, value: Any) -> Any:
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0].split(",")
+
+        return value
+
+    @field_validator("fields")
+    def validate_fields(cls, value: list[str] | None) -> list[str] | None:
+        if value is None:
+            return value
+
+        unknown_fields = set(value) - set(PromocodeViewOut.model_fields)
+        if unknown_fields:
+            err = f"Unknown fields: {', '.join(sorted(unknown_fields))}"
+            raise ValueError(err)
+
+        return value
+
 
 class PromocodeTargetViewOut(Schema):
     age_from: int | None
@@ -150,3 +189,27 @@ class PromocodeStatsForCountry(Schema):
 class PromocodeStats(Schema):
     activations_count: int
     countries: list[PromocodeStatsForCountry] | None = None
+
+
+class PromocodeTimeseriesFilters(Schema):
+    bucket: Literal["hour", "day"] = "day"
+    since: datetime.datetime | None = Field(
+        None, alias="from", description="Defaults to 24 hours or 30 days ago"
+    )
+    until: datetime.datetime | None = Field(
+        None, alias="to", description="Defaults to now"
+    )
+
+
+class PromocodeTimeseriesPoint(Schema):
+    bucket_start: datetime.datetime
+    activations_count: int
+
+
+class PromocodeTimeseries(Schema):
+    bucket: Literal["hour", "day"]
+    points: list[PromocodeTimeseriesPoint]
+
+
+class ActivationsExportFilters(Schema):
+    format: Literal["ndjson", "csv"] = "ndjson"
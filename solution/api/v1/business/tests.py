@@ -0,0 +1,572 @@
+import datetime
+import json
+import uuid
+from http import HTTPStatus as status
+from unittest import mock
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from apps.business.models import Business
+from apps.promo.models import (
+    Promocode,
+    PromocodeActivation,
+    PromocodeActivationBucket,
+    PromocodeUniqueCode,
+)
+from apps.promo.tests import create_business, create_promocode, create_users
+from config.middleware import QUERY_COUNT_HEADER, QUERY_TIME_HEADER
+from config.testing import QueryBudgetTestCase
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeListQueryCountTests(TestCase):
+    PROMOCODES = 12
+
+    def setUp(self) -> None:
+        business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {business.generate_token()}",
+        }
+
+        for i in range(self.PROMOCODES):
+            if i % 2:
+                create_promocode(
+                    business,
+                    mode=Promocode.ModeChoices.COMMON,
+                    promo_common="sale-10",
+                    max_count=10,
+                )
+            else:
+                create_promocode(
+                    business,
+                    mode=Promocode.ModeChoices.UNIQUE,
+                    promo_unique=["code-1", "code-2"],
+                    max_count=1,
+                )
+
+        # Warm up the authenticated principal cache
+        self.client.get("/api/business/promo", headers=self.headers)
+
+    def test_list_query_count_does_not_depend_on_page_size(self) -> None:
+        for limit in (1, 5, self.PROMOCODES):
+            # Total count and page
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    f"/api/business/promo?limit={limit}",
+                    headers=self.headers,
+                )
+
+            self.assertEqual(response.status_code, status.OK)
+            self.assertEqual(len(response.json()), limit)
+
+    def test_detail_reads_annotated_activity(self) -> None:
+        promocode = Promocode.objects.first()
+
+        # Existence, ownership with annotations
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f"/api/business/promo/{promocode.id}",
+                headers=self.headers,
+            )
+
+        self.assertEqual(response.status_code, status.OK)
+        self.assertTrue(response.json()["active"])
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeListFieldsTests(TestCase):
+    def setUp(self) -> None:
+        business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {business.generate_token()}",
+        }
+        self.promocode = create_promocode(
+            business,
+            mode=Promocode.ModeChoices.UNIQUE,
+            promo_unique=["code-1", "code-2"],
+            max_count=1,
+        )
+
+    def get_items(self, query: str = "") -> list[dict]:
+        response = self.client.get(
+            f"/api/business/promo{query}", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.OK)
+
+        return response.json()
+
+    def test_fields_trim_list_items(self) -> None:
+        self.assertEqual(
+            self.get_items("?fields=promo_id,like_count"),
+            [{"promo_id": str(self.promocode.id), "like_count": 0}],
+        )
+
+    @override_settings(PROMOCODE_LIST_DEFAULT_FIELDS=["promo_id", "mode"])
+    def test_default_fields_apply_without_fields(self) -> None:
+        self.assertEqual(
+            self.get_items(),
+            [{"promo_id": str(self.promocode.id), "mode": "UNIQUE"}],
+        )
+        self.assertEqual(
+            self.get_items("?fields=promo_unique"),
+            [{"promo_unique": ["code-1", "code-2"]}],
+        )
+
+    def test_all_fields_are_returned_by_default(self) -> None:
+        (item,) = self.get_items()
+
+        self.assertEqual(item["promo_unique"], ["code-1", "code-2"])
+        self.assertTrue(item["active"])
+
+    def test_unknown_fields_are_rejected(self) -> None:
+        response = self.client.get(
+            "/api/business/promo?fields=promo_id,secret",
+            headers=self.headers,
+        )
+
+        self.assertEqual(response.status_code, status.BAD_REQUEST)
+
+    @override_settings(PROMOCODE_LIST_DEFAULT_FIELDS=["promo_id", "promo"])
+    def test_unknown_default_fields_fail_at_startup(self) -> None:
+        with self.assertRaisesMessage(ImproperlyConfigured, "promo"):
+            apps.get_app_config("api_v1_business").ready()
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self) -> None:
+        self.business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {self.business.generate_token()}",
+        }
+
+    def test_endpoints_are_within_query_budget(self) -> None:
+        with self.assertLogs("promocode", "INFO") as logs:
+            response = self.client.post(
+                "/api/business/promo",
+                {
+                    "description": "Promocode within its query budget",
+                    "target": {"categories": ["cats"], "country": "ru"},
+                    "max_count": 1,
+                    "mode": "UNIQUE",
+                    "promo_unique": ["code-1", "code-2", "code-3"],
+                },
+                content_type="application/json",
+                headers=self.headers,
+            )
+            self.assertEqual(response.status_code, status.CREATED)
+            self.assertWithinQueryBudget(response)
+
+            promocode_id = response.json()["id"]
+            for response in (
+                self.client.get("/api/business/promo", headers=self.headers),
+                self.client.get(
+                    f"/api/business/promo/{promocode_id}",
+                    headers=self.headers,
+                ),
+                self.client.patch(
+                    f"/api/business/promo/{promocode_id}",
+                    {"description": "Patched within its query budget"},
+                    content_type="application/json",
+                    headers=self.headers,
+                ),
+            ):
+                self.assertEqual(response.status_code, status.OK)
+                self.assertWithinQueryBudget(response)
+
+        self.assertEqual(
+            [record.levelname for record in logs.records],
+            ["INFO"] * 4,
+        )
+
+    @override_settings(DB_QUERY_BUDGETS={"GET api/business/promo": 0})
+    def test_exceeded_budget_is_logged(self) -> None:
+        with self.assertLogs("promocode", "WARNING") as logs:
+            response = self.client.get(
+                "/api/business/promo",
+                headers=self.headers,
+            )
+
+        self.assertEqual(response.status_code, status.OK)
+        self.assertGreater(int(response.headers[QUERY_COUNT_HEADER]), 0)
+        self.assertIn(QUERY_TIME_HEADER, response.headers)
+        self.assertEqual(logs.records[0].route, "GET api/business/promo")
+        self.assertEqual(logs.records[0].db_query_budget, 0)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+    EXPORT_CHUNK_SIZE=2,
+)
+class ActivationsExportTests(TestCase):
+    ACTIVATIONS = 5
+
+    def setUp(self) -> None:
+        self.business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {self.business.generate_token()}",
+        }
+        self.promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=self.ACTIVATIONS,
+        )
+        self.path = (
+            f"/api/business/promo/{self.promocode.id}/activations/export"
+        )
+
+        for user in create_users(self.ACTIVATIONS):
+            PromocodeActivation.objects.create(
+                promocode=self.promocode,
+                user=user,
+                code="sale-10",
+            )
+
+    def test_csv_export(self) -> None:
+        response = self.client.get(
+            f"{self.path}?format=csv", headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="promocode-{self.promocode.id}'
+            '-activations.csv"',
+        )
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines[0], "timestamp,country,age,code")
+        self.assertEqual(len(lines), self.ACTIVATIONS + 1)
+        self.assertTrue(
+            all(line.endswith(",RU,30,sale-10") for line in lines[1:])
+        )
+
+    def test_ndjson_export_is_the_default(self) -> None:
+        response = self.client.get(self.path, headers=self.headers)
+
+        self.assertEqual(response.status_code, status.OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="promocode-{self.promocode.id}'
+            '-activations.ndjson"',
+        )
+
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        timestamps = [
+            datetime.datetime.fromisoformat(row.pop("timestamp"))
+            for row in rows
+        ]
+
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(
+            rows,
+            [{"country": "RU", "age": 30, "code": "sale-10"}]
+            * self.ACTIVATIONS,
+        )
+
+    def test_invalid_format_is_rejected(self) -> None:
+        response = self.client.get(
+            f"{self.path}?format=xlsx", headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.BAD_REQUEST)
+
+    def test_unknown_and_foreign_promocodes(self) -> None:
+        other_business = Business(
+            name="Other business",
+            email="other@mail.com",
+            password="SuperStrongPassword2000!",
+        )
+        other_business.save()
+        headers = {
+            "Authorization": f"Bearer {other_business.generate_token()}",
+        }
+
+        response = self.client.get(self.path, headers=headers)
+        self.assertEqual(response.status_code, status.FORBIDDEN)
+
+        response = self.client.get(
+            f"/api/business/promo/{uuid.uuid4()}/activations/export",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.NOT_FOUND)
+
+    async def test_asgi_export_is_streamed_in_chunks(self) -> None:
+        response = await self.async_client.get(
+            f"{self.path}?format=csv",
+            headers=self.headers,
+        )
+
+        self.assertEqual(response.status_code, status.OK)
+        self.assertTrue(response.is_async)
+
+        chunks = [chunk async for chunk in response.streaming_content]
+        lines = b"".join(chunks).decode().splitlines()
+
+        # Header with two rows, two rows, the last row
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(lines[0], "timestamp,country,age,code")
+        self.assertEqual(len(lines), self.ACTIVATIONS + 1)
+        self.assertTrue(
+            all(line.endswith(",RU,30,sale-10") for line in lines[1:])
+        )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeTimeseriesTests(TestCase):
+    def setUp(self) -> None:
+        self.business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {self.business.generate_token()}",
+        }
+        self.promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=100,
+        )
+        self.path = f"/api/business/promo/{self.promocode.id}/stat/timeseries"
+
+        for bucket_size, bucket_start, activations_count in (
+            # Compacted into a daily bucket
+            ("DAY", datetime.datetime(2025, 12, 20), 5),
+            ("HOUR", datetime.datetime(2026, 1, 1, 10), 2),
+            ("HOUR", datetime.datetime(2026, 1, 1, 11), 3),
+            ("HOUR", datetime.datetime(2026, 1, 2, 9), 4),
+        ):
+            PromocodeActivationBucket.objects.create(
+                promocode=self.promocode,
+                bucket_size=bucket_size,
+                bucket_start=bucket_start.replace(
+                    tzinfo=datetime.timezone.utc
+                ),
+                activations_count=activations_count,
+            )
+
+    def get_timeseries(self, **params: str) -> tuple[int, dict]:
+        response = self.client.get(self.path, params, headers=self.headers)
+        return response.status_code, response.json()
+
+    def test_hourly_buckets(self) -> None:
+        # Naive values are UTC, the start is rounded down to the hour
+        self.assertEqual(
+            self.get_timeseries(
+                bucket="hour",
+                **{
+                    "from": "2026-01-01T10:30:00",
+                    "to": "2026-01-02T00:00:00Z",
+                },
+            ),
+            (
+                status.OK,
+                {
+                    "bucket": "hour",
+                    "points": [
+                        {
+                            "bucket_start": "2026-01-01T10:00:00Z",
+                            "activations_count": 2,
+                        },
+                        {
+                            "bucket_start": "2026-01-01T11:00:00Z",
+                            "activations_count": 3,
+                        },
+                    ],
+                },
+            ),
+        )
+
+    def test_daily_buckets_merge_hourly_and_compacted_ones(self) -> None:
+        self.assertEqual(
+            self.get_timeseries(
+                **{
+                    "from": "2025-12-01T00:00:00Z",
+                    "to": "2026-01-03T00:00:00Z",
+                },
+            ),
+            (
+                status.OK,
+                {
+                    "bucket": "day",
+                    "points": [
+                        {
+                            "bucket_start": "2025-12-20T00:00:00Z",
+                            "activations_count": 5,
+                        },
+                        {
+                            "bucket_start": "2026-01-01T00:00:00Z",
+                            "activations_count": 5,
+                        },
+                        {
+                            "bucket_start": "2026-01-02T00:00:00Z",
+                            "activations_count": 4,
+                        },
+                    ],
+                },
+            ),
+        )
+
+    def test_invalid_range_is_rejected(self) -> None:
+        for params in (
+            {"from": "2026-01-02T00:00:00Z", "to": "2026-01-01T00:00:00Z"},
+            {
+                "bucket": "hour",
+                "from": "2026-01-01T00:00:00Z",
+                "to": "2026-02-02T00:00:00Z",
+            },
+        ):
+            self.assertEqual(
+                self.get_timeseries(**params)[0], status.BAD_REQUEST
+            )
+
+    def test_unknown_and_foreign_promocodes(self) -> None:
+        other_business = Business(
+            name="Other business",
+            email="other@mail.com",
+            password="SuperStrongPassword2000!",
+        )
+        other_business.save()
+        headers = {
+            "Authorization": f"Bearer {other_business.generate_token()}",
+        }
+
+        response = self.client.get(self.path, headers=headers)
+        self.assertEqual(response.status_code, status.FORBIDDEN)
+
+        response = self.client.get(
+            f"/api/business/promo/{uuid.uuid4()}/stat/timeseries",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.NOT_FOUND)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+    PROMOCODE_BULK_MAX_ITEMS=3,
+    PROMOCODE_BULK_BATCH_SIZE=1,
+)
+class PromocodeBulkCreateEndpointTests(TestCase):
+    VALID = {
+        "description": "Promocode created in bulk",
+        "target": {"categories": ["cats"]},
+        "max_count": 1,
+        "mode": "UNIQUE",
+        "promo_unique": ["code-1", "code-2"],
+    }
+    # Valid for the schema, rejected by the model
+    INVALID = {
+        "description": "Common promocode without a code",
+        "target": {},
+        "max_count": 10,
+        "mode": "COMMON",
+    }
+
+    def setUp(self) -> None:
+        business = create_business()
+        self.headers = {
+            "Authorization": f"Bearer {business.generate_token()}",
+        }
+
+    def bulk_create(self, promocodes: list[dict]) -> tuple[int, dict]:
+        response = self.client.post(
+            "/api/business/promo/bulk",
+            promocodes,
+            content_type="application/json",
+            headers=self.headers,
+        )
+        return response.status_code, response.json()
+
+    def test_valid_items_are_created_with_per_item_errors(self) -> None:
+        status_code, body = self.bulk_create(
+            [self.VALID, self.INVALID, self.VALID]
+        )
+
+        self.assertEqual(status_code, status.CREATED)
+        self.assertEqual(body["created_count"], 2)
+        self.assertEqual(
+            [("id" in item, "errors" in item) for item in body["items"]],
+            [(True, False), (False, True), (True, False)],
+        )
+        self.assertEqual(
+            set(Promocode.objects.values_list("pk", flat=True)),
+            {uuid.UUID(body["items"][i]["id"]) for i in (0, 2)},
+        )
+        self.assertEqual(PromocodeUniqueCode.objects.count(), 4)
+
+    def test_nothing_valid_is_a_bad_request(self) -> None:
+        status_code, body = self.bulk_create([self.INVALID, self.INVALID])
+
+        self.assertEqual(status_code, status.BAD_REQUEST)
+        self.assertEqual([item["index"] for item in body["detail"]], [0, 1])
+        self.assertFalse(Promocode.objects.exists())
+
+    def test_too_many_items_are_rejected(self) -> None:
+        status_code, _ = self.bulk_create([self.VALID] * 4)
+
+        self.assertEqual(status_code, status.BAD_REQUEST)
+        self.assertFalse(Promocode.objects.exists())
+
+    def test_failed_batch_rolls_back_earlier_ones(self) -> None:
+        bulk_create = PromocodeUniqueCode.objects.bulk_create
+        calls = 0
+
+        def fail_second_batch(*args: object, **kwargs: object) -> object:
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise DatabaseError
+            return bulk_create(*args, **kwargs)
+
+        with (
+            mock.patch.object(
+                PromocodeUniqueCode.objects,
+                "bulk_create",
+                side_effect=fail_second_batch,
+            ),
+            self.assertLogs("django.request", "ERROR"),
+        ):
+            status_code, _ = self.bulk_create([self.VALID, self.VALID])
+
+        self.assertEqual(status_code, status.INTERNAL_SERVER_ERROR)
+        self.assertFalse(Promocode.objects.exists())
@@ -1,5 +1,48 @@
+from typing import Any
+
 from api.v1.business import schemas
-from apps.promo.models import Promocode
+from apps.business.models import Business
+from apps.promo.models import Promocode, PromocodeTarget
+
+
+def build_promocode(
+    business: Business,
+    promocode: schemas.CreatePromocodeIn,
+) -> Promocode:
+    promocode = dict(promocode)
+    target = dict(promocode.pop("target"))
+
+    target_obj = PromocodeTarget(**target, country_raw=target["country"])
+    target_obj.validate(
+        include=[
+            PromocodeTarget.age_from.field,
+            PromocodeTarget.age_until.field,
+            PromocodeTarget.country.field,
+            PromocodeTarget.categories.field,
+        ],
+        validate_constraints=False,
+        validate_unique=False,
+    )
+
+    promocode_obj = Promocode(business=business, **promocode)
+    promocode_obj.validate(
+        include=[
+            Promocode.description.field,
+            Promocode.image_url.field,
+            Promocode.max_count.field,
+            Promocode.active_from.field,
+            Promocode.active_until.field,
+            Promocode.mode.field,
+            Promocode.promo_common.field,
+            Promocode.promo_unique.field,
+        ],
+        validate_constraints=False,
+        validate_unique=False,
+    )
+
+    promocode_obj.target = target_obj
+
+    return promocode_obj
 
 
 def map_promocode_to_schema(promocode: Promocode) -> schemas.PromocodeViewOut:
@@ -25,3 +68,61 @@ def map_promocode_to_schema(promocode: Promocode) -> schemas.PromocodeViewOut:
         used_count=promocode.used_count,
         active=promocode.active,
     )
+
+
+# values() column of each PromocodeViewOut field, except the nested target
+PROMOCODE_VIEW_COLUMNS = {
+    "promo_id": "pk",
+    "company_id": "business_id",
+    "description": "description",
+    "image_url": "image_url",
+    "max_count": "max_count",
+    "active_from": "active_from",
+    "active_until": "active_until",
+    "mode": "mode",
+    "promo_common": "promo_common",
+    "promo_unique": "promo_unique",
+    "company_name": "business__name",
+    "like_count": "like_count",
+    "used_count": "used_count",
+    "active": "is_active",
+}
+
+PROMOCODE_TARGET_VIEW_COLUMNS = {
+    "age_from": "target__age_from",
+    "age_until": "target__age_until",
+    "country": "target__country_raw",
+    "categories": "target__categories",
+}
+
+
+def get_promocode_values(fields: list[str]) -> list[str]:
+    values = [
+        PROMOCODE_VIEW_COLUMNS[field] for field in fields if field != "target"
+    ]
+    if "target" in fields:
+        values.extend(PROMOCODE_TARGET_VIEW_COLUMNS.values())
+
+    return values
+
+
+def map_promocode_row(
+    row: dict[str, Any],
+    fields: list[str],
+) -> dict[str, Any]:
+    # Same shape as map_promocode_to_schema trimmed to fields, built from
+    # a values() row of get_promocode_values(fields).
+    promocode = {}
+
+    for field in fields:
+        if field == "target":
+            target = {
+                key: row[column]
+                for key, column in PROMOCODE_TARGET_VIEW_COLUMNS.items()
+            }
+            target["country"] = target["country"] or None
+            promocode[field] = target
+        else:
+            promocode[field] = row[PROMOCODE_VIEW_COLUMNS[field]]
+
+    return promocode
@@ -1,19 +1,24 @@
 import datetime
-from collections import Counter
 from http import HTTPStatus as status
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Count, Q, Value
-from django.db.models.functions import Coalesce
-from django.http import HttpRequest, HttpResponse
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from ninja import Query, Router
 from ninja.errors import AuthenticationError, HttpError
 
 from api.v1 import schemas as global_schemas
-from api.v1.auth import BusinessAuth
+from api.v1.auth import BusinessAuth, business_principals
 from api.v1.business import schemas, utils
+from api.v1.export import stream_rows
+from api.v1.pagination import paginate
+from api.v1.renderers import render_trusted
 from apps.business.models import Business
-from apps.promo.models import Promocode, PromocodeTarget
+from apps.promo.models import Promocode, PromocodeActivationBucket
 
 router = Router(tags=["business"])
 
@@ -66,8 +71,8 @@ def signin(
     if business_obj.password != login_data.password:
         raise AuthenticationError
 
-    business_obj.token_version += 1
-    business_obj.save()
+    business_obj.bump_token_version()
+    business_principals.invalidate(business_obj.id)
 
     return status.OK, schemas.BusinessSignInOut(
         token=business_obj.generate_token(),
@@ -89,46 +94,77 @@ def create_promocode(
 ) -> tuple[int, schemas.CreatePromocodeOut]:
     business = request.auth
 
-    promocode = dict(promocode)
-    target = dict(promocode.pop("target"))
-
-    target_obj = PromocodeTarget(**target, country_raw=target["country"])
-    target_obj.validate(
-        include=[
-            PromocodeTarget.age_from,
-            PromocodeTarget.age_until,
-            PromocodeTarget.country,
-            PromocodeTarget.categories,
-        ],
-        validate_constraints=False,
-        validate_unique=False,
-    )
-
-    promocode_obj = Promocode(business=business, **promocode)
-    promocode_obj.validate(
-        include=[
-            Promocode.description,
-            Promocode.image_url,
-            Promocode.max_count,
-            Promocode.active_from,
-            Promocode.active_until,
-            Promocode.mode,
-            Promocode.promo_common,
-            Promocode.promo_unique,
-        ],
-        validate_constraints=False,
-        validate_unique=False,
-    )
+    promocode_obj = utils.build_promocode(business, promocode)
 
     with transaction.atomic():
-        target_obj.save()
-
-        promocode_obj.target = target_obj
+        promocode_obj.target.save()
         promocode_obj.save()
 
     return status.CREATED, schemas.CreatePromocodeOut(id=promocode_obj.id)
 
 
+@router.post(
+    "/promo/bulk",
+    auth=BusinessAuth(),
+    response={
+        status.CREATED: schemas.BulkCreatePromocodeOut,
+        status.BAD_REQUEST: global_schemas.BadRequestError,
+        status.UNAUTHORIZED: global_schemas.UnauthorizedError,
+    },
+    exclude_none=True,
+)
+def bulk_create_promocode(
+    request: HttpRequest,
+    promocodes: list[schemas.CreatePromocodeIn],
+) -> tuple[
+    int, schemas.BulkCreatePromocodeOut | global_schemas.BadRequestError
+]:
+    business = request.auth
+
+    if len(promocodes) > settings.PROMOCODE_BULK_MAX_ITEMS:
+        raise HttpError(
+            status.BAD_REQUEST,
+            f"At most {settings.PROMOCODE_BULK_MAX_ITEMS} promocodes "
+            "can be created at once",
+        )
+
+    items = []
+    promocode_objs = []
+    for index, promocode in enumerate(promocodes):
+        try:
+            promocode_obj = utils.build_promocode(business, promocode)
+        except ValidationError as e:
+            items.append(
+                schemas.BulkCreatePromocodeItemOut(
+                    index=index,
+                    errors=dict(e) if hasattr(e, "error_dict") else list(e),
+                )
+            )
+            continue
+
+        items.append(
+            schemas.BulkCreatePromocodeItemOut(
+                index=index, id=promocode_obj.id
+            )
+        )
+        promocode_objs.append(promocode_obj)
+
+    if not promocode_objs:
+        return status.BAD_REQUEST, global_schemas.BadRequestError(
+            detail=[item.dict(exclude_none=True) for item in items],
+        )
+
+    Promocode.objects.bulk_create_with_targets(
+        promocode_objs,
+        batch_size=settings.PROMOCODE_BULK_BATCH_SIZE,
+    )
+
+    return status.CREATED, schemas.BulkCreatePromocodeOut(
+        created_count=len(promocode_objs),
+        items=items,
+    )
+
+
 @router.get(
     "/promo",
     auth=BusinessAuth(),
@@ -143,12 +179,10 @@ def list_promocode(
     request: HttpRequest,
     filters: Query[schemas.PromocodeListFilters],
     response: HttpResponse,
-) -> tuple[int, list[schemas.PromocodeViewOut]]:
+) -> HttpResponse:
     business = request.auth
 
-    promocodes = Promocode.objects.select_related("target", "business").filter(
-        business=business
-    )
+    promocodes = Promocode.objects.filter(business=business)
 
     if filters.country__in:
         promocodes = promocodes.filter(
@@ -156,32 +190,49 @@ def list_promocode(
             | Q(target__country__isnull=True)
         )
 
-    response["X-Total-Count"] = promocodes.count()
-
     min_datetime = datetime.date(datetime.MINYEAR, 1, 1)
     max_datetime = datetime.date(datetime.MAXYEAR, 1, 1)
 
     if filters.sort_by == "active_from":
+        ordering = "active_from_sort"
         promocodes = promocodes.annotate(
             active_from_sort=Coalesce("active_from", Value(min_datetime))
-        ).order_by("-active_from_sort")
+        )
     elif filters.sort_by == "active_until":
+        ordering = "active_until_sort"
         promocodes = promocodes.annotate(
             active_until_sort=Coalesce("active_until", Value(max_datetime))
-        ).order_by("-active_until_sort")
+        )
     else:
-        promocodes = promocodes.order_by("-created_at")
+        ordering = "created_at"
 
-    promocodes = promocodes.prefetch_related("activations", "likes").annotate(
-        used_count=Count("activations", distinct=True),
-        like_count=Count("likes", distinct=True),
+    requested_fields = (
+        filters.fields or settings.PROMOCODE_LIST_DEFAULT_FIELDS or None
     )
+    fields = [
+        field
+        for field in schemas.PromocodeViewOut.model_fields
+        if requested_fields is None or field in requested_fields
+    ]
 
-    promocodes = promocodes[filters.offset : filters.offset + filters.limit]
+    if "active" in fields:
+        promocodes = promocodes.with_active()
 
-    return status.OK, [
-        utils.map_promocode_to_schema(promocode) for promocode in promocodes
-    ]
+    promocodes = promocodes.order_by(f"-{ordering}").values(
+        "pk", ordering, *utils.get_promocode_values(fields)
+    )
+
+    promocodes = paginate(promocodes, filters, response, ordering)
+
+    return render_trusted(
+        request,
+        response,
+        [
+            utils.map_promocode_row(promocode, fields)
+            for promocode in promocodes
+        ],
+        exclude_none_values=True,
+    )
 
 
 @router.get(
@@ -204,24 +255,11 @@ def get_promocode(
     if not promocodes.exists():
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
-    promocodes = promocodes.select_related("business").filter(
-        business=business
-    )
+    promocode = promocodes.filter(business=business).for_view().first()
 
-    if not promocodes.exists():
+    if promocode is None:
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    promocodes = (
-        promocodes.select_related("target")
-        .prefetch_related("activations", "likes")
-        .annotate(
-            used_count=Count("activations", distinct=True),
-            like_count=Count("likes", distinct=True),
-        )
-    )
-
-    promocode = promocodes.first()
-
     return status.OK, utils.map_promocode_to_schema(promocode)
 
 
@@ -254,14 +292,7 @@ def patch_promocode(
     if not promocodes.exists():
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    promocodes = (
-        promocodes.select_related("target")
-        .prefetch_related("activations", "likes")
-        .annotate(
-            used_count=Count("activations", distinct=True),
-            like_count=Count("likes", distinct=True),
-        )
-    )
+    promocodes = promocodes.select_related("target")
 
     promocode = promocodes.first()
 
@@ -311,25 +342,23 @@ def promocode_stat(
     if not promocodes.exists():
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    promocodes = promocodes.prefetch_related(
-        "activations", "activations__user"
-    )
-
     promocode = promocodes.first()
 
-    activations = promocode.activations.all()
-    activations_count = activations.count()
-
-    country_activations = Counter(
-        activation.user.country.code
-        for activation in activations
-        if activation.user.country
-    )
-
-    sorted_countries = sorted(country_activations.items(), key=lambda x: x[0])
+    if settings.PROMOCODE_STAT_ROLLUP:
+        sorted_countries = promocode.country_stats.order_by(
+            "country"
+        ).values_list("country", "activations_count")
+    else:
+        sorted_countries = (
+            promocode.activations.exclude(user__country="")
+            .values("user__country")
+            .annotate(activations_count=Count("pk"))
+            .order_by("user__country")
+            .values_list("user__country", "activations_count")
+        )
 
     return status.OK, schemas.PromocodeStats(
-        activations_count=activations_count,
+        activations_count=promocode.used_count,
         countries=[
             schemas.PromocodeStatsForCountry(
                 country=country, activations_count=count
@@ -339,3 +368,124 @@ def promocode_stat(
         if sorted_countries
         else None,
     )
+
+
+@router.get(
+    "/promo/{promocode_id}/activations/export",
+    auth=BusinessAuth(),
+    response={
+        status.BAD_REQUEST: global_schemas.BadRequestError,
+        status.UNAUTHORIZED: global_schemas.UnauthorizedError,
+    },
+)
+def export_activations(
+    request: HttpRequest,
+    promocode_id: str,
+    filters: Query[schemas.ActivationsExportFilters],
+) -> StreamingHttpResponse:
+    business = request.auth
+
+    promocodes = Promocode.objects.filter(id=promocode_id)
+
+    if not promocodes.exists():
+        raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
+
+    promocode = promocodes.filter(business=business).first()
+
+    if promocode is None:
+        raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
+
+    fields = ["timestamp", "country", "age", "code"]
+    rows = (
+        promocode.activations.order_by("timestamp", "pk")
+        .values_list("timestamp", "user__country", "user__age", "code")
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+    return stream_rows(
+        request,
+        fields,
+        rows,
+        filters.format,
+        filename=f"promocode-{promocode.id}-activations",
+    )
+
+
+TIMESERIES_DEFAULT_RANGE = {
+    "hour": datetime.timedelta(hours=24),
+    "day": datetime.timedelta(days=30),
+}
+
+TIMESERIES_MAX_RANGE = {
+    "hour": datetime.timedelta(days=31),
+    "day": datetime.timedelta(days=3660),
+}
+
+
+@router.get(
+    "/promo/{promocode_id}/stat/timeseries",
+    auth=BusinessAuth(),
+    response={
+        status.OK: schemas.PromocodeTimeseries,
+        status.BAD_REQUEST: global_schemas.BadRequestError,
+        status.UNAUTHORIZED: global_schemas.UnauthorizedError,
+    },
+)
+def promocode_stat_timeseries(
+    request: HttpRequest,
+    promocode_id: str,
+    filters: Query[schemas.PromocodeTimeseriesFilters],
+) -> tuple[int, schemas.PromocodeTimeseries]:
+    business = request.auth
+
+    promocodes = Promocode.objects.filter(id=promocode_id)
+
+    if not promocodes.exists():
+        raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
+
+    promocode = promocodes.filter(business=business).first()
+
+    if promocode is None:
+        raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
+
+    until = filters.until or timezone.now()
+    since = filters.since or until - TIMESERIES_DEFAULT_RANGE[filters.bucket]
+    since, until = (
+        timezone.make_aware(value, datetime.timezone.utc)
+        if timezone.is_naive(value)
+        else value
+        for value in (since, until)
+    )
+
+    if not since < until <= since + TIMESERIES_MAX_RANGE[filters.bucket]:
+        raise HttpError(
+            status.BAD_REQUEST,
+            "Range must be positive and at most "
+            f"{TIMESERIES_MAX_RANGE[filters.bucket].days} days",
+        )
+
+    # Hourly buckets only exist for the retention period, older ones are
+    # compacted into daily buckets.
+    since = since.astimezone(datetime.timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+    buckets = promocode.activation_buckets.filter(bucket_start__lt=until)
+
+    if filters.bucket == "hour":
+        points = buckets.filter(
+            bucket_size=PromocodeActivationBucket.SizeChoices.HOUR,
+            bucket_start__gte=since,
+        ).values("bucket_start", "activations_count")
+    else:
+        points = (
+            buckets.filter(bucket_start__gte=since.replace(hour=0))
+            .annotate(day=TruncDay("bucket_start"))
+            .values("day")
+            .annotate(total=Sum("activations_count"))
+            .values(bucket_start=F("day"), activations_count=F("total"))
+        )
+
+    return status.OK, schemas.PromocodeTimeseries(
+        bucket=filters.bucket,
+        points=list(points.order_by("bucket_start")),
+    )
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import date, datetime
+from http import HTTPStatus as status
+from typing import Any
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model, Q, QuerySet
+from django.http import HttpResponse
+from ninja import Schema
+from ninja.errors import HttpError
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(value: date, pk: Any) -> str:
+    payload = json.dumps([value.isoformat(), str(pk)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HttpError(status.BAD_REQUEST, "Invalid cursor") from None
+
+    if not isinstance(value, str) or not isinstance(pk, str):
+        raise HttpError(status.BAD_REQUEST, "Invalid cursor")
+
+    return value, pk
+
+
+def paginate(
+    queryset: QuerySet,
+    filters: Schema,
+    response: HttpResponse,
+    ordering: str,
+) -> list[Model] | list[dict[str, Any]]:
+    """Page a queryset sorted by ``ordering`` in descending order.
+
+    Offset pagination is used by default. Passing ``cursor`` (empty for
+    the first page) switches to keyset pagination on ``(ordering, pk)``
+    and returns the cursor of the next page in a response header.
+    ``values()`` querysets must include ``pk`` and ``ordering``.
+    """
+    if filters.with_total:
+        response[TOTAL_COUNT_HEADER] = queryset.count()
+
+    if filters.cursor is None:
+        return list(queryset[filters.offset : filters.offset + filters.limit])
+
+    queryset = queryset.order_by(f"-{ordering}", "-pk")
+
+    if filters.cursor:
+        value, pk = decode_cursor(filters.cursor)
+        try:
+            queryset = queryset.filter(
+                Q(**{f"{ordering}__lt": value})
+                | Q(**{ordering: value, "pk__lt": pk})
+            )
+        except ValidationError:
+            raise HttpError(status.BAD_REQUEST, "Invalid cursor") from None
+
+    page = list(queryset[: filters.limit + 1])
+
+    if filters.limit and len(page) > filters.limit:
+        last = page[filters.limit - 1]
+        if isinstance(last, dict):
+            value, pk = last[ordering], last["pk"]
+        else:
+            value, pk = getattr(last, ordering), last.pk
+        response[NEXT_CURSOR_HEADER] = encode_cursor(value, pk)
+
+    return page[: filters.limit]
+
+
+def paginate_keys(
+    keys: list[tuple[datetime, uuid.UUID]],
+    filters: Schema,
+    response: HttpResponse,
+) -> list[tuple[datetime, uuid.UUID]]:
+    """Page a list of ``(ordering, pk)`` keys sorted in descending order.
+
+    Same parameters, headers and cursors as ``paginate`` on a queryset
+    sorted by ``(ordering, pk)``.
+    """
+    if filters.with_total:
+        response[TOTAL_COUNT_HEADER] = len(keys)
+
+    if filters.cursor is None:
+        return keys[filters.offset : filters.offset + filters.limit]
+
+    if filters.cursor:
+        value, pk = decode_cursor(filters.cursor)
+        try:
+            cursor = (datetime.fromisoformat(value), uuid.UUID(pk))
+            start = next(
+                (i for i, key in enumerate(keys) if key < cursor),
+                len(keys),
+            )
+        except (ValueError, TypeError):
+            raise HttpError(status.BAD_REQUEST, "Invalid cursor") from None
+    else:
+        start = 0
+
+    page = keys[start : start + filters.limit + 1]
+
+    if filters.limit and len(page) > filters.limit:
+        response[NEXT_CURSOR_HEADER] = encode_cursor(*page[filters.limit - 1])
+
+    return page[: filters.limit]
@@ -0,0 +1,74 @@
+from http import HTTPStatus as status
+from typing import Any
+
+import orjson
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from ninja.renderers import BaseRenderer, JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    # Dates are handed to the stdlib encoder, so their format matches
+    # JSONRenderer byte for byte.
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+    encoder = NinjaJSONEncoder()
+
+    def render(
+        self,
+        request: HttpRequest,
+        data: Any,
+        *,
+        response_status: int,
+    ) -> bytes:
+        return orjson.dumps(
+            data,
+            default=self.encoder.default,
+            option=self.option,
+        )
+
+
+renderer = ORJSONRenderer() if settings.API_ORJSON_RENDERER else JSONRenderer()
+
+
+def exclude_none(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {
+            key: exclude_none(value)
+            for key, value in data.items()
+            if value is not None
+        }
+    if isinstance(data, list):
+        return [exclude_none(value) for value in data]
+    return data
+
+
+def render_trusted(
+    request: HttpRequest,
+    response: HttpResponse,
+    data: Any,
+    *,
+    response_status: int = status.OK,
+    exclude_none_values: bool = False,
+) -> HttpResponse:
+    """Render data built by the view itself into ``response``.
+
+    Response schema validation is skipped, so ``data`` must already have
+    the documented shape. Meant for list endpoints that build plain dicts
+    from ``values()`` instead of model instances and schemas. Headers set
+    on ``response`` (e.g. by pagination) are kept.
+    """
+    if exclude_none_values:
+        data = exclude_none(data)
+
+    response.content = renderer.render(
+        request, data, response_status=response_status
+    )
+    response.status_code = response_status
+    response["Content-Type"] = (
+        f"{renderer.media_type}; charset={renderer.charset}"
+    )
+
+    return response
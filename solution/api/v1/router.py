@@ -2,7 +2,7 @@ from functools import partial
 
 from ninja import NinjaAPI
 
-from api.v1 import handlers
+from api.v1 import handlers, renderers
 from api.v1.business.views import router as business_router
 from api.v1.ping.views import router as ping_router
 from api.v1.user.views import router as user_router
@@ -12,6 +12,7 @@ router = NinjaAPI(
     version="1",
     description="API docs for Promocode",
     openapi_url="/docs/openapi.json",
+    renderer=renderers.renderer,
     # csrf=True, noqa: ERA001
 )
 
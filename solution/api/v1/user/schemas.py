@@ -77,6 +77,10 @@ class PromocodeFeedFilters(Schema):
     offset: int = Field(
         0, ge=0, description="Offset must be greater than or equal to 0"
     )
+    cursor: str | None = Field(
+        None, description="Keyset pagination cursor, empty for first page"
+    )
+    with_total: bool = True
     category: str | None = None
     active: bool | None = None
 
@@ -109,6 +113,10 @@ class PromocodeCommentsFilters(Schema):
     offset: int = Field(
         0, ge=0, description="Offset must be greater than or equal to 0"
     )
+    cursor: str | None = Field(
+        None, description="Keyset pagination cursor, empty for first page"
+    )
+    with_total: bool = True
 
 
 class CommentIn(ModelSchema):
@@ -145,3 +153,7 @@ class ActivationsHistoryFilters(Schema):
     offset: int = Field(
         0, ge=0, description="Offset must be greater than or equal to 0"
     )
+    cursor: str | None = Field(
+        None, description="Keyset pagination cursor, empty for first page"
+    )
+    with_total: bool = True
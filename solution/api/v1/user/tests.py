@@ -0,0 +1,458 @@
+import contextlib
+import uuid
+from collections.abc import Iterator
+from http import HTTPStatus as status
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.v1.auth import PrincipalCache
+from apps.promo.models import (
+    Promocode,
+    PromocodeActivation,
+    PromocodeLike,
+    PromocodeTargetCategory,
+)
+from apps.promo.targeting import targeting_index
+from apps.promo.tests import (
+    create_business,
+    create_promocode,
+    create_targeted_promocode,
+    create_users,
+)
+from apps.user.models import User
+from config.integrations.antifraud.interactor import AntifraudServiceInteractor
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+    FEED_SEGMENT_CACHE=True,
+)
+class FeedSegmentCacheTests(TestCase):
+    def setUp(self) -> None:
+        targeting_index.reset()
+
+        self.business = create_business()
+        self.user, self.other_user = create_users(2)
+        self.headers = {
+            "Authorization": f"Bearer {self.user.generate_token()}",
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocodes = [
+                create_promocode(
+                    self.business,
+                    mode=Promocode.ModeChoices.COMMON,
+                    promo_common="sale-10",
+                    max_count=1,
+                )
+                for _ in range(3)
+            ]
+
+    def get_feed(self, query: str = "") -> list[dict]:
+        response = self.client.get(
+            f"/api/user/feed{query}", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.OK)
+        return response.json()
+
+    def test_cached_segment_overlays_user_flags(self) -> None:
+        self.get_feed()
+
+        PromocodeLike(promocode=self.promocodes[0], user=self.user).save()
+
+        # The page, then its likes and activations
+        with self.assertNumQueries(3):
+            feed = self.get_feed()
+
+        liked = {row["promo_id"]: row["is_liked_by_user"] for row in feed}
+        self.assertEqual(len(liked), 3)
+        self.assertTrue(liked[str(self.promocodes[0].id)])
+        self.assertEqual(sum(liked.values()), 1)
+
+    def test_segment_invalidated_by_create_and_exhaustion(self) -> None:
+        self.assertEqual(len(self.get_feed("?active=true")), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_promocode(
+                self.business,
+                mode=Promocode.ModeChoices.COMMON,
+                promo_common="sale-20",
+                max_count=5,
+            )
+
+        self.assertEqual(len(self.get_feed("?active=true")), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocodes[0].activate_promocode(self.other_user)
+
+        feed = self.get_feed("?active=true")
+        self.assertEqual(len(feed), 3)
+        self.assertNotIn(
+            str(self.promocodes[0].id),
+            [row["promo_id"] for row in feed],
+        )
+
+    def test_segment_invalidated_by_cascade_deletion(self) -> None:
+        self.assertEqual(len(self.get_feed()), 3)
+
+        # Cascades don't go through Promocode.delete, the first page
+        # without the row records its deletion
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocodes[0].target.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(self.get_feed()), 2)
+
+        response = self.client.get("/api/user/feed", headers=self.headers)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(response.headers["X-Total-Count"], "2")
+
+    @override_settings(USER_FLAGS_CACHE=True)
+    def test_user_flags_cache_is_invalidated_by_like(self) -> None:
+        self.get_feed()
+
+        with self.assertNumQueries(1):
+            self.get_feed()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PromocodeLike(promocode=self.promocodes[1], user=self.user).save()
+
+        liked = [row["is_liked_by_user"] for row in self.get_feed()]
+        self.assertEqual(liked.count(True), 1)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class FeedCategoryFilterTests(TestCase):
+    def setUp(self) -> None:
+        targeting_index.reset()
+
+        self.business = create_business()
+        (self.user,) = create_users(1)
+        self.headers = {
+            "Authorization": f"Bearer {self.user.generate_token()}",
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pets = create_targeted_promocode(
+                self.business, {"categories": ["Cats", "dogs"]}
+            )
+            self.birds = create_targeted_promocode(
+                self.business, {"categories": ["BIRDS"]}
+            )
+
+    def get_feed_ids(self, category: str) -> list[str]:
+        response = self.client.get(
+            f"/api/user/feed?category={category}", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.OK)
+
+        return [row["promo_id"] for row in response.json()]
+
+    def test_category_filter_is_case_insensitive(self) -> None:
+        self.assertCountEqual(
+            PromocodeTargetCategory.objects.filter(
+                target=self.pets.target
+            ).values_list("name", flat=True),
+            ["cats", "dogs"],
+        )
+
+        for category in ("cats", "CATS", "Dogs"):
+            self.assertEqual(self.get_feed_ids(category), [str(self.pets.id)])
+        self.assertEqual(self.get_feed_ids("birds"), [str(self.birds.id)])
+        self.assertEqual(self.get_feed_ids("fish"), [])
+
+    def test_patched_categories_are_reindexed(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/business/promo/{self.pets.id}",
+                {"target": {"categories": ["Fish"]}},
+                content_type="application/json",
+                headers={
+                    "Authorization": (
+                        f"Bearer {self.business.generate_token()}"
+                    ),
+                },
+            )
+        self.assertEqual(response.status_code, status.OK)
+
+        self.assertEqual(
+            list(
+                PromocodeTargetCategory.objects.filter(
+                    target=self.pets.target
+                ).values_list("name", flat=True)
+            ),
+            ["fish"],
+        )
+        self.assertEqual(self.get_feed_ids("cats"), [])
+        self.assertEqual(self.get_feed_ids("FISH"), [str(self.pets.id)])
+
+
+@override_settings(TARGETING_INDEX=False)
+class QuerysetFeedCategoryFilterTests(FeedCategoryFilterTests):
+    # The same filter through the side table join instead of the index
+    pass
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class AsyncPromocodeViewsTests(TestCase):
+    def setUp(self) -> None:
+        targeting_index.reset()
+
+        self.user = create_users(1)[0]
+        self.headers = {
+            "Authorization": f"Bearer {self.user.generate_token()}",
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocode = create_promocode(
+                create_business(),
+                mode=Promocode.ModeChoices.COMMON,
+                promo_common="sale-10",
+                max_count=5,
+            )
+
+        self.promocode_url = f"/api/user/promo/{self.promocode.id}"
+
+    def activate(self, verdict: dict[str, bool]) -> tuple[int, dict]:
+        with mock.patch.object(
+            AntifraudServiceInteractor,
+            "avalidate",
+            new=mock.AsyncMock(return_value=verdict),
+        ) as avalidate:
+            response = self.client.post(
+                f"{self.promocode_url}/activate", headers=self.headers
+            )
+
+        avalidate.assert_awaited_once_with(
+            user_email=self.user.email, promo_id=str(self.promocode.id)
+        )
+
+        return response.status_code, response.json()
+
+    def test_activation_follows_antifraud_verdict(self) -> None:
+        self.assertEqual(self.activate({"ok": False})[0], status.FORBIDDEN)
+        self.assertFalse(PromocodeActivation.objects.exists())
+
+        self.assertEqual(
+            self.activate({"ok": True}),
+            (status.OK, {"promo": "sale-10"}),
+        )
+        self.assertTrue(
+            PromocodeActivation.objects.filter(
+                promocode=self.promocode, user=self.user
+            ).exists()
+        )
+
+    def test_like_toggles_detail_flags(self) -> None:
+        for _ in range(2):
+            response = self.client.post(
+                f"{self.promocode_url}/like", headers=self.headers
+            )
+            self.assertEqual(response.status_code, status.OK)
+
+        promocode = self.client.get(
+            self.promocode_url, headers=self.headers
+        ).json()
+        self.assertTrue(promocode["is_liked_by_user"])
+        self.assertEqual(promocode["like_count"], 1)
+
+        response = self.client.delete(
+            f"{self.promocode_url}/like", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.OK)
+
+        promocode = self.client.get(
+            self.promocode_url, headers=self.headers
+        ).json()
+        self.assertFalse(promocode["is_liked_by_user"])
+        self.assertEqual(promocode["like_count"], 0)
+
+    def test_unknown_promocode_is_not_found(self) -> None:
+        url = f"/api/user/promo/{uuid.uuid4()}"
+
+        for method, path in (
+            ("get", url),
+            ("post", f"{url}/like"),
+            ("delete", f"{url}/like"),
+            ("post", f"{url}/activate"),
+        ):
+            response = getattr(self.client, method)(path, headers=self.headers)
+            self.assertEqual(response.status_code, status.NOT_FOUND)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PrincipalCacheTests(TestCase):
+    def setUp(self) -> None:
+        (self.user,) = create_users(1)
+        # Shared tier only, the local copy outlives invalidations on purpose
+        self.principals = PrincipalCache(
+            User,
+            local_ttl=0,
+            shared_ttl=300,
+            max_size=0,
+            exclude=("password",),
+        )
+
+    def rename(self, name: str) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(name=name)
+            self.principals.invalidate(self.user.pk)
+
+    def test_invalidation_drops_cached_values(self) -> None:
+        self.assertEqual(self.principals.get(self.user.pk).name, "Steve")
+
+        self.rename("Bob")
+
+        self.assertEqual(self.principals.get(self.user.pk).name, "Bob")
+
+    def test_row_read_before_invalidation_is_not_served(self) -> None:
+        load_values = self.principals._load_values  # noqa: SLF001
+
+        def load_then_rename(pk: uuid.UUID) -> tuple[object, ...] | None:
+            # A write commits between the read and the cache fill
+            values = load_values(pk)
+            self.rename("Bob")
+            return values
+
+        with mock.patch.object(
+            self.principals, "_load_values", side_effect=load_then_rename
+        ):
+            self.assertEqual(self.principals.get(self.user.pk).name, "Steve")
+
+        self.assertEqual(self.principals.get(self.user.pk).name, "Bob")
+
+    def test_sign_in_revokes_previous_token(self) -> None:
+        old_headers = {"Authorization": f"Bearer {self.user.generate_token()}"}
+        response = self.client.get("/api/user/profile", headers=old_headers)
+        self.assertEqual(response.status_code, status.OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/user/auth/sign-in",
+                {
+                    "email": self.user.email,
+                    "password": "WhoLiveSInCalifornia2000!",
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.OK)
+        new_headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        response = self.client.get("/api/user/profile", headers=old_headers)
+        self.assertEqual(response.status_code, status.UNAUTHORIZED)
+        response = self.client.get("/api/user/profile", headers=new_headers)
+        self.assertEqual(response.status_code, status.OK)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PrincipalCacheWorkersTests(TestCase):
+    def setUp(self) -> None:
+        (self.user,) = create_users(1)
+        self.headers = {
+            "Authorization": f"Bearer {self.user.generate_token()}"
+        }
+
+        # Two worker processes sharing the cache, each with a local copy
+        # that would outlive the test
+        self.workers = [
+            PrincipalCache(
+                User,
+                local_ttl=60,
+                shared_ttl=300,
+                max_size=100,
+                exclude=("password",),
+            )
+            for _ in range(2)
+        ]
+
+    @contextlib.contextmanager
+    def served_by(self, worker: PrincipalCache) -> Iterator[None]:
+        with (
+            mock.patch("api.v1.auth.user_principals", worker),
+            mock.patch("api.v1.user.views.user_principals", worker),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            yield
+
+    def get_profile(self, worker: PrincipalCache, headers: dict) -> object:
+        with self.served_by(worker):
+            return self.client.get("/api/user/profile", headers=headers)
+
+    def test_sign_in_is_seen_by_other_workers(self) -> None:
+        for worker in self.workers:
+            response = self.get_profile(worker, self.headers)
+            self.assertEqual(response.status_code, status.OK)
+
+        with self.served_by(self.workers[0]):
+            response = self.client.post(
+                "/api/user/auth/sign-in",
+                {
+                    "email": self.user.email,
+                    "password": "WhoLiveSInCalifornia2000!",
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.OK)
+        new_headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        response = self.get_profile(self.workers[1], new_headers)
+        self.assertEqual(response.status_code, status.OK)
+        response = self.get_profile(self.workers[1], self.headers)
+        self.assertEqual(response.status_code, status.UNAUTHORIZED)
+
+    def test_profile_patch_is_seen_by_other_workers(self) -> None:
+        response = self.get_profile(self.workers[1], self.headers)
+        self.assertEqual(response.json()["name"], "Steve")
+
+        with self.served_by(self.workers[0]):
+            response = self.client.patch(
+                "/api/user/profile",
+                {"name": "Bob"},
+                content_type="application/json",
+                headers=self.headers,
+            )
+        self.assertEqual(response.status_code, status.OK)
+
+        response = self.get_profile(self.workers[1], self.headers)
+        self.assertEqual(response.json()["name"], "Bob")
+
+    def test_local_entry_is_served_while_current(self) -> None:
+        self.workers[1].get(self.user.pk)
+
+        with mock.patch.object(self.workers[1], "_load_values") as load_values:
+            cache_get = mock.Mock(wraps=cache.get)
+            with mock.patch("api.v1.auth.cache.get", cache_get):
+                self.assertEqual(self.workers[1].get(self.user.pk), self.user)
+
+        load_values.assert_not_called()
+        # Only the generation is read
+        self.assertEqual(cache_get.call_count, 1)
@@ -1,3 +1,5 @@
+from typing import Any
+
 from api.v1.user import schemas
 from apps.promo.models import Promocode, PromocodeComment
 from apps.user.models import User
@@ -31,6 +33,36 @@ def map_promocode_to_schema(promocode: Promocode) -> schemas.PromocodeViewOut:
     )
 
 
+PROMOCODE_VIEW_VALUES = (
+    "pk",
+    "created_at",
+    "business_id",
+    "business__name",
+    "description",
+    "image_url",
+    "is_active",
+    "like_count",
+    "comment_count",
+)
+
+
+def map_promocode_row(row: dict[str, Any]) -> dict[str, Any]:
+    # Same shape as map_promocode_to_schema, built from a values() row
+    # of PROMOCODE_VIEW_VALUES with the per-user flags added.
+    return {
+        "promo_id": row["pk"],
+        "company_id": row["business_id"],
+        "company_name": row["business__name"],
+        "description": row["description"],
+        "image_url": row["image_url"],
+        "active": row["is_active"],
+        "is_activated_by_user": row["is_activated_by_user"],
+        "is_liked_by_user": row["is_liked_by_user"],
+        "like_count": row["like_count"],
+        "comment_count": row["comment_count"],
+    }
+
+
 def map_comment_to_schema(comment: PromocodeComment) -> schemas.CommentOut:
     return schemas.CommentOut(
         id=comment.id,
@@ -1,20 +1,29 @@
 import contextlib
+import functools
 from http import HTTPStatus as status
 
-from django.db.models import Count, Exists, OuterRef, Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from django.http import HttpRequest, HttpResponse
 from ninja import Query, Router
 from ninja.errors import AuthenticationError, HttpError
 
 from api.v1 import schemas as global_schemas
-from api.v1.auth import UserAuth
+from api.v1.auth import UserAuth, user_principals
+from api.v1.pagination import paginate, paginate_keys
+from api.v1.renderers import render_trusted
 from api.v1.user import schemas, utils
+from apps.promo.feed import feed_segments, get_queryset_keys
 from apps.promo.models import (
     Promocode,
     PromocodeActivation,
     PromocodeComment,
     PromocodeLike,
+    get_current_date,
+    get_user_flags,
 )
+from apps.promo.targeting import targeting_index
 from apps.user.models import User
 from config.errors import ConflictError
 from config.integrations.antifraud.interactor import AntifraudServiceInteractor
@@ -73,8 +82,8 @@ def signin(
     if user_obj.password != login_data.password:
         raise AuthenticationError
 
-    user_obj.token_version += 1
-    user_obj.save()
+    user_obj.bump_token_version()
+    user_principals.invalidate(user_obj.id)
 
     return status.OK, schemas.UserSignInOut(
         token=user_obj.generate_token(),
@@ -116,6 +125,7 @@ def patch_profile(
         setattr(user, field, value)
 
     user.save()
+    user_principals.invalidate(user.id)
 
     return status.OK, utils.map_user_to_schema(user)
 
@@ -130,63 +140,88 @@ def patch_profile(
     },
     exclude_none=True,
 )
-def feed(
+async def feed(
     request: HttpRequest,
     filters: Query[schemas.PromocodeFeedFilters],
     response: HttpResponse,
-) -> tuple[status.OK, list[schemas.PromocodeViewOut]]:
+) -> HttpResponse:
     user: User = request.auth
 
-    promocodes = Promocode.objects.select_related("target")
+    promocodes = Promocode.objects.for_audience(user.age, user.country)
 
-    promocodes = promocodes.filter(
-        Q(
-            Q(target__age_from__isnull=True)
-            | Q(target__age_from__lte=user.age),
-            Q(target__age_until__isnull=True)
-            | Q(target__age_until__gte=user.age),
-            Q(target__country__isnull=True) | Q(target__country=user.country),
+    if filters.category:
+        promocodes = promocodes.filter(
+            target__category_index__name=filters.category.lower()
         )
-    )
-
-    promocodes = promocodes.prefetch_related("likes", "comments").annotate(
-        like_count=Count("likes", distinct=True),
-        comment_count=Count("comments", distinct=True),
-        is_liked_by_user=Exists(
-            PromocodeLike.objects.filter(promocode=OuterRef("pk"), user=user)
-        ),
-        is_activated_by_user=Exists(
-            PromocodeActivation.objects.filter(
-                promocode=OuterRef("pk"), user=user
-            )
-        ),
-    )
 
-    promocodes = promocodes.order_by("-created_at")
+    promocodes = promocodes.with_active()
 
-    promocodes = promocodes.all()
+    if filters.active is not None:
+        promocodes = promocodes.filter(is_active=filters.active)
+
+    current_date = get_current_date()
+    segment = (
+        user.age,
+        user.country.code,
+        filters.category.lower() if filters.category else None,
+        filters.active,
+    )
 
-    if filters.category:
-        category_lower = filters.category.lower()
+    if settings.TARGETING_INDEX:
+        load_keys = functools.partial(
+            targeting_index.get_feed_keys, current_date, *segment
+        )
+    else:
+        load_keys = functools.partial(get_queryset_keys, promocodes)
 
-        def matches_category(promocode: Promocode) -> bool:
-            categories = promocode.target.categories or []
-            return any(
-                category.lower() == category_lower for category in categories
+    keys = None
+    if settings.FEED_SEGMENT_CACHE:
+        keys = await sync_to_async(feed_segments.get)(
+            load_keys, current_date, *segment
+        )
+    elif settings.TARGETING_INDEX:
+        keys = await sync_to_async(load_keys)()
+
+    if keys is not None:
+        # Counters and active flag overlaid on the cached page
+        page = paginate_keys(keys, filters, response)
+        rows = {
+            row["pk"]: row
+            async for row in Promocode.objects.filter(
+                pk__in=[pk for _, pk in page]
             )
+            .with_active()
+            .values(*utils.PROMOCODE_VIEW_VALUES)
+        }
+        promocodes = [rows[pk] for _, pk in page if pk in rows]
+
+        if len(promocodes) < len(page):
+            # Deleted by a cascade, which doesn't record the deletion
+            await sync_to_async(feed_segments.invalidate)(
+                pk for _, pk in page if pk not in rows
+            )
+    else:
+        promocodes = promocodes.order_by("-created_at").values(
+            *utils.PROMOCODE_VIEW_VALUES
+        )
 
-        promocodes = [p for p in promocodes if matches_category(p)]
-
-    if filters.active is not None:
-        promocodes = [p for p in promocodes if p.active == filters.active]
-
-    response["X-Total-Count"] = len(promocodes)
-
-    promocodes = promocodes[filters.offset : filters.offset + filters.limit]
+        promocodes = await sync_to_async(paginate)(
+            promocodes, filters, response, "created_at"
+        )
 
-    return status.OK, [
-        utils.map_promocode_to_schema(promocode) for promocode in promocodes
-    ]
+    liked, activated = await sync_to_async(get_user_flags)(
+        user, [promocode["pk"] for promocode in promocodes]
+    )
+    for promocode in promocodes:
+        promocode["is_liked_by_user"] = promocode["pk"] in liked
+        promocode["is_activated_by_user"] = promocode["pk"] in activated
+
+    return render_trusted(
+        request,
+        response,
+        [utils.map_promocode_row(promocode) for promocode in promocodes],
+        exclude_none_values=True,
+    )
 
 
 @router.get(
@@ -208,32 +243,30 @@ def get_activations_history(
     activations = (
         PromocodeActivation.objects.filter(user=user)
         .select_related("promocode", "promocode__business")
-        .prefetch_related("promocode__likes", "promocode__comments")
         .annotate(
-            like_count=Count("promocode__likes", distinct=True),
-            comment_count=Count("promocode__comments", distinct=True),
-            is_liked_by_user=Exists(
-                PromocodeLike.objects.filter(
-                    promocode=OuterRef("promocode"), user=user
-                )
+            is_active=Subquery(
+                Promocode.objects.with_active()
+                .filter(pk=OuterRef("promocode"))
+                .values("is_active")
             ),
         )
         .order_by("-timestamp")
     )
 
+    activations = paginate(activations, filters, response, "timestamp")
+
+    liked, _ = get_user_flags(
+        user, [activation.promocode_id for activation in activations]
+    )
+
     promocodes = []
     for activation in activations:
         promocode = activation.promocode
-        promocode.like_count = activation.like_count
-        promocode.comment_count = activation.comment_count
-        promocode.is_liked_by_user = activation.is_liked_by_user
+        promocode.is_liked_by_user = promocode.pk in liked
         promocode.is_activated_by_user = True
+        promocode.is_active = activation.is_active
         promocodes.append(utils.map_promocode_to_schema(promocode))
 
-    response["X-Total-Count"] = len(promocodes)
-
-    promocodes = promocodes[filters.offset : filters.offset + filters.limit]
-
     return status.OK, promocodes
 
 
@@ -247,36 +280,23 @@ def get_activations_history(
     },
     exclude_none=True,
 )
-def get_promocode(
+async def get_promocode(
     request: HttpRequest, promocode_id: str
 ) -> tuple[status.OK, schemas.PromocodeViewOut]:
     user: User = request.auth
 
-    promocodes = Promocode.objects.filter(id=promocode_id)
+    promocode = (
+        await Promocode.objects.filter(id=promocode_id).for_view().afirst()
+    )
 
-    if not promocodes.exists():
+    if promocode is None:
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
-    promocodes = (
-        promocodes.select_related("business")
-        .prefetch_related("likes", "comments")
-        .annotate(
-            like_count=Count("likes", distinct=True),
-            comment_count=Count("comments", distinct=True),
-            is_liked_by_user=Exists(
-                PromocodeLike.objects.filter(
-                    promocode=OuterRef("pk"), user=user
-                )
-            ),
-            is_activated_by_user=Exists(
-                PromocodeActivation.objects.filter(
-                    promocode=OuterRef("pk"), user=user
-                )
-            ),
-        )
+    liked, activated = await sync_to_async(get_user_flags)(
+        user, [promocode.pk]
     )
-
-    promocode = promocodes.first()
+    promocode.is_liked_by_user = promocode.pk in liked
+    promocode.is_activated_by_user = promocode.pk in activated
 
     return status.OK, utils.map_promocode_to_schema(promocode)
 
@@ -291,18 +311,18 @@ def get_promocode(
     },
     exclude_none=True,
 )
-def add_like(
+async def add_like(
     request: HttpRequest, promocode_id: str
 ) -> tuple[status.OK, schemas.PromocodeLikeOut]:
     user: User = request.auth
 
-    promocodes = Promocode.objects.filter(id=promocode_id)
+    promocode = await Promocode.objects.filter(id=promocode_id).afirst()
 
-    if not promocodes.exists():
+    if promocode is None:
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
     with contextlib.suppress(ConflictError):
-        PromocodeLike.objects.create(promocode=promocodes.first(), user=user)
+        await PromocodeLike.objects.acreate(promocode=promocode, user=user)
 
     return status.OK, schemas.PromocodeLikeOut()
 
@@ -317,20 +337,19 @@ def add_like(
     },
     exclude_none=True,
 )
-def delete_like(
+async def delete_like(
     request: HttpRequest, promocode_id: str
 ) -> tuple[status.OK, schemas.PromocodeRemoveLikeOut]:
     user: User = request.auth
 
-    promocodes = Promocode.objects.filter(id=promocode_id)
+    promocode = await Promocode.objects.filter(id=promocode_id).afirst()
 
-    if not promocodes.exists():
+    if promocode is None:
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
     with contextlib.suppress(PromocodeLike.DoesNotExist):
-        PromocodeLike.objects.get(
-            promocode=promocodes.first(), user=user
-        ).delete()
+        like = await PromocodeLike.objects.aget(promocode=promocode, user=user)
+        await like.adelete()
 
     return status.OK, schemas.PromocodeRemoveLikeOut()
 
@@ -384,13 +403,13 @@ def list_comments(
     if not promocodes.exists():
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
-    promocodes = promocodes.prefetch_related("comments", "comments__author")
-
-    comments = promocodes.first().comments.order_by("-date").all()
-
-    response["X-Total-Count"] = len(comments)
+    comments = (
+        PromocodeComment.objects.filter(promocode_id=promocode_id)
+        .select_related("author")
+        .order_by("-date")
+    )
 
-    comments = comments[filters.offset : filters.offset + filters.limit]
+    comments = paginate(comments, filters, response, "date")
 
     return status.OK, [
         utils.map_comment_to_schema(comment) for comment in comments
@@ -507,7 +526,7 @@ def delete_comment(
         status.UNAUTHORIZED: global_schemas.UnauthorizedError,
     },
 )
-def activate_promocode(
+async def activate_promocode(
     request: HttpRequest,
     promocode_id: str,
 ) -> tuple[int, schemas.PromocodeActivateOut]:
@@ -515,34 +534,41 @@ def activate_promocode(
 
     promocodes = Promocode.objects.filter(id=promocode_id)
 
-    if not promocodes.exists():
+    if not await promocodes.aexists():
         raise HttpError(status.NOT_FOUND, status.NOT_FOUND.phrase)
 
-    promocodes = promocodes.select_related("target").filter(
-        Q(
-            Q(target__age_from__isnull=True)
-            | Q(target__age_from__lte=user.age),
-            Q(target__age_until__isnull=True)
-            | Q(target__age_until__gte=user.age),
-            Q(target__country__isnull=True) | Q(target__country=user.country),
+    can_see = None
+    if settings.TARGETING_INDEX:
+        can_see = await sync_to_async(targeting_index.can_see)(
+            promocode_id, user.age, user.country.code
         )
-    )
+    if can_see is None:
+        can_see = await promocodes.for_audience(
+            user.age, user.country
+        ).aexists()
 
-    if not promocodes.exists():
+    if not can_see:
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    promocode = promocodes.first()
+    promocodes = promocodes.select_related("target")
+
+    promocode = await promocodes.with_active().afirst()
 
     if not promocode.active:
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    antifraud_result = AntifraudServiceInteractor().validate(
+    # Other requests of the worker are served while the service responds
+    antifraud_result = await AntifraudServiceInteractor().avalidate(
         user_email=user.email, promo_id=str(promocode.id)
     )
 
     if not antifraud_result["ok"]:
         raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
-    promo = promocode.activate_promocode(user)
+    # Async ORM has no transactions, the activation runs in a thread
+    promo = await sync_to_async(promocode.activate_promocode)(user)
+
+    if promo is None:
+        raise HttpError(status.FORBIDDEN, status.FORBIDDEN.phrase)
 
     return status.OK, schemas.PromocodeActivateOut(promo=promo)
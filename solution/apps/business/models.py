@@ -6,10 +6,10 @@ from django.core.validators import MinLengthValidator, RegexValidator
 from django.db import models
 from django.utils import timezone
 
-from apps.core.models import BaseModel
+from apps.core.models import BaseModel, TokenVersionMixin
 
 
-class Business(BaseModel):
+class Business(TokenVersionMixin, BaseModel):
     name = models.CharField(max_length=50, validators=[MinLengthValidator(5)])
     email = models.EmailField(
         unique=True,
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http import HTTPStatus as status
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, ClassVar
+from unittest import mock
+
+import httpx
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+from apps.business.models import Business
+from apps.promo.models import Promocode, PromocodeTarget
+from apps.user.models import User
+from config.integrations.antifraud.client import AsyncAntifraudClient
+from config.integrations.antifraud.interactor import AntifraudServiceInteractor
+
+BASE_URL = "http://localhost"
+
+
+class FakeAntifraudHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    delay = 0.0
+    verdict: ClassVar[dict[str, bool]] = {"ok": True}
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(self.verdict).encode()
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        self.send_response(status.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class RejectingAntifraudHandler(FakeAntifraudHandler):
+    # Activations end right after the verdict, nothing is written. The
+    # verdict has no cache_until, so every activation asks the service.
+    verdict: ClassVar[dict[str, bool]] = {"ok": False}
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+@transaction.atomic
+def seed(users: int) -> tuple[Business, Promocode, list[User]]:
+    business = Business.objects.create(
+        name="Benchmark",
+        email="benchmark@mail.com",
+        password="SeedPassword2000!",  # noqa: S106
+    )
+    promocode = Promocode(
+        business=business,
+        target=PromocodeTarget(),
+        description="Benchmark promocode",
+        mode=Promocode.ModeChoices.COMMON,
+        promo_common="benchmark",
+        max_count=users,
+    )
+    Promocode.objects.bulk_create_with_targets([promocode], batch_size=1)
+
+    user_objs = User.objects.bulk_create(
+        User(
+            name="Benchmark",
+            surname=f"User {i}",
+            email=f"benchmark-{i}@mail.com",
+            age=30,
+            country="ru",
+            country_raw="ru",
+            password="SeedPassword2000!",  # noqa: S106
+        )
+        for i in range(users)
+    )
+
+    return business, promocode, user_objs
+
+
+def unseed(
+    business: Business, promocode: Promocode, users: list[User]
+) -> None:
+    PromocodeTarget.objects.filter(pk=promocode.target_id).delete()
+    business.delete()
+    User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare /user/promo/{id}/activate latency with a per-request "
+        "antifraud client and the pooled client, against a local fake "
+        "antifraud service. Requests are sent one at a time to the ASGI "
+        "application."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        server = Server(("127.0.0.1", 0), RejectingAntifraudHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        endpoint = AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT
+        AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT = (
+            f"http://127.0.0.1:{server.server_port}/api/validate"
+        )
+
+        # Requests are served on other threads, so the rows are committed
+        # and deleted afterwards instead of rolled back.
+        business, promocode, users = seed(options["requests"])
+        path = f"/api/user/promo/{promocode.pk}/activate"
+        tokens = [user.generate_token() for user in users]
+
+        try:
+            for name, per_request in (
+                ("per-request client", True),
+                ("pooled client", False),
+            ):
+                timings = asyncio.run(self.measure(path, tokens, per_request))
+                self.report(name, timings)
+        finally:
+            AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT = endpoint
+            server.shutdown()
+            unseed(business, promocode, users)
+
+    async def measure(
+        self,
+        path: str,
+        tokens: list[str],
+        per_request: bool,
+    ) -> list[float]:
+        transport = httpx.ASGITransport(app=get_asgi_application())
+        clients = []
+
+        async def create_client() -> httpx.AsyncClient:
+            client = httpx.AsyncClient(timeout=5)
+            clients.append(client)
+            return client
+
+        async def activate(client: httpx.AsyncClient, token: str) -> None:
+            response = await client.post(
+                path, headers={"Authorization": f"Bearer {token}"}
+            )
+
+            # Closed like a client opened for the request would be
+            while clients:
+                await clients.pop().aclose()
+
+            if response.status_code != status.FORBIDDEN:
+                self.stderr.write(
+                    f"Unexpected response {response.status_code}: "
+                    f"{response.text[:200]}"
+                )
+
+        with mock.patch.object(
+            AsyncAntifraudClient,
+            "get",
+            create_client if per_request else AsyncAntifraudClient.get,
+        ):
+            async with httpx.AsyncClient(
+                transport=transport, base_url=BASE_URL
+            ) as client:
+                await activate(client, tokens[0])
+
+                timings = []
+                for token in tokens:
+                    start_time = time.perf_counter()
+                    await activate(client, token)
+                    timings.append((time.perf_counter() - start_time) * 1000)
+
+        return timings
+
+    def report(self, name: str, timings: list[float]) -> None:
+        percentiles = statistics.quantiles(timings, n=100)
+
+        self.stdout.write(
+            f"{name:>20}: p50={percentiles[49]:.3f}ms "
+            f"p99={percentiles[98]:.3f}ms"
+        )
@@ -3,6 +3,7 @@ from typing import Any
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
 
 from config.errors import ConflictError
 
@@ -13,11 +14,65 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
-    def save(self, *args: Any, **kwargs: Any) -> None:
-        self.validate()
+    def save(self, *args: Any, trusted: bool = False, **kwargs: Any) -> None:
+        update_fields = kwargs.get("update_fields")
+
+        # Trusted writes come from internal code that builds the values
+        # itself, so they skip validation and its extra queries.
+        if not trusted:
+            self.validate(
+                include=[
+                    self._meta.get_field(field_name)
+                    for field_name in update_fields
+                ]
+                if update_fields is not None
+                else None,
+            )
 
         super().save(*args, **kwargs)
 
+        # Only written values are known to match the database, other
+        # changed fields must still be checked when they are saved.
+        if update_fields is None:
+            deferred_fields = self.get_deferred_fields()
+            self._loaded_values = {
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if field.attname not in deferred_fields
+            }
+        else:
+            self._loaded_values = getattr(self, "_loaded_values", {})
+            for field_name in update_fields:
+                attname = self._meta.get_field(field_name).attname
+                self._loaded_values[attname] = getattr(self, attname)
+
+    @classmethod
+    def from_db(
+        cls,
+        db: str | None,
+        field_names: list[str],
+        values: tuple[Any, ...],
+    ) -> "BaseModel":
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(  # noqa: SLF001
+            zip(field_names, values, strict=True)
+        )
+
+        return instance
+
+    def get_unchanged_fields(self) -> set[str]:
+        loaded_values = getattr(self, "_loaded_values", None)
+
+        if self._state.adding or not loaded_values:
+            return set()
+
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in loaded_values
+            and loaded_values[field.attname] == getattr(self, field.attname)
+        }
+
     def validate(
         self,
         validate_unique: bool = True,
@@ -36,8 +91,21 @@ class BaseModel(models.Model):
         )
 
         if validate_unique:
+            # Values that are unchanged since loading were unique already,
+            # unless they form a unique_together group with a changed one.
+            unique_exclude = self.get_unchanged_fields()
+            if include:
+                unique_exclude |= {
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if field not in include
+                }
+            for unique_together in self._meta.unique_together:
+                if not unique_exclude.issuperset(unique_together):
+                    unique_exclude -= set(unique_together)
+
             try:
-                self.validate_unique()
+                self.validate_unique(exclude=unique_exclude)
             except ValidationError as e:
                 raise ConflictError(e) from None
 
@@ -46,3 +114,25 @@ class BaseModel(models.Model):
                 self.validate_constraints()
             except ValidationError as e:
                 raise ConflictError(e) from None
+
+
+class TokenVersionMixin(models.Model):
+    # For models with a token_version field that is embedded in their
+    # tokens, bumping it revokes every token issued before.
+    token_version: int
+
+    class Meta:
+        abstract = True
+
+    def bump_token_version(self) -> None:
+        # Conditional UPDATE, so concurrent sign-ins never hand out two
+        # tokens with the same version.
+        model = type(self)
+
+        while not model.objects.filter(
+            pk=self.pk,
+            token_version=self.token_version,
+        ).update(token_version=F("token_version") + 1):
+            self.refresh_from_db(fields=["token_version"])
+
+        self.token_version += 1
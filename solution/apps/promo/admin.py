@@ -3,9 +3,12 @@ from django.contrib import admin
 from apps.promo.models import (
     Promocode,
     PromocodeActivation,
+    PromocodeActivationBucket,
     PromocodeComment,
+    PromocodeCountryStat,
     PromocodeLike,
     PromocodeTarget,
+    PromocodeUniqueCode,
 )
 
 admin.site.register(Promocode)
@@ -13,3 +16,6 @@ admin.site.register(PromocodeTarget)
 admin.site.register(PromocodeActivation)
 admin.site.register(PromocodeComment)
 admin.site.register(PromocodeLike)
+admin.site.register(PromocodeUniqueCode)
+admin.site.register(PromocodeCountryStat)
+admin.site.register(PromocodeActivationBucket)
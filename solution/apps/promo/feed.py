@@ -0,0 +1,140 @@
+import math
+import time
+import uuid
+from collections.abc import Callable, Iterable
+from datetime import date, datetime
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+
+OVERSIZED = "oversized"
+
+
+def get_queryset_keys(
+    queryset: QuerySet,
+    limit: int | None = None,
+) -> list[tuple[datetime, uuid.UUID]]:
+    return list(
+        queryset.order_by("-created_at", "-pk").values_list(
+            "created_at", "pk"
+        )[:limit]
+    )
+
+
+class FeedSegmentCache:
+    # Ordered (created_at, pk) keys of the promocodes a segment of users
+    # sees in the feed. A segment is everything the feed result depends
+    # on apart from the per-user flags, which callers overlay on the page.
+    # Keys embed a generation bumped by every promocode write and the
+    # current date, since promocodes start and end by date. The ids of the
+    # promocodes a write changed are kept under the generation it bumped
+    # to for changes_timeout seconds, see TargetingIndex.
+
+    generation_key = "promo:feed:generation"
+
+    def __init__(
+        self,
+        timeout: int,
+        max_size: int,
+        changes_timeout: int,
+    ) -> None:
+        self.timeout = timeout
+        self.max_size = max_size
+        self.changes_timeout = changes_timeout
+
+    def get_generation(self) -> int:
+        generation = cache.get(self.generation_key)
+
+        if generation is None:
+            # Never restart from a number segments may still be cached
+            # under after the generation key got evicted.
+            cache.add(self.generation_key, time.time_ns(), timeout=None)
+            generation = cache.get(self.generation_key)
+
+        return generation
+
+    def get_key(self, current_date: date, *segment: Any) -> str:
+        parts = ":".join("" if part is None else str(part) for part in segment)
+        return f"promo:feed:{self.get_generation()}:{current_date}:{parts}"
+
+    def get(
+        self,
+        load_keys: Callable[[int], list[tuple[datetime, uuid.UUID]]],
+        current_date: date,
+        *segment: Any,
+    ) -> list[tuple[datetime, uuid.UUID]] | None:
+        """Return the keys cached under ``segment``.
+
+        ``load_keys`` is only called on a miss, with the number of keys
+        to load. Segments bigger than ``max_size`` aren't cached and None
+        is returned for them.
+        """
+        key = self.get_key(current_date, *segment)
+        keys = cache.get(key)
+
+        if keys is None:
+            keys = load_keys(self.max_size + 1)
+            if len(keys) > self.max_size:
+                keys = OVERSIZED
+
+            cache.set(key, keys, timeout=self.timeout)
+
+        if keys == OVERSIZED:
+            return None
+
+        return keys
+
+    def get_changes_key(self, generation: int) -> str:
+        return f"promo:feed:changes:{generation}"
+
+    def get_changes(
+        self,
+        since: int,
+        until: int,
+        max_generations: int,
+    ) -> set[uuid.UUID] | None:
+        """Return the ids of promocodes changed after generation ``since``
+        up to ``until``, None if some of the changes are unknown.
+        """
+        if not 0 <= until - since <= max_generations:
+            return None
+
+        keys = [
+            self.get_changes_key(generation)
+            for generation in range(since + 1, until + 1)
+        ]
+        changes = cache.get_many(keys)
+
+        if len(changes) < len(keys):
+            return None
+
+        return set().union(*changes.values())
+
+    def invalidate(self, promocode_ids: Iterable[uuid.UUID] = ()) -> None:
+        promocode_ids = list(promocode_ids)
+
+        def bump() -> None:
+            try:
+                generation = cache.incr(self.generation_key)
+            except ValueError:
+                cache.add(self.generation_key, time.time_ns(), timeout=None)
+                return
+
+            cache.set(
+                self.get_changes_key(generation),
+                promocode_ids,
+                timeout=self.changes_timeout,
+            )
+
+        transaction.on_commit(bump)
+
+
+feed_segments = FeedSegmentCache(
+    timeout=settings.FEED_SEGMENT_CACHE_TTL,
+    max_size=settings.FEED_SEGMENT_MAX_SIZE,
+    # Indexes older than this are rebuilt without looking at changes
+    changes_timeout=math.ceil(settings.TARGETING_INDEX_FULL_REFRESH_INTERVAL),
+)
@@ -0,0 +1,43 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class UserFlagsCache:
+    # Ids of every promocode a user liked and activated, cached together
+    # so the flags of a page are two set lookups. Entries are dropped on
+    # commit of a like, unlike or activation, a concurrent read of the
+    # old sets may still be cached for at most timeout seconds.
+
+    def __init__(self, timeout: int) -> None:
+        self.timeout = timeout
+
+    def get_key(self, user_id: uuid.UUID) -> str:
+        return f"promo:flags:{user_id}"
+
+    def get(
+        self,
+        user_id: uuid.UUID,
+    ) -> tuple[frozenset[uuid.UUID], frozenset[uuid.UUID]] | None:
+        return cache.get(self.get_key(user_id))
+
+    def set(
+        self,
+        user_id: uuid.UUID,
+        liked: frozenset[uuid.UUID],
+        activated: frozenset[uuid.UUID],
+    ) -> None:
+        cache.set(
+            self.get_key(user_id),
+            (liked, activated),
+            timeout=self.timeout,
+        )
+
+    def invalidate(self, user_id: uuid.UUID) -> None:
+        key = self.get_key(user_id)
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+user_flags = UserFlagsCache(timeout=settings.USER_FLAGS_CACHE_TTL)
@@ -0,0 +1,103 @@
+import asyncio
+import statistics
+import threading
+import time
+from http import HTTPStatus as status
+from typing import Any
+
+import httpx
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandParser
+
+from apps.core.management.commands.benchmark_antifraud import (
+    BASE_URL,
+    RejectingAntifraudHandler,
+    Server,
+    seed,
+    unseed,
+)
+from config.integrations.antifraud.interactor import AntifraudServiceInteractor
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent activation requests to the ASGI application while "
+        "a local fake antifraud service answers slowly. Requests are run "
+        "at most --workers at a time, like sync workers that each hold a "
+        "request until the service responds, then all at once on the "
+        "event loop, like one ASGI worker"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--delay", type=float, default=0.2)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        RejectingAntifraudHandler.delay = options["delay"]
+        server = Server(("127.0.0.1", 0), RejectingAntifraudHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        endpoint = AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT
+        AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT = (
+            f"http://127.0.0.1:{server.server_port}/api/validate"
+        )
+
+        # Requests are served on other threads, so the rows are committed
+        # and deleted afterwards instead of rolled back.
+        business, promocode, users = seed(options["requests"])
+        path = f"/api/user/promo/{promocode.pk}/activate"
+        tokens = [user.generate_token() for user in users]
+
+        try:
+            for name, limit in (
+                (f"{options['workers']} at a time", options["workers"]),
+                ("all at once", None),
+            ):
+                self.report(name, *asyncio.run(self.run(path, tokens, limit)))
+        finally:
+            AntifraudServiceInteractor.ANTIFRAUD_ENDPOINT = endpoint
+            server.shutdown()
+            unseed(business, promocode, users)
+
+    async def run(
+        self,
+        path: str,
+        tokens: list[str],
+        limit: int | None,
+    ) -> tuple[list[float], float]:
+        transport = httpx.ASGITransport(app=get_asgi_application())
+        semaphore = asyncio.Semaphore(limit or len(tokens))
+        started_at = time.perf_counter()
+
+        async with httpx.AsyncClient(
+            transport=transport, base_url=BASE_URL
+        ) as client:
+
+            async def activate(token: str) -> float:
+                async with semaphore:
+                    response = await client.post(
+                        path, headers={"Authorization": f"Bearer {token}"}
+                    )
+
+                if response.status_code != status.FORBIDDEN:
+                    self.stderr.write(
+                        f"Unexpected response {response.status_code}: "
+                        f"{response.text[:200]}"
+                    )
+
+                return time.perf_counter() - started_at
+
+            latencies = await asyncio.gather(*map(activate, tokens))
+
+        return latencies, time.perf_counter() - started_at
+
+    def report(
+        self, name: str, latencies: list[float], elapsed: float
+    ) -> None:
+        percentiles = statistics.quantiles(latencies, n=100)
+
+        self.stdout.write(
+            f"{name:>16}: {len(latencies) / elapsed:.1f} req/s, "
+            f"p50={percentiles[49]:.3f}s p99={percentiles[98]:.3f}s"
+        )
@@ -0,0 +1,92 @@
+import json
+import time
+import uuid
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+from ninja.renderers import JSONRenderer
+from pydantic import TypeAdapter
+
+from api.v1.renderers import ORJSONRenderer, exclude_none
+from api.v1.user import schemas, utils
+from apps.business.models import Business
+from apps.promo.models import Promocode
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-row serialization cost of a user feed page through "
+        "schemas and the stdlib renderer against values() rows and orjson"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        business = Business(id=uuid.uuid4(), name="Benchmark")
+        rows = [
+            {
+                "pk": uuid.uuid4(),
+                "created_at": timezone.now(),
+                "business_id": business.id,
+                "business__name": business.name,
+                "description": f"Benchmark promocode number {i}",
+                "image_url": None if i % 2 else "https://cdn.test/image.png",
+                "is_active": True,
+                "is_activated_by_user": False,
+                "is_liked_by_user": bool(i % 3),
+                "like_count": i,
+                "comment_count": i * 2,
+            }
+            for i in range(options["rows"])
+        ]
+
+        adapter = TypeAdapter(list[schemas.PromocodeViewOut])
+
+        # The schema path needs model instances, which values() rows skip.
+        def schema_path() -> bytes:
+            promocodes = []
+            for row in rows:
+                promocode = Promocode(
+                    id=row["pk"],
+                    business=business,
+                    description=row["description"],
+                    image_url=row["image_url"],
+                    like_count=row["like_count"],
+                    comment_count=row["comment_count"],
+                )
+                promocode.is_active = row["is_active"]
+                promocode.is_activated_by_user = row["is_activated_by_user"]
+                promocode.is_liked_by_user = row["is_liked_by_user"]
+                promocodes.append(promocode)
+
+            data = adapter.dump_python(
+                adapter.validate_python(
+                    [utils.map_promocode_to_schema(p) for p in promocodes],
+                    from_attributes=True,
+                ),
+                exclude_none=True,
+            )
+            return JSONRenderer().render(None, data, response_status=200)
+
+        def trusted_path() -> bytes:
+            data = exclude_none([utils.map_promocode_row(row) for row in rows])
+            return ORJSONRenderer().render(None, data, response_status=200)
+
+        if json.loads(schema_path()) != json.loads(trusted_path()):
+            self.stderr.write("Outputs of both paths differ")
+            return
+
+        for name, serialize in (
+            ("schemas + json", schema_path),
+            ("values() + orjson", trusted_path),
+        ):
+            start_time = time.perf_counter()
+            for _ in range(options["repeat"]):
+                serialize()
+            elapsed = time.perf_counter() - start_time
+
+            per_row = elapsed / options["repeat"] / options["rows"] * 1e6
+            self.stdout.write(f"{name:>18}: {per_row:.2f}us per row")
@@ -0,0 +1,83 @@
+import time
+import uuid
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+from api.v1.business import schemas, utils
+from apps.business.models import Business
+from apps.promo.models import Promocode, PromocodeTarget
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare promocode creation throughput of the single-item path "
+        "and the bulk path, the created rows are deleted afterwards"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--promocodes", type=int, default=1000)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PROMOCODE_BULK_BATCH_SIZE,
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        count = options["promocodes"]
+        promocodes = [
+            schemas.CreatePromocodeIn(
+                description=f"Benchmark promocode number {i}",
+                max_count=10,
+                mode=Promocode.ModeChoices.COMMON,
+                promo_common=f"benchmark-{i}",
+                target=schemas.PromocodeTarget(
+                    categories=["benchmark", f"category-{i % 10}"],
+                    country="ru",
+                ),
+            )
+            for i in range(count)
+        ]
+
+        business = Business(
+            name="Benchmark",
+            email=f"benchmark-{uuid.uuid4().hex[:8]}@mail.com",
+            password="BenchmarkPassword2000!",  # noqa: S106
+        )
+        business.save()
+
+        def single() -> None:
+            for promocode in promocodes:
+                promocode_obj = utils.build_promocode(business, promocode)
+
+                with transaction.atomic():
+                    promocode_obj.target.save()
+                    promocode_obj.save()
+
+        def bulk() -> None:
+            Promocode.objects.bulk_create_with_targets(
+                [
+                    utils.build_promocode(business, promocode)
+                    for promocode in promocodes
+                ],
+                batch_size=options["batch_size"],
+            )
+
+        try:
+            for name, create in (("single-item path", single), ("bulk", bulk)):
+                start_time = time.perf_counter()
+                create()
+                elapsed = time.perf_counter() - start_time
+
+                self.stdout.write(
+                    f"{name:>16}: {count} promocodes in {elapsed:.3f}s "
+                    f"({count / elapsed:.0f} promocodes/s)"
+                )
+        finally:
+            target_ids = list(
+                business.promocodes.values_list("target_id", flat=True)
+            )
+            business.delete()
+            PromocodeTarget.objects.filter(id__in=target_ids).delete()
@@ -0,0 +1,110 @@
+import random
+import time
+from collections.abc import Callable
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+from apps.promo.feed import get_queryset_keys
+from apps.promo.management.seeding import seed_promocodes
+from apps.promo.models import Promocode, get_current_date
+from apps.promo.targeting import TargetingIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare feed and activation targeting checks of the ORM against "
+        "the in-memory targeting index on a seeded database, the seeded "
+        "rows are rolled back afterwards"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--promocodes", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        rng = random.Random(options["seed"])  # noqa: S311
+
+        with transaction.atomic():
+            _, users, promocodes = seed_promocodes(
+                rng,
+                businesses=10,
+                promocodes=options["promocodes"],
+                users=options["users"],
+            )
+            checks = [(user, rng.choice(promocodes)) for user in users]
+            current_date = get_current_date()
+
+            index = TargetingIndex(
+                refresh_overlap=0,
+                full_refresh_interval=float("inf"),
+            )
+            start_time = time.perf_counter()
+            index.sync()
+            self.stdout.write(
+                f"{'index build':>16}: {len(promocodes)} promocodes in "
+                f"{time.perf_counter() - start_time:.3f}s"
+            )
+
+            def orm_feed() -> list[Any]:
+                return [
+                    get_queryset_keys(
+                        Promocode.objects.for_audience(user.age, user.country)
+                    )
+                    for user in users
+                ]
+
+            def index_feed() -> list[Any]:
+                return [
+                    index.get_feed_keys(
+                        current_date,
+                        user.age,
+                        user.country.code,
+                        None,
+                        None,
+                    )
+                    for user in users
+                ]
+
+            def orm_activation() -> list[bool]:
+                return [
+                    Promocode.objects.filter(pk=promocode.pk)
+                    .for_audience(user.age, user.country)
+                    .exists()
+                    for user, promocode in checks
+                ]
+
+            def index_activation() -> list[bool]:
+                return [
+                    index.can_see(promocode.pk, user.age, user.country.code)
+                    for user, promocode in checks
+                ]
+
+            for name, orm, indexed in (
+                ("feed", orm_feed, index_feed),
+                ("activation", orm_activation, index_activation),
+            ):
+                orm_result, orm_elapsed = self.measure(orm)
+                index_result, index_elapsed = self.measure(indexed)
+
+                if orm_result != index_result:
+                    self.stderr.write(f"Results of {name} checks differ")
+
+                for path, elapsed in (
+                    ("orm", orm_elapsed),
+                    ("index", index_elapsed),
+                ):
+                    self.stdout.write(
+                        f"{f'{name} {path}':>16}: "
+                        f"{elapsed / len(users) * 1e6:.1f}us per user"
+                    )
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(check: Callable[[], list[Any]]) -> tuple[list[Any], float]:
+        start_time = time.perf_counter()
+        result = check()
+        return result, time.perf_counter() - start_time
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from apps.promo.models import PromocodeActivationBucket, increment_rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge hourly activation buckets older than the retention period "
+        "into daily buckets"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.PROMOCODE_STAT_HOURLY_RETENTION_DAYS,
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        cutoff = (
+            timezone.now() - timedelta(days=options["older_than_days"])
+        ).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        hourly_buckets = PromocodeActivationBucket.objects.filter(
+            bucket_size=PromocodeActivationBucket.SizeChoices.HOUR,
+            bucket_start__lt=cutoff,
+        )
+
+        with transaction.atomic():
+            daily_buckets = (
+                hourly_buckets.annotate(day=TruncDay("bucket_start"))
+                .values("promocode", "day")
+                .annotate(activations_count=Sum("activations_count"))
+                .order_by()
+            )
+
+            compacted = 0
+            for bucket in daily_buckets:
+                increment_rollup(
+                    PromocodeActivationBucket,
+                    count=bucket["activations_count"],
+                    promocode_id=bucket["promocode"],
+                    bucket_size=PromocodeActivationBucket.SizeChoices.DAY,
+                    bucket_start=bucket["day"],
+                )
+                compacted += 1
+
+            deleted, _ = hourly_buckets.delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Merged {deleted} hourly buckets "
+                f"into {compacted} daily buckets"
+            )
+        )
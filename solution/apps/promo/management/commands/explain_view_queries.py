@@ -0,0 +1,157 @@
+import random
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection, transaction
+from django.db.models import Count, QuerySet
+
+from api.v1.user.utils import PROMOCODE_VIEW_VALUES
+from apps.promo.management.seeding import seed_promocodes
+from apps.promo.models import (
+    Promocode,
+    PromocodeActivation,
+    PromocodeComment,
+    PromocodeLike,
+    PromocodeUniqueCode,
+)
+
+PAGE_SIZE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Print query plans of the main querysets of the promocode views "
+        "against a seeded database, the seeded rows are rolled back "
+        "afterwards"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--businesses", type=int, default=20)
+        parser.add_argument("--promocodes", type=int, default=2000)
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.stdout.write(f"Database: {connection.vendor}")
+
+        with transaction.atomic():
+            self.seed(random.Random(options["seed"]), options)  # noqa: S311
+            self.analyze()
+
+            for name, queryset in self.get_querysets():
+                self.stdout.write(f"\n== {name} ==")
+                self.stdout.write(queryset.explain())
+
+            transaction.set_rollback(True)
+
+    def seed(self, rng: random.Random, options: dict[str, Any]) -> None:
+        businesses, users, _ = seed_promocodes(
+            rng,
+            businesses=options["businesses"],
+            promocodes=options["promocodes"],
+            users=options["users"],
+        )
+
+        self.business = businesses[0]
+        self.user = users[0]
+        self.promocode = (
+            Promocode.objects.filter(mode=Promocode.ModeChoices.UNIQUE)
+            .order_by("created_at")
+            .first()
+        )
+
+    def analyze(self) -> None:
+        # Planner statistics, so plans don't depend on leftover stats
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def get_querysets(self) -> list[tuple[str, QuerySet]]:
+        # Kept in sync with the querysets built in api.v1.*.views
+        business, user, promocode = self.business, self.user, self.promocode
+
+        feed = (
+            Promocode.objects.for_audience(user.age, user.country)
+            .with_active()
+            .order_by("-created_at", "-pk")
+        )
+        category_feed = feed.filter(target__category_index__name="cats")
+
+        # Segment keys, then the page read by pk and the flags of its rows
+        page_ids = list(feed.values_list("pk", flat=True)[:PAGE_SIZE])
+
+        return [
+            (
+                "GET /business/promo",
+                Promocode.objects.filter(business=business)
+                .with_active()
+                .order_by("-created_at", "-pk")[:PAGE_SIZE],
+            ),
+            (
+                "GET /user/feed (segment keys)",
+                feed.values_list("created_at", "pk"),
+            ),
+            (
+                "GET /user/feed?category= (segment keys)",
+                category_feed.values_list("created_at", "pk"),
+            ),
+            (
+                "GET /user/feed (page)",
+                Promocode.objects.filter(pk__in=page_ids)
+                .with_active()
+                .values(*PROMOCODE_VIEW_VALUES),
+            ),
+            (
+                "GET /user/feed (uncached page)",
+                feed.values(*PROMOCODE_VIEW_VALUES)[:PAGE_SIZE],
+            ),
+            (
+                "GET /user/feed (liked flags)",
+                PromocodeLike.objects.filter(
+                    user=user, promocode_id__in=page_ids
+                ).values_list("promocode_id", flat=True),
+            ),
+            (
+                "GET /user/feed (activated flags)",
+                PromocodeActivation.objects.filter(
+                    user=user, promocode_id__in=page_ids
+                ).values_list("promocode_id", flat=True),
+            ),
+            (
+                "GET /user/promo/history",
+                PromocodeActivation.objects.filter(user=user)
+                .select_related("promocode", "promocode__business")
+                .order_by("-timestamp", "-pk")[:PAGE_SIZE],
+            ),
+            (
+                "GET /user/promo/{id}/comments",
+                PromocodeComment.objects.filter(promocode=promocode)
+                .select_related("author")
+                .order_by("-date", "-pk")[:PAGE_SIZE],
+            ),
+            (
+                "POST /user/promo/{id}/activate (unique code)",
+                PromocodeUniqueCode.objects.filter(
+                    promocode=promocode,
+                    activated_at__isnull=True,
+                ).order_by("position")[:1],
+            ),
+            (
+                "GET /business/promo/{id}/activations/export",
+                promocode.activations.order_by("timestamp", "pk").values_list(
+                    "timestamp", "user__country", "user__age", "code"
+                ),
+            ),
+            (
+                "GET /business/promo/{id}/stat",
+                promocode.country_stats.order_by("country").values_list(
+                    "country", "activations_count"
+                ),
+            ),
+            (
+                "GET /business/promo/{id}/stat (without rollup)",
+                promocode.activations.exclude(user__country="")
+                .values("user__country")
+                .annotate(activations_count=Count("pk"))
+                .order_by("user__country"),
+            ),
+        ]
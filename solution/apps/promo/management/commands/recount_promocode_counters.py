@@ -0,0 +1,19 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from apps.promo.models import Promocode
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute like, comment and activation counters of promocodes "
+        "and repair the ones that drifted"
+    )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        repaired = Promocode.objects.recount_counters()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Repaired counters of {repaired} promocodes")
+        )
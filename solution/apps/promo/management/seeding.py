@@ -0,0 +1,96 @@
+import random
+
+from apps.business.models import Business
+from apps.promo.models import (
+    Promocode,
+    PromocodeActivation,
+    PromocodeComment,
+    PromocodeLike,
+    PromocodeTarget,
+)
+from apps.user.models import User
+
+COUNTRIES = ["ru", "us", "gb", "de", "fr", "kz", "by", "cn"]
+
+CATEGORIES = ["cats", "dogs", "food", "tech"]
+
+
+def seed_promocodes(
+    rng: random.Random,
+    businesses: int,
+    promocodes: int,
+    users: int,
+) -> tuple[list[Business], list[User], list[Promocode]]:
+    """Bulk insert a reproducible data set for management commands that
+    measure queries, with activations, likes and comments.
+    """
+    business_objs = Business.objects.bulk_create(
+        Business(
+            name=f"Seed {i}",
+            email=f"seed-{i}@mail.com",
+            password="SeedPassword2000!",  # noqa: S106
+        )
+        for i in range(businesses)
+    )
+    user_objs = User.objects.bulk_create(
+        User(
+            name="Seed",
+            surname=f"User {i}",
+            email=f"seed-{i}@mail.com",
+            age=rng.randint(14, 80),
+            country=rng.choice(COUNTRIES),
+            country_raw="ru",
+            password="SeedPassword2000!",  # noqa: S106
+        )
+        for i in range(users)
+    )
+
+    promocode_objs = []
+    for i in range(promocodes):
+        age_from = rng.choice([None, rng.randint(14, 40)])
+        target = PromocodeTarget(
+            age_from=age_from,
+            age_until=rng.choice([None, (age_from or 14) + 20]),
+            country=rng.choice([None, *COUNTRIES]),
+            categories=rng.sample(CATEGORIES, 2),
+        )
+        promocode = Promocode(
+            business=rng.choice(business_objs),
+            target=target,
+            description=f"Seed promocode number {i}",
+            max_count=1 if i % 4 == 0 else 100,
+        )
+        if i % 4 == 0:
+            promocode.mode = Promocode.ModeChoices.UNIQUE
+            promocode.promo_unique = [f"code-{i}-{j}" for j in range(5)]
+        else:
+            promocode.mode = Promocode.ModeChoices.COMMON
+            promocode.promo_common = f"seed-{i}"
+        promocode_objs.append(promocode)
+
+    Promocode.objects.bulk_create_with_targets(promocode_objs, batch_size=500)
+
+    pairs = list(
+        dict.fromkeys(
+            (rng.choice(promocode_objs), rng.choice(user_objs))
+            for _ in range(len(promocode_objs) * 5)
+        )
+    )
+    PromocodeActivation.objects.bulk_create(
+        PromocodeActivation(promocode=promocode, user=user)
+        for promocode, user in pairs
+    )
+    PromocodeLike.objects.bulk_create(
+        PromocodeLike(promocode=promocode, user=user)
+        for promocode, user in pairs[::2]
+    )
+    PromocodeComment.objects.bulk_create(
+        PromocodeComment(
+            promocode=promocode,
+            author=user,
+            text="Seed comment text",
+        )
+        for promocode, user in pairs[::3]
+    )
+
+    return business_objs, user_objs, promocode_objs
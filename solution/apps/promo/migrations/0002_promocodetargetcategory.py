@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-17 02:58
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def populate_category_index(apps, schema_editor):
+    PromocodeTarget = apps.get_model('promo', 'PromocodeTarget')
+    PromocodeTargetCategory = apps.get_model('promo', 'PromocodeTargetCategory')
+
+    PromocodeTargetCategory.objects.bulk_create(
+        PromocodeTargetCategory(target=target, name=name)
+        for target in PromocodeTarget.objects.exclude(categories=None).iterator()
+        for name in {category.lower() for category in target.categories or []}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromocodeTargetCategory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=20)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_index', to='promo.promocodetarget')),
+            ],
+            options={
+                'unique_together': {('name', 'target')},
+            },
+        ),
+        migrations.RunPython(populate_category_index, migrations.RunPython.noop),
+    ]
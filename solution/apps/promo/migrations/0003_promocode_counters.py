@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Promocode = apps.get_model('promo', 'Promocode')
+
+    Promocode.objects.update(
+        like_count=count_related(apps.get_model('promo', 'PromocodeLike'), 'promocode'),
+        comment_count=count_related(apps.get_model('promo', 'PromocodeComment'), 'promocode'),
+        used_count=count_related(apps.get_model('promo', 'PromocodeActivation'), 'promocode'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0002_promocodetargetcategory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='used_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:01
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_unique_codes(apps, schema_editor):
+    Promocode = apps.get_model('promo', 'Promocode')
+    PromocodeActivation = apps.get_model('promo', 'PromocodeActivation')
+    PromocodeUniqueCode = apps.get_model('promo', 'PromocodeUniqueCode')
+
+    for promocode in Promocode.objects.filter(mode='UNIQUE').iterator():
+        activated_count = len(promocode.promo_unique_activated or [])
+        activations = list(
+            PromocodeActivation.objects.filter(promocode=promocode)
+            .order_by('timestamp')[:activated_count]
+        )
+
+        unique_codes = []
+        for position, code in enumerate(promocode.promo_unique or []):
+            unique_code = PromocodeUniqueCode(
+                promocode=promocode, code=code, position=position
+            )
+
+            if position < len(activations):
+                unique_code.activated_by_id = activations[position].user_id
+                unique_code.activated_at = activations[position].timestamp
+            elif position < activated_count:
+                unique_code.activated_at = timezone.now()
+
+            unique_codes.append(unique_code)
+
+        PromocodeUniqueCode.objects.bulk_create(unique_codes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0003_promocode_counters'),
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromocodeUniqueCode',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=30)),
+                ('position', models.PositiveIntegerField()),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+                ('activated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='unique_codes', to='user.user')),
+                ('promocode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unique_codes', to='promo.promocode')),
+            ],
+            options={
+                'unique_together': {('promocode', 'position')},
+            },
+        ),
+        migrations.RunPython(populate_unique_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='promocode',
+            name='promo_unique_activated',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:12
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_country_stats(apps, schema_editor):
+    PromocodeActivation = apps.get_model('promo', 'PromocodeActivation')
+    PromocodeCountryStat = apps.get_model('promo', 'PromocodeCountryStat')
+
+    PromocodeCountryStat.objects.bulk_create(
+        (
+            PromocodeCountryStat(
+                promocode_id=row['promocode'],
+                country=row['user__country'],
+                activations_count=row['activations_count'],
+            )
+            for row in PromocodeActivation.objects.exclude(user__country='')
+            .values('promocode', 'user__country')
+            .annotate(activations_count=Count('pk'))
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0004_promocodeuniquecode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromocodeCountryStat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('country', models.CharField(max_length=2)),
+                ('activations_count', models.PositiveIntegerField(default=0)),
+                ('promocode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='country_stats', to='promo.promocode')),
+            ],
+            options={
+                'unique_together': {('promocode', 'country')},
+            },
+        ),
+        migrations.RunPython(populate_country_stats, migrations.RunPython.noop),
+    ]
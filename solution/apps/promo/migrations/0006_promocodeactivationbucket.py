@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:13
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def populate_activation_buckets(apps, schema_editor):
+    PromocodeActivation = apps.get_model('promo', 'PromocodeActivation')
+    PromocodeActivationBucket = apps.get_model('promo', 'PromocodeActivationBucket')
+
+    PromocodeActivationBucket.objects.bulk_create(
+        (
+            PromocodeActivationBucket(
+                promocode_id=row['promocode'],
+                bucket_size='HOUR',
+                bucket_start=row['hour'],
+                activations_count=row['activations_count'],
+            )
+            for row in PromocodeActivation.objects.annotate(hour=TruncHour('timestamp'))
+            .values('promocode', 'hour')
+            .annotate(activations_count=Count('pk'))
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0005_promocodecountrystat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromocodeActivationBucket',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket_size', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('activations_count', models.PositiveIntegerField(default=0)),
+                ('promocode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activation_buckets', to='promo.promocode')),
+            ],
+            options={
+                'unique_together': {('promocode', 'bucket_size', 'bucket_start')},
+            },
+        ),
+        migrations.RunPython(populate_activation_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:14
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_activation_codes(apps, schema_editor):
+    Promocode = apps.get_model('promo', 'Promocode')
+    PromocodeActivation = apps.get_model('promo', 'PromocodeActivation')
+    PromocodeUniqueCode = apps.get_model('promo', 'PromocodeUniqueCode')
+
+    PromocodeActivation.objects.filter(promocode__mode='COMMON').update(
+        code=Subquery(
+            Promocode.objects.filter(pk=OuterRef('promocode')).values('promo_common')[:1]
+        ),
+    )
+
+    # The k-th code claimed by a user belongs to their k-th activation.
+    for promocode in Promocode.objects.filter(mode='UNIQUE').iterator():
+        codes_by_user = defaultdict(list)
+        for unique_code in PromocodeUniqueCode.objects.filter(
+            promocode=promocode, activated_by__isnull=False
+        ).order_by('activated_at', 'position'):
+            codes_by_user[unique_code.activated_by_id].append(unique_code.code)
+
+        activations = []
+        for activation in PromocodeActivation.objects.filter(
+            promocode=promocode
+        ).order_by('timestamp'):
+            codes = codes_by_user[activation.user_id]
+            if codes:
+                activation.code = codes.pop(0)
+                activations.append(activation)
+
+        PromocodeActivation.objects.bulk_update(activations, ['code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promo', '0006_promocodeactivationbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocodeactivation',
+            name='code',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.RunPython(populate_activation_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0001_initial'),
+        ('promo', '0007_promocodeactivation_code'),
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['business', 'created_at', 'id'], name='promo_business_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['created_at', 'id'], name='promo_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodeactivation',
+            index=models.Index(fields=['promocode', 'user'], name='promo_activation_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodeactivation',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='promo_activation_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodeactivation',
+            index=models.Index(fields=['promocode', 'timestamp', 'id'], name='promo_activation_export_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodecomment',
+            index=models.Index(fields=['promocode', 'date', 'id'], name='promo_comment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodetarget',
+            index=models.Index(fields=['country', 'age_from', 'age_until'], name='promo_target_audience_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocodeuniquecode',
+            index=models.Index(condition=models.Q(('activated_at__isnull', True)), fields=['promocode', 'position'], name='promo_code_unused_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:26
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_updated_at(apps, schema_editor):
+    Promocode = apps.get_model('promo', 'Promocode')
+
+    Promocode.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0001_initial'),
+        ('promo', '0008_promocode_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['updated_at'], name='promo_updated_idx'),
+        ),
+    ]
@@ -1,18 +1,47 @@
-from datetime import datetime
+import functools
+import operator
+from datetime import date, datetime
+from typing import Any
 
 import pytz
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import (
     MaxValueValidator,
     MinLengthValidator,
     MinValueValidator,
 )
-from django.db import models
+from django.db import (
+    IntegrityError,
+    connection,
+    connections,
+    models,
+    router,
+    transaction,
+)
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django_countries.fields import CountryField
 
 from apps.business.models import Business
+from apps.core.functions import JSONArrayLength
 from apps.core.models import BaseModel
+from apps.promo.feed import feed_segments
+from apps.promo.flags import user_flags
 from apps.promo.validators import (
+    MAX_CATEGORY_LEN,
+    MAX_UNIQUE_PROMOCODE_LEN,
     PromocodeDurationValidator,
     PromocodeUniqueValidator,
     TargetAgeValidator,
@@ -44,11 +73,302 @@ class PromocodeTarget(BaseModel):
     def __str__(self) -> str:
         return str(self.id)
 
+    class Meta:
+        indexes = (
+            # Audience filter of the user feed
+            models.Index(
+                fields=["country", "age_from", "age_until"],
+                name="promo_target_audience_idx",
+            ),
+        )
+
     def clean(self) -> None:
         super().clean()
 
         TargetAgeValidator()(self)
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        update_fields = kwargs.get("update_fields")
+        adding = self._state.adding
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if update_fields is None or "categories" in update_fields:
+                self.sync_category_index()
+
+            feed_segments.invalidate(
+                () if adding else self.promocodes.values_list("pk", flat=True)
+            )
+
+    def sync_category_index(self) -> None:
+        self.category_index.all().delete()
+
+        PromocodeTargetCategory.objects.bulk_create(
+            PromocodeTargetCategory(target=self, name=name)
+            for name in PromocodeTargetCategory.normalize(self.categories)
+        )
+
+
+class PromocodeTargetCategory(BaseModel):
+    target = models.ForeignKey(
+        PromocodeTarget,
+        on_delete=models.CASCADE,
+        related_name="category_index",
+    )
+    name = models.CharField(max_length=MAX_CATEGORY_LEN)
+
+    def __str__(self) -> str:
+        return f"{self.target.id} | {self.name}"
+
+    class Meta:
+        unique_together = ("name", "target")
+
+    @staticmethod
+    def normalize(categories: list[str] | None) -> set[str]:
+        return {category.lower() for category in categories or []}
+
+
+def get_current_date() -> date:
+    timezone_utc3 = pytz.timezone("Europe/Moscow")
+    return datetime.now(timezone_utc3).date()
+
+
+def count_related(model: type[models.Model], field: str) -> Coalesce:
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def increment_rollup(
+    model: type[models.Model],
+    count: int = 1,
+    **lookup: Any,
+) -> None:
+    db_connection = connections[router.db_for_write(model)]
+
+    if db_connection.features.supports_update_conflicts_with_target:
+        upsert_rollup(db_connection, model, count, lookup)
+        return
+
+    rows = model.objects.filter(**lookup)
+
+    if rows.update(activations_count=F("activations_count") + count):
+        return
+
+    try:
+        with transaction.atomic():
+            model(**lookup, activations_count=count).save(trusted=True)
+    except IntegrityError:
+        rows.update(activations_count=F("activations_count") + count)
+
+
+def upsert_rollup(
+    db_connection: BaseDatabaseWrapper,
+    model: type[models.Model],
+    count: int,
+    lookup: dict[str, Any],
+) -> None:
+    # A single INSERT ... ON CONFLICT DO UPDATE on the lookup's unique
+    # constraint. bulk_create(update_conflicts=True) can only overwrite
+    # the stored count with the inserted one, not add them up.
+    opts = model._meta  # noqa: SLF001
+    counter = opts.get_field("activations_count")
+    fields = [opts.pk, *map(opts.get_field, lookup), counter]
+    values = [opts.pk.get_default(), *lookup.values(), count]
+
+    quote_name = db_connection.ops.quote_name
+    table = quote_name(opts.db_table)
+    columns = [quote_name(field.column) for field in fields]
+    counter_column = columns[-1]
+
+    # Identifiers come from the model, values are passed as parameters
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "  # noqa: S608
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(columns[1:-1])}) "
+        f"DO UPDATE SET {counter_column} = "
+        f"{table}.{counter_column} + EXCLUDED.{counter_column}"
+    )
+
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            [
+                field.get_db_prep_save(value, db_connection)
+                for field, value in zip(fields, values, strict=True)
+            ],
+        )
+
+
+def get_user_flags(
+    user: User,
+    promocode_ids: list[Any],
+) -> tuple[set[Any], set[Any]]:
+    """Return the ids among ``promocode_ids`` liked and activated by
+    ``user``, one IN query per relation or none on a flags cache hit.
+    """
+    if not promocode_ids:
+        return set(), set()
+
+    if settings.USER_FLAGS_CACHE:
+        flags = user_flags.get(user.pk)
+
+        if flags is None:
+            flags = (
+                frozenset(
+                    user.liked_promocodes.values_list(
+                        "promocode_id", flat=True
+                    )
+                ),
+                frozenset(
+                    user.activations.values_list("promocode_id", flat=True)
+                ),
+            )
+            user_flags.set(user.pk, *flags)
+
+        liked, activated = flags
+        return liked.intersection(promocode_ids), activated.intersection(
+            promocode_ids
+        )
+
+    return (
+        set(
+            PromocodeLike.objects.filter(
+                user=user, promocode_id__in=promocode_ids
+            ).values_list("promocode_id", flat=True)
+        ),
+        set(
+            PromocodeActivation.objects.filter(
+                user=user, promocode_id__in=promocode_ids
+            ).values_list("promocode_id", flat=True)
+        ),
+    )
+
+
+class PromocodeQuerySet(models.QuerySet):
+    def recount_counters(self) -> int:
+        actual_counters = {
+            "like_count": count_related(PromocodeLike, "promocode"),
+            "comment_count": count_related(PromocodeComment, "promocode"),
+            "used_count": count_related(PromocodeActivation, "promocode"),
+        }
+
+        drifted = self.alias(
+            **{
+                f"actual_{field}": value
+                for field, value in actual_counters.items()
+            }
+        ).filter(
+            functools.reduce(
+                operator.or_,
+                (
+                    ~Q(**{field: F(f"actual_{field}")})
+                    for field in actual_counters
+                ),
+            )
+        )
+
+        return self.model.objects.filter(pk__in=drifted.values("pk")).update(
+            **actual_counters
+        )
+
+    def delete(self) -> tuple[int, dict]:
+        with transaction.atomic():
+            promocode_ids = list(self.values_list("pk", flat=True))
+            deleted = super().delete()
+            feed_segments.invalidate(promocode_ids)
+
+        return deleted
+
+    def bulk_create_with_targets(
+        self,
+        promocodes: list["Promocode"],
+        batch_size: int,
+    ) -> None:
+        # bulk_create bypasses PromocodeTarget.save and Promocode.save, so
+        # the category index and unique code rows are inserted here too.
+        # Batches bound the size of each statement, they are all created
+        # or none is.
+        with transaction.atomic():
+            for start in range(0, len(promocodes), batch_size):
+                batch = promocodes[start : start + batch_size]
+
+                PromocodeTarget.objects.bulk_create(
+                    promocode.target for promocode in batch
+                )
+                self.bulk_create(batch)
+
+                PromocodeTargetCategory.objects.bulk_create(
+                    PromocodeTargetCategory(target=promocode.target, name=name)
+                    for promocode in batch
+                    for name in PromocodeTargetCategory.normalize(
+                        promocode.target.categories
+                    )
+                )
+                PromocodeUniqueCode.objects.bulk_create(
+                    PromocodeUniqueCode(
+                        promocode=promocode, code=code, position=position
+                    )
+                    for promocode in batch
+                    if promocode.mode == Promocode.ModeChoices.UNIQUE
+                    for position, code in enumerate(promocode.promo_unique)
+                )
+
+            feed_segments.invalidate(promocode.pk for promocode in promocodes)
+
+    def for_audience(self, age: int, country: Any) -> "PromocodeQuerySet":
+        return self.filter(
+            Q(target__age_from__isnull=True) | Q(target__age_from__lte=age),
+            Q(target__age_until__isnull=True) | Q(target__age_until__gte=age),
+            Q(target__country__isnull=True) | Q(target__country=country),
+        )
+
+    def for_view(self) -> "PromocodeQuerySet":
+        # Everything the promocode view schemas read, so mapping a page of
+        # promocodes never issues a query per row.
+        return self.select_related("business", "target").with_active()
+
+    def with_active(self) -> "PromocodeQuerySet":
+        current_date = get_current_date()
+
+        return self.alias(
+            promo_unique_total=Coalesce(JSONArrayLength("promo_unique"), 0),
+        ).annotate(
+            is_active=Case(
+                When(
+                    (
+                        Q(active_from__isnull=True)
+                        | Q(active_from__lte=current_date)
+                    )
+                    & (
+                        Q(active_until__isnull=True)
+                        | Q(active_until__gte=current_date)
+                    )
+                    & (
+                        Q(
+                            mode=Promocode.ModeChoices.COMMON,
+                            used_count__lt=F("max_count"),
+                        )
+                        | Q(
+                            mode=Promocode.ModeChoices.UNIQUE,
+                            promo_unique_total__gt=F("used_count"),
+                        )
+                    ),
+                    then=True,
+                ),
+                default=False,
+                output_field=BooleanField(),
+            ),
+        )
+
 
 class Promocode(BaseModel):
     class ModeChoices(models.TextChoices):
@@ -92,16 +412,90 @@ class Promocode(BaseModel):
         default=list,
         validators=[PromocodeUniqueValidator()],
     )
-    promo_unique_activated = models.JSONField(
-        blank=True,
-        null=True,
-        default=list,
-    )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by saves and stock exhaustion, see apps.promo.targeting
+    updated_at = models.DateTimeField(auto_now=True)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    used_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PromocodeQuerySet.as_manager()
+
+    COUNTER_FIELDS = ("like_count", "comment_count", "used_count")
 
     def __str__(self) -> str:
         return str(self.id)
 
+    class Meta:
+        # Lists are sorted by (created_at, pk) descending, see paginate
+        indexes = (
+            models.Index(
+                fields=["business", "created_at", "id"],
+                name="promo_business_created_idx",
+            ),
+            models.Index(
+                fields=["created_at", "id"],
+                name="promo_created_idx",
+            ),
+            models.Index(
+                fields=["updated_at"],
+                name="promo_updated_idx",
+            ),
+        )
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        # Counters are only changed through F-expressions, so a regular
+        # save must never write back a possibly stale in-memory value.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+
+        adding = self._state.adding
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding and self.mode == self.ModeChoices.UNIQUE:
+                PromocodeUniqueCode.objects.bulk_create(
+                    PromocodeUniqueCode(
+                        promocode=self, code=code, position=position
+                    )
+                    for position, code in enumerate(self.promo_unique)
+                )
+
+            feed_segments.invalidate([self.pk])
+
+    def delete(self, *args: Any, **kwargs: Any) -> tuple[int, dict]:
+        with transaction.atomic():
+            feed_segments.invalidate([self.pk])
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def increment_counter(
+        cls, promocode_id: Any, field: str, delta: int = 1
+    ) -> None:
+        promocodes = cls.objects.filter(pk=promocode_id)
+
+        if delta < 0:
+            promocodes = promocodes.filter(**{f"{field}__gte": -delta})
+
+        promocodes.update(**{field: F(field) + delta})
+
+    @classmethod
+    def reserve_activation(cls, promocode_id: Any) -> bool:
+        # A single conditional UPDATE, so concurrent activations are
+        # serialized by the row lock and can never oversell max_count.
+        return bool(
+            cls.objects.filter(
+                pk=promocode_id,
+                used_count__lt=F("max_count"),
+            ).update(used_count=F("used_count") + 1)
+        )
+
     def clean(self) -> None:
         super().clean()
 
@@ -122,7 +516,7 @@ class Promocode(BaseModel):
                     "promo_unique": "Field must be empty for COMMON mode.",
                 }
                 raise ValidationError(err)
-            if self.max_count < self.activations.count():
+            if self.max_count < self.used_count:
                 err = {
                     "max_count": "Activations count is bigger than max_count",
                 }
@@ -146,44 +540,115 @@ class Promocode(BaseModel):
 
         PromocodeDurationValidator()(self)
 
-    def activate_promocode(self, user: User) -> str:
+    def activate_promocode(self, user: User) -> str | None:
         promocode: str | None = None
 
-        if self.mode == self.ModeChoices.COMMON:
-            promocode = self.promo_common
-        elif self.mode == self.ModeChoices.UNIQUE:
-            unused_promocodes = self.promo_unique[
-                len(self.promo_unique_activated) : :
-            ]
-            promocode = unused_promocodes[0]
-            self.promo_unique_activated.append(promocode)
-            self.save()
-
-        PromocodeActivation.objects.create(promocode=self, user=user)
+        with transaction.atomic():
+            if self.mode == self.ModeChoices.COMMON:
+                if not Promocode.reserve_activation(self.pk):
+                    return None
+                promocode = self.promo_common
+            elif self.mode == self.ModeChoices.UNIQUE:
+                promocode = PromocodeUniqueCode.claim(self, user)
+                if promocode is None:
+                    return None
+                Promocode.increment_counter(self.pk, "used_count")
+
+            PromocodeActivation(
+                promocode=self, user=user, code=promocode
+            ).save(trusted=True)
+
+            # The last activation takes the promocode out of active feeds
+            if not (
+                Promocode.objects.with_active()
+                .filter(pk=self.pk, is_active=True)
+                .exists()
+            ):
+                Promocode.objects.filter(pk=self.pk).update(
+                    updated_at=timezone.now()
+                )
+                feed_segments.invalidate([self.pk])
 
         return promocode
 
     @property
     def active(self) -> bool:
-        timezone_utc3 = pytz.timezone("Europe/Moscow")
-        current_date = datetime.now(timezone_utc3).date()
+        if "is_active" in self.__dict__:
+            return self.is_active
+
+        current_date = get_current_date()
 
         is_active_by_date = (
             self.active_from is None or self.active_from <= current_date
         ) and (self.active_until is None or self.active_until >= current_date)
 
         if self.mode == self.ModeChoices.COMMON:
-            is_active_by_mode = self.activations.count() < self.max_count
+            is_active_by_mode = self.used_count < self.max_count
         elif self.mode == self.ModeChoices.UNIQUE:
-            is_active_by_mode = len(self.promo_unique) > len(
-                self.promo_unique_activated
-                if self.promo_unique_activated
-                else []
-            )
+            is_active_by_mode = len(self.promo_unique or []) > self.used_count
 
         return is_active_by_date and is_active_by_mode
 
 
+class PromocodeUniqueCode(BaseModel):
+    promocode = models.ForeignKey(
+        Promocode,
+        on_delete=models.CASCADE,
+        related_name="unique_codes",
+    )
+    code = models.CharField(max_length=MAX_UNIQUE_PROMOCODE_LEN)
+    position = models.PositiveIntegerField()
+    activated_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="unique_codes",
+    )
+    activated_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f"{self.promocode.id} | {self.code}"
+
+    class Meta:
+        unique_together = ("promocode", "position")
+        indexes = (
+            # Only codes that can still be claimed, see claim
+            models.Index(
+                fields=["promocode", "position"],
+                condition=Q(activated_at__isnull=True),
+                name="promo_code_unused_idx",
+            ),
+        )
+
+    @classmethod
+    def claim(cls, promocode: Promocode, user: User) -> str | None:
+        # Must run inside a transaction. Rows locked by concurrent claims
+        # are skipped where the database supports it, the conditional
+        # update below keeps the claim atomic everywhere else.
+        unused_codes = cls.objects.filter(
+            promocode=promocode,
+            activated_at__isnull=True,
+        ).order_by("position")
+
+        if connection.features.has_select_for_update_skip_locked:
+            unused_codes = unused_codes.select_for_update(skip_locked=True)
+
+        while True:
+            unique_code = unused_codes.only("id", "code").first()
+
+            if unique_code is None:
+                return None
+
+            claimed = cls.objects.filter(
+                pk=unique_code.pk,
+                activated_at__isnull=True,
+            ).update(activated_by=user, activated_at=timezone.now())
+
+            if claimed:
+                return unique_code.code
+
+
 class PromocodeActivation(BaseModel):
     promocode = models.ForeignKey(
         Promocode,
@@ -196,10 +661,99 @@ class PromocodeActivation(BaseModel):
         related_name="activations",
     )
     timestamp = models.DateTimeField(auto_now_add=True)
+    code = models.CharField(max_length=MAX_UNIQUE_PROMOCODE_LEN, blank=True)
 
     def __str__(self) -> str:
         return f"{self.promocode.id} | {self.user.id}"
 
+    class Meta:
+        indexes = (
+            # is_activated_by_user lookups
+            models.Index(
+                fields=["promocode", "user"],
+                name="promo_activation_user_idx",
+            ),
+            # Activations history of a user
+            models.Index(
+                fields=["user", "timestamp", "id"],
+                name="promo_activation_history_idx",
+            ),
+            # Activations export of a promocode
+            models.Index(
+                fields=["promocode", "timestamp", "id"],
+                name="promo_activation_export_idx",
+            ),
+        )
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        adding = self._state.adding
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding:
+                self.update_rollups()
+                user_flags.invalidate(self.user_id)
+
+    def update_rollups(self) -> None:
+        if self.user.country:
+            increment_rollup(
+                PromocodeCountryStat,
+                promocode_id=self.promocode_id,
+                country=self.user.country.code,
+            )
+
+        increment_rollup(
+            PromocodeActivationBucket,
+            promocode_id=self.promocode_id,
+            bucket_size=PromocodeActivationBucket.SizeChoices.HOUR,
+            bucket_start=self.timestamp.replace(
+                minute=0, second=0, microsecond=0
+            ),
+        )
+
+
+class PromocodeCountryStat(BaseModel):
+    # Activations per promocode and country of the user at activation
+    # time, kept up to date by PromocodeActivation.save.
+    promocode = models.ForeignKey(
+        Promocode,
+        on_delete=models.CASCADE,
+        related_name="country_stats",
+    )
+    country = models.CharField(max_length=2)
+    activations_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.promocode.id} | {self.country}"
+
+    class Meta:
+        unique_together = ("promocode", "country")
+
+
+class PromocodeActivationBucket(BaseModel):
+    # Activations per promocode and time bucket. Hourly buckets are kept
+    # up to date by PromocodeActivation.save, compact_activation_buckets
+    # merges old ones into daily buckets.
+    class SizeChoices(models.TextChoices):
+        HOUR = "HOUR"
+        DAY = "DAY"
+
+    promocode = models.ForeignKey(
+        Promocode,
+        on_delete=models.CASCADE,
+        related_name="activation_buckets",
+    )
+    bucket_size = models.CharField(max_length=4, choices=SizeChoices)
+    bucket_start = models.DateTimeField()
+    activations_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.promocode.id} | {self.bucket_size} {self.bucket_start}"
+
+    class Meta:
+        unique_together = ("promocode", "bucket_size", "bucket_start")
+
 
 class PromocodeComment(BaseModel):
     promocode = models.ForeignKey(
@@ -221,6 +775,30 @@ class PromocodeComment(BaseModel):
     def __str__(self) -> str:
         return f"{self.promocode.id} | {self.author.id}"
 
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["promocode", "date", "id"],
+                name="promo_comment_date_idx",
+            ),
+        )
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        adding = self._state.adding
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding:
+                Promocode.increment_counter(self.promocode_id, "comment_count")
+
+    def delete(self, *args: Any, **kwargs: Any) -> tuple[int, dict]:
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Promocode.increment_counter(self.promocode_id, "comment_count", -1)
+
+        return deleted
+
 
 class PromocodeLike(BaseModel):
     promocode = models.ForeignKey(
@@ -235,3 +813,21 @@ class PromocodeLike(BaseModel):
 
     class Meta:
         unique_together = ("promocode", "user")
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        adding = self._state.adding
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding:
+                Promocode.increment_counter(self.promocode_id, "like_count")
+                user_flags.invalidate(self.user_id)
+
+    def delete(self, *args: Any, **kwargs: Any) -> tuple[int, dict]:
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Promocode.increment_counter(self.promocode_id, "like_count", -1)
+            user_flags.invalidate(self.user_id)
+
+        return deleted
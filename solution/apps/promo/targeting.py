@@ -0,0 +1,362 @@
+import threading
+import time
+import uuid
+from array import array
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+from datetime import date, datetime
+from typing import Any
+
+from django.conf import settings
+from django.db.models.functions import Coalesce
+
+from apps.core.functions import JSONArrayLength
+from apps.promo.feed import feed_segments
+from apps.promo.models import Promocode, PromocodeTargetCategory
+
+MAX_AGE = 100
+
+# Beyond this many generations since the last sync a rebuild is cheaper
+# than reading their changes
+MAX_SYNC_GENERATIONS = 1000
+
+TARGETING_VALUES = (
+    "pk",
+    "created_at",
+    "target__age_from",
+    "target__age_until",
+    "target__country",
+    "target__categories",
+    "active_from",
+    "active_until",
+    "mode",
+    "max_count",
+    "used_count",
+    "promo_unique_total",
+)
+
+
+def collect_bits(
+    size: int,
+    pairs: Iterable[tuple[int, Hashable]],
+) -> dict[Hashable, int]:
+    # One bitset per key with the bits of its slots set, built in byte
+    # buffers since OR-ing into growing ints is quadratic.
+    buffers: dict[Hashable, bytearray] = defaultdict(
+        lambda: bytearray((size + 7) // 8)
+    )
+    for slot, key in pairs:
+        buffers[key][slot >> 3] |= 1 << (slot & 7)
+
+    return {
+        key: int.from_bytes(buffer, "little")
+        for key, buffer in buffers.items()
+    }
+
+
+def iter_bits(bits: int) -> list[int]:
+    binary = bin(bits)[:1:-1]
+    slots = []
+
+    slot = binary.find("1")
+    while slot != -1:
+        slots.append(slot)
+        slot = binary.find("1", slot + 1)
+
+    return slots
+
+
+class TargetingIndex:
+    """Per-process index of the targeting rules of every promocode.
+
+    Each promocode gets a slot in arrays of its targeting columns. Bitsets
+    (plain ints) over the slots hold the promocodes with ``age_from <= a``
+    and ``age_until >= a`` for every age, and the promocodes of every
+    country and category, so the promocodes a user can see are a few ANDs
+    away.
+
+    ``sync`` runs whenever the feed generation, which every promocode
+    write bumps, has changed. It reloads the promocodes the writes since
+    the last sync recorded as changed and drops the deleted ones, or
+    rebuilds the index when some of those changes are no longer known.
+    The index is also rebuilt every ``full_refresh_interval`` seconds,
+    which picks up writes made outside the models.
+    """
+
+    def __init__(self, full_refresh_interval: float) -> None:
+        self.full_refresh_interval = full_refresh_interval
+
+        self._lock = threading.Lock()
+        self.rebuilt_at: float | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.slots: dict[uuid.UUID, int] = {}
+        self.ids: list[uuid.UUID] = []
+        self.created_at: list[datetime] = []
+        self.age_from = array("B")
+        self.age_until = array("B")
+        self.countries: list[str | None] = []
+        self.categories: list[set[str]] = []
+        self.active_from: list[date | None] = []
+        self.active_until: list[date | None] = []
+        self.exhausted = array("B")
+
+        self.age_from_bits = [0] * (MAX_AGE + 1)
+        self.age_until_bits = [0] * (MAX_AGE + 1)
+        self.country_bits: dict[str, int] = {}
+        self.any_country_bits = 0
+        self.category_bits: dict[str, int] = {}
+        self.exhausted_bits = 0
+        self._active_bits: tuple[date, int] | None = None
+
+        self.generation: int | None = None
+
+    def sync(self) -> None:
+        # Read first, rows loaded below include every write up to it
+        generation = feed_segments.get_generation()
+        now = time.monotonic()
+
+        with self._lock:
+            changed = None
+            if (
+                self.rebuilt_at is not None
+                and now - self.rebuilt_at <= self.full_refresh_interval
+            ):
+                if generation == self.generation:
+                    return
+
+                changed = feed_segments.get_changes(
+                    self.generation, generation, MAX_SYNC_GENERATIONS
+                )
+
+            promocodes = Promocode.objects.annotate(
+                promo_unique_total=Coalesce(JSONArrayLength("promo_unique"), 0)
+            )
+
+            if changed is None:
+                self._reset()
+                self.rebuilt_at = now
+
+                for row in promocodes.values_list(*TARGETING_VALUES):
+                    self._set_slot(row)
+                self._build_bits()
+            else:
+                deleted = {pk for pk in changed if pk in self.slots}
+                for row in promocodes.filter(pk__in=changed).values_list(
+                    *TARGETING_VALUES
+                ):
+                    self._update(row)
+                    deleted.discard(row[0])
+
+                for pk in deleted:
+                    self._remove(pk)
+
+            self.generation = generation
+
+    def reset(self) -> None:
+        """Rebuild the index on the next sync."""
+        with self._lock:
+            self.rebuilt_at = None
+
+    def _set_slot(self, row: tuple[Any, ...]) -> int:
+        (
+            pk,
+            created_at,
+            age_from,
+            age_until,
+            country,
+            categories,
+            active_from,
+            active_until,
+            mode,
+            max_count,
+            used_count,
+            promo_unique_total,
+        ) = row
+
+        slot = self.slots.get(pk)
+        if slot is None:
+            slot = self.slots[pk] = len(self.ids)
+            self.ids.append(pk)
+            self.created_at.append(created_at)
+            self.age_from.append(0)
+            self.age_until.append(0)
+            self.countries.append(None)
+            self.categories.append(set())
+            self.active_from.append(None)
+            self.active_until.append(None)
+            self.exhausted.append(0)
+
+        if mode == Promocode.ModeChoices.COMMON:
+            stock = max_count
+        else:
+            stock = promo_unique_total
+
+        self.age_from[slot] = 0 if age_from is None else age_from
+        self.age_until[slot] = MAX_AGE if age_until is None else age_until
+        self.countries[slot] = country or None
+        self.categories[slot] = PromocodeTargetCategory.normalize(categories)
+        self.active_from[slot] = active_from
+        self.active_until[slot] = active_until
+        self.exhausted[slot] = used_count >= stock
+
+        return slot
+
+    def _build_bits(self) -> None:
+        size = len(self.ids)
+
+        exact_from = collect_bits(size, enumerate(self.age_from))
+        exact_until = collect_bits(size, enumerate(self.age_until))
+        bits = 0
+        for age in range(MAX_AGE + 1):
+            bits |= exact_from.get(age, 0)
+            self.age_from_bits[age] = bits
+        bits = 0
+        for age in reversed(range(MAX_AGE + 1)):
+            bits |= exact_until.get(age, 0)
+            self.age_until_bits[age] = bits
+
+        countries = collect_bits(size, enumerate(self.countries))
+        self.any_country_bits = countries.pop(None, 0)
+        self.country_bits = countries
+
+        self.category_bits = collect_bits(
+            size,
+            (
+                (slot, category)
+                for slot, categories in enumerate(self.categories)
+                for category in categories
+            ),
+        )
+
+        self.exhausted_bits = collect_bits(
+            size, enumerate(self.exhausted)
+        ).get(1, 0)
+
+    def _update(self, row: tuple[Any, ...]) -> None:
+        slot = self.slots.get(row[0])
+        if slot is not None:
+            self._toggle_bits(slot, on=False)
+
+        slot = self._set_slot(row)
+        self._toggle_bits(slot, on=True)
+        self._active_bits = None
+
+    def _remove(self, pk: uuid.UUID) -> None:
+        # The slot stays allocated with its bits cleared until the rebuild
+        slot = self.slots.pop(pk)
+        self._toggle_bits(slot, on=False)
+        self._active_bits = None
+
+    def _toggle_bits(self, slot: int, *, on: bool) -> None:
+        bit = 1 << slot
+
+        def toggle(bits: int) -> int:
+            return bits | bit if on else bits & ~bit
+
+        for age in range(self.age_from[slot], MAX_AGE + 1):
+            self.age_from_bits[age] = toggle(self.age_from_bits[age])
+        for age in range(self.age_until[slot] + 1):
+            self.age_until_bits[age] = toggle(self.age_until_bits[age])
+
+        country = self.countries[slot]
+        if country is None:
+            self.any_country_bits = toggle(self.any_country_bits)
+        else:
+            self.country_bits[country] = toggle(
+                self.country_bits.get(country, 0)
+            )
+
+        for category in self.categories[slot]:
+            self.category_bits[category] = toggle(
+                self.category_bits.get(category, 0)
+            )
+
+        if self.exhausted[slot]:
+            self.exhausted_bits = toggle(self.exhausted_bits)
+
+    def _get_active_bits(self, current_date: date) -> int:
+        # Same rules as PromocodeQuerySet.with_active
+        if self._active_bits is None or self._active_bits[0] != current_date:
+            active_by_date = collect_bits(
+                len(self.ids),
+                (
+                    (slot, True)
+                    for slot, (active_from, active_until) in enumerate(
+                        zip(self.active_from, self.active_until, strict=True)
+                    )
+                    if (active_from is None or active_from <= current_date)
+                    and (active_until is None or active_until >= current_date)
+                ),
+            ).get(True, 0)
+
+            self._active_bits = (
+                current_date,
+                active_by_date & ~self.exhausted_bits,
+            )
+
+        return self._active_bits[1]
+
+    def can_see(
+        self,
+        promocode_id: Any,
+        age: int,
+        country: str,
+    ) -> bool | None:
+        """Whether a promocode targets a user, None if it isn't indexed."""
+        self.sync()
+
+        with self._lock:
+            slot = self.slots.get(uuid.UUID(str(promocode_id)))
+            if slot is None:
+                return None
+
+            return self.age_from[slot] <= age <= self.age_until[slot] and (
+                self.countries[slot] in (None, country)
+            )
+
+    def get_feed_keys(
+        self,
+        current_date: date,
+        age: int,
+        country: str,
+        category: str | None,
+        active: bool | None,
+        limit: int | None = None,
+    ) -> list[tuple[datetime, uuid.UUID]]:
+        """Return ``(created_at, pk)`` of the promocodes the feed shows to
+        a user, newest first like the feed query.
+        """
+        self.sync()
+
+        with self._lock:
+            if not 0 <= age <= MAX_AGE:
+                return []
+
+            bits = (
+                self.age_from_bits[age]
+                & self.age_until_bits[age]
+                & (self.any_country_bits | self.country_bits.get(country, 0))
+            )
+
+            if category is not None:
+                bits &= self.category_bits.get(category, 0)
+
+            if active is not None:
+                active_bits = self._get_active_bits(current_date)
+                bits &= active_bits if active else ~active_bits
+
+            keys = [
+                (self.created_at[slot], self.ids[slot])
+                for slot in iter_bits(bits)
+            ]
+
+        keys.sort(reverse=True)
+
+        return keys[:limit]
+
+
+targeting_index = TargetingIndex(
+    full_refresh_interval=settings.TARGETING_INDEX_FULL_REFRESH_INTERVAL,
+)
@@ -0,0 +1,790 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.apps.registry import Apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.utils import timezone
+
+from apps.business.models import Business
+from apps.promo.feed import feed_segments, get_queryset_keys
+from apps.promo.models import (
+    Promocode,
+    PromocodeActivation,
+    PromocodeActivationBucket,
+    PromocodeComment,
+    PromocodeCountryStat,
+    PromocodeLike,
+    PromocodeTarget,
+    PromocodeUniqueCode,
+    get_current_date,
+    increment_rollup,
+)
+from apps.promo.targeting import targeting_index
+from apps.user.models import User
+
+
+def create_business() -> Business:
+    business = Business(
+        name="Business",
+        email="business@mail.com",
+        password="SuperStrongPassword2000!",
+    )
+    business.save()
+    return business
+
+
+def create_users(count: int) -> list[User]:
+    users = []
+    for i in range(count):
+        user = User(
+            name="Steve",
+            surname="Jobs",
+            email=f"user{i}@apple.com",
+            age=30,
+            country="ru",
+            country_raw="ru",
+            password="WhoLiveSInCalifornia2000!",
+        )
+        user.save()
+        users.append(user)
+    return users
+
+
+def create_promocode(business: Business, **fields: object) -> Promocode:
+    target = PromocodeTarget()
+    target.save()
+
+    promocode = Promocode(
+        business=business,
+        target=target,
+        description="Promocode for concurrency tests",
+        **fields,
+    )
+    promocode.save()
+    return promocode
+
+
+def create_targeted_promocode(
+    business: Business,
+    target: dict[str, object],
+    **fields: object,
+) -> Promocode:
+    target = PromocodeTarget(**target)
+    target.save()
+
+    promocode = Promocode(
+        business=business,
+        target=target,
+        description="Promocode for targeting tests",
+        mode=Promocode.ModeChoices.COMMON,
+        promo_common="sale-10",
+        **{"max_count": 10, **fields},
+    )
+    promocode.save()
+    return promocode
+
+
+class PromocodeActivationTests(TestCase):
+    def setUp(self) -> None:
+        self.business = create_business()
+        self.users = create_users(6)
+
+    def test_common_activation_refused_when_stock_is_exhausted(self) -> None:
+        promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=3,
+        )
+
+        # The same stale instance is reused on purpose: the stock check
+        # must happen in the database, not on the in-memory counter.
+        results = [promocode.activate_promocode(user) for user in self.users]
+
+        self.assertEqual(results.count("sale-10"), 3)
+        self.assertEqual(results.count(None), 3)
+        promocode.refresh_from_db()
+        self.assertEqual(promocode.used_count, 3)
+        self.assertEqual(promocode.activations.count(), 3)
+        self.assertEqual(
+            list(
+                promocode.country_stats.values_list(
+                    "country", "activations_count"
+                )
+            ),
+            [("RU", 3)],
+        )
+
+    def test_unique_activation_issues_each_code_once(self) -> None:
+        promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.UNIQUE,
+            promo_unique=["code-1", "code-2", "code-3"],
+            max_count=1,
+        )
+
+        results = [promocode.activate_promocode(user) for user in self.users]
+
+        self.assertEqual(results, ["code-1", "code-2", "code-3"] + [None] * 3)
+        self.assertCountEqual(
+            promocode.activations.values_list("code", flat=True),
+            ["code-1", "code-2", "code-3"],
+        )
+        promocode.refresh_from_db()
+        self.assertEqual(promocode.used_count, 3)
+        self.assertFalse(promocode.active)
+
+
+class PromocodeBulkCreateTests(TestCase):
+    def test_bulk_create_matches_single_save(self) -> None:
+        business = create_business()
+        promocodes = [
+            Promocode(
+                business=business,
+                target=PromocodeTarget(categories=["Cats", "dogs"]),
+                description="Bulk common promocode",
+                mode=Promocode.ModeChoices.COMMON,
+                promo_common="bulk-sale",
+                max_count=10,
+            ),
+            Promocode(
+                business=business,
+                target=PromocodeTarget(),
+                description="Bulk unique promocode",
+                mode=Promocode.ModeChoices.UNIQUE,
+                promo_unique=["code-1", "code-2"],
+                max_count=1,
+            ),
+        ]
+
+        Promocode.objects.bulk_create_with_targets(promocodes, batch_size=1)
+
+        self.assertEqual(
+            Promocode.objects.filter(
+                target__category_index__name="cats"
+            ).get(),
+            promocodes[0],
+        )
+        self.assertEqual(
+            promocodes[1].activate_promocode(create_users(1)[0]),
+            "code-1",
+        )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeCounterTests(TestCase):
+    def setUp(self) -> None:
+        self.users = create_users(3)
+        self.promocode = create_promocode(
+            create_business(),
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=10,
+        )
+
+    def get_counters(self) -> tuple[int, int, int]:
+        self.promocode.refresh_from_db()
+
+        return tuple(
+            getattr(self.promocode, field)
+            for field in Promocode.COUNTER_FIELDS
+        )
+
+    def test_counters_follow_likes_comments_and_activations(self) -> None:
+        likes = []
+        comments = []
+        for user in self.users:
+            like = PromocodeLike(promocode=self.promocode, user=user)
+            like.save()
+            likes.append(like)
+
+            comment = PromocodeComment(
+                promocode=self.promocode,
+                author=user,
+                text="Counted comment",
+            )
+            comment.save()
+            comments.append(comment)
+
+        self.promocode.activate_promocode(self.users[0])
+        self.assertEqual(self.get_counters(), (3, 3, 1))
+
+        likes[0].delete()
+        comments[0].delete()
+        comments[1].delete()
+
+        # Editing a comment doesn't count it again
+        comments[2].text = "Edited counted comment"
+        comments[2].save()
+
+        self.assertEqual(self.get_counters(), (2, 1, 1))
+        self.assertEqual(Promocode.objects.recount_counters(), 0)
+
+    def test_decrement_never_goes_below_zero(self) -> None:
+        like = PromocodeLike(promocode=self.promocode, user=self.users[0])
+        like.save()
+        Promocode.objects.filter(pk=self.promocode.pk).update(like_count=0)
+
+        like.delete()
+        Promocode.increment_counter(self.promocode.pk, "comment_count", -1)
+
+        self.assertEqual(self.get_counters(), (0, 0, 0))
+
+    def test_recount_repairs_drift(self) -> None:
+        PromocodeLike(promocode=self.promocode, user=self.users[0]).save()
+        self.promocode.activate_promocode(self.users[0])
+        Promocode.objects.filter(pk=self.promocode.pk).update(
+            like_count=5, comment_count=2, used_count=0
+        )
+
+        output = StringIO()
+        call_command("recount_promocode_counters", stdout=output)
+
+        self.assertIn("Repaired counters of 1 promocodes", output.getvalue())
+        self.assertEqual(self.get_counters(), (1, 0, 1))
+        self.assertEqual(Promocode.objects.recount_counters(), 0)
+
+
+class PromocodeUniqueCodeTests(TestCase):
+    def setUp(self) -> None:
+        self.users = create_users(3)
+        self.promocode = create_promocode(
+            create_business(),
+            mode=Promocode.ModeChoices.UNIQUE,
+            promo_unique=["code-0", "code-1", "code-2"],
+            max_count=1,
+        )
+
+    def test_claim_takes_the_lowest_free_position(self) -> None:
+        self.promocode.unique_codes.filter(position=1).update(
+            activated_at=timezone.now()
+        )
+
+        self.assertEqual(
+            PromocodeUniqueCode.claim(self.promocode, self.users[0]),
+            "code-0",
+        )
+        self.assertEqual(
+            PromocodeUniqueCode.claim(self.promocode, self.users[1]),
+            "code-2",
+        )
+        self.assertEqual(
+            self.promocode.unique_codes.get(position=2).activated_by,
+            self.users[1],
+        )
+
+    def test_claim_returns_none_when_codes_run_out(self) -> None:
+        claimed = [
+            PromocodeUniqueCode.claim(self.promocode, user)
+            for user in self.users
+        ]
+
+        self.assertEqual(claimed, ["code-0", "code-1", "code-2"])
+        self.assertIsNone(
+            PromocodeUniqueCode.claim(self.promocode, self.users[0])
+        )
+
+
+class PromocodeActivationBucketTests(TestCase):
+    def test_each_rollup_is_a_single_statement(self) -> None:
+        promocode = create_promocode(
+            create_business(),
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=10,
+        )
+        promocode.activate_promocode(create_users(1)[0])
+        activation = promocode.activations.select_related("user").get()
+
+        # Country and hour rollup, each an existing row this time
+        with self.assertNumQueries(2):
+            activation.update_rollups()
+
+        self.assertEqual(
+            list(
+                promocode.country_stats.values_list(
+                    "country", "activations_count"
+                )
+            ),
+            [("RU", 2)],
+        )
+        self.assertEqual(
+            list(
+                promocode.activation_buckets.values_list(
+                    "bucket_size", "activations_count"
+                )
+            ),
+            [(PromocodeActivationBucket.SizeChoices.HOUR, 2)],
+        )
+
+    def test_rollup_without_upsert_support(self) -> None:
+        promocode = create_promocode(
+            create_business(),
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=10,
+        )
+
+        with mock.patch.object(
+            connection.features, "supports_update_conflicts_with_target", False
+        ):
+            for count in (1, 2):
+                increment_rollup(
+                    PromocodeCountryStat,
+                    count=count,
+                    promocode_id=promocode.pk,
+                    country="US",
+                )
+
+        self.assertEqual(
+            list(
+                promocode.country_stats.values_list(
+                    "country", "activations_count"
+                )
+            ),
+            [("US", 3)],
+        )
+
+    def test_old_hourly_buckets_are_compacted_into_days(self) -> None:
+        promocode = create_promocode(
+            create_business(),
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="sale-10",
+            max_count=10,
+        )
+        promocode.activate_promocode(create_users(1)[0])
+        day = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) - timedelta(days=60)
+        for hour in (1, 5, 5 + 24):
+            increment_rollup(
+                PromocodeActivationBucket,
+                count=2,
+                promocode_id=promocode.pk,
+                bucket_size=PromocodeActivationBucket.SizeChoices.HOUR,
+                bucket_start=day + timedelta(hours=hour),
+            )
+
+        call_command("compact_activation_buckets", stdout=StringIO())
+
+        self.assertCountEqual(
+            promocode.activation_buckets.values_list(
+                "bucket_size", "bucket_start", "activations_count"
+            ),
+            [
+                ("DAY", day, 4),
+                ("DAY", day + timedelta(days=1), 2),
+                (
+                    "HOUR",
+                    promocode.activations.get().timestamp.replace(
+                        minute=0, second=0, microsecond=0
+                    ),
+                    1,
+                ),
+            ],
+        )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class TargetingIndexTests(TestCase):
+    def setUp(self) -> None:
+        targeting_index.reset()
+
+        self.business = create_business()
+        self.users = create_users(3)
+        for user, age, country in zip(
+            self.users, (15, 30, 70), ("ru", "us", "kz"), strict=True
+        ):
+            user.age, user.country = age, country
+            user.save()
+
+        past = timezone.now().date() - timedelta(days=10)
+        self.promocodes = [
+            create_targeted_promocode(self.business, {}),
+            create_targeted_promocode(
+                self.business,
+                {"age_from": 18, "country": "ru", "categories": ["Cats"]},
+            ),
+            create_targeted_promocode(
+                self.business,
+                {"age_until": 25, "country": "us", "categories": ["dogs"]},
+            ),
+            create_targeted_promocode(
+                self.business,
+                {"age_from": 20, "age_until": 40, "categories": ["cats"]},
+            ),
+            create_targeted_promocode(self.business, {}, active_until=past),
+            create_targeted_promocode(self.business, {}, max_count=1),
+        ]
+        self.promocodes[-1].activate_promocode(self.users[0])
+
+    def test_feed_keys_match_orm(self) -> None:
+        current_date = get_current_date()
+
+        for user in self.users:
+            for category in (None, "cats", "dogs"):
+                for active in (None, True, False):
+                    promocodes = Promocode.objects.for_audience(
+                        user.age, user.country
+                    ).with_active()
+                    if category:
+                        promocodes = promocodes.filter(
+                            target__category_index__name=category
+                        )
+                    if active is not None:
+                        promocodes = promocodes.filter(is_active=active)
+
+                    self.assertEqual(
+                        targeting_index.get_feed_keys(
+                            current_date,
+                            user.age,
+                            user.country.code,
+                            category,
+                            active,
+                        ),
+                        get_queryset_keys(promocodes),
+                    )
+
+    def test_can_see_matches_orm(self) -> None:
+        for user in self.users:
+            for promocode in self.promocodes:
+                self.assertEqual(
+                    targeting_index.can_see(
+                        promocode.id, user.age, user.country.code
+                    ),
+                    Promocode.objects.for_audience(user.age, user.country)
+                    .filter(pk=promocode.pk)
+                    .exists(),
+                )
+
+    def test_sync_reloads_only_changes(self) -> None:
+        promocode = self.promocodes[1]
+        user = self.users[1]
+        targeting_index.sync()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                targeting_index.can_see(
+                    promocode.id, user.age, user.country.code
+                )
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promocode.target.country = "us"
+            promocode.target.save()
+            promocode.save()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                targeting_index.can_see(
+                    promocode.id, user.age, user.country.code
+                )
+            )
+
+    def test_target_edit_alone_is_synced(self) -> None:
+        promocode = self.promocodes[1]
+        user = self.users[1]
+        targeting_index.sync()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promocode.target.country = "us"
+            promocode.target.save()
+
+        self.assertTrue(
+            targeting_index.can_see(promocode.id, user.age, user.country.code)
+        )
+
+    def test_deleted_promocodes_are_dropped(self) -> None:
+        user = self.users[1]
+        deleted_ids = [self.promocodes[0].pk, self.promocodes[3].pk]
+        targeting_index.sync()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocodes[0].delete()
+            Promocode.objects.filter(pk=deleted_ids[1]).delete()
+
+        self.assertEqual(
+            targeting_index.get_feed_keys(
+                get_current_date(), user.age, user.country.code, None, None
+            ),
+            get_queryset_keys(
+                Promocode.objects.for_audience(user.age, user.country)
+            ),
+        )
+        for promocode_id in deleted_ids:
+            self.assertIsNone(
+                targeting_index.can_see(
+                    promocode_id, user.age, user.country.code
+                )
+            )
+
+    def test_unknown_changes_rebuild_the_index(self) -> None:
+        promocode = self.promocodes[1]
+        user = self.users[1]
+        targeting_index.sync()
+
+        # A write whose changes expired before this process synced
+        with self.captureOnCommitCallbacks(execute=True):
+            PromocodeTarget.objects.filter(pk=promocode.target_id).update(
+                country="US"
+            )
+            feed_segments.invalidate([promocode.pk])
+        cache.delete(
+            feed_segments.get_changes_key(feed_segments.get_generation())
+        )
+
+        self.assertTrue(
+            targeting_index.can_see(promocode.id, user.age, user.country.code)
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class PromocodeConcurrentActivationTests(TransactionTestCase):
+    WORKERS = 20
+
+    def setUp(self) -> None:
+        self.business = create_business()
+        self.users = create_users(self.WORKERS)
+
+    def activate_in_parallel(self, promocode: Promocode) -> list[str | None]:
+        barrier = threading.Barrier(self.WORKERS)
+        results = [None] * self.WORKERS
+
+        def activate(index: int) -> None:
+            try:
+                instance = Promocode.objects.get(pk=promocode.pk)
+                barrier.wait()
+                results[index] = instance.activate_promocode(self.users[index])
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=activate, args=(i,))
+            for i in range(self.WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_common_promocode_is_not_oversold(self) -> None:
+        promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.COMMON,
+            promo_common="flash-sale",
+            max_count=5,
+        )
+
+        results = self.activate_in_parallel(promocode)
+
+        self.assertEqual(results.count("flash-sale"), 5)
+        promocode.refresh_from_db()
+        self.assertEqual(promocode.used_count, 5)
+        self.assertEqual(
+            PromocodeActivation.objects.filter(promocode=promocode).count(),
+            5,
+        )
+
+    def test_unique_codes_are_not_issued_twice(self) -> None:
+        codes = [f"code-{i}" for i in range(5)]
+        promocode = create_promocode(
+            self.business,
+            mode=Promocode.ModeChoices.UNIQUE,
+            promo_unique=codes,
+            max_count=1,
+        )
+
+        results = self.activate_in_parallel(promocode)
+
+        issued = [code for code in results if code is not None]
+        self.assertCountEqual(issued, codes)
+
+
+class PromocodeMigrationTests(TransactionTestCase):
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    @staticmethod
+    def migrate(name: str) -> Apps:
+        target = [("promo", name)]
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(target)
+        executor.loader.build_graph()
+
+        return executor.loader.project_state(target).apps
+
+    @staticmethod
+    def create_rows(apps: Apps, users: int) -> tuple[object, list[object]]:
+        business = apps.get_model("business", "Business").objects.create(
+            name="Business",
+            email="business@mail.com",
+            password="SuperStrongPassword2000!",
+        )
+        user_objs = [
+            apps.get_model("user", "User").objects.create(
+                name="Steve",
+                surname="Jobs",
+                email=f"user{i}@apple.com",
+                age=30,
+                country="RU",
+                country_raw="ru",
+                password="WhoLiveSInCalifornia2000!",
+            )
+            for i in range(users)
+        ]
+
+        return business, user_objs
+
+    @staticmethod
+    def create_activation(
+        apps: Apps,
+        promocode: object,
+        user: object,
+        minutes: int,
+    ) -> object:
+        PromocodeActivation = apps.get_model("promo", "PromocodeActivation")
+
+        activation = PromocodeActivation.objects.create(
+            promocode=promocode, user=user
+        )
+        activation.timestamp = timezone.now() + timedelta(minutes=minutes)
+        PromocodeActivation.objects.filter(pk=activation.pk).update(
+            timestamp=activation.timestamp
+        )
+
+        return activation
+
+    def test_activated_unique_codes_are_backfilled(self) -> None:
+        apps = self.migrate("0003_promocode_counters")
+        Promocode = apps.get_model("promo", "Promocode")
+        PromocodeTarget = apps.get_model("promo", "PromocodeTarget")
+
+        business, (first, second) = self.create_rows(apps, 2)
+
+        # Three codes were handed out but one activation row is missing
+        promocode = Promocode.objects.create(
+            business=business,
+            target=PromocodeTarget.objects.create(),
+            description="Unique promocode",
+            max_count=1,
+            mode="UNIQUE",
+            promo_unique=["code-0", "code-1", "code-2", "code-3"],
+            promo_unique_activated=["code-0", "code-1", "code-2"],
+        )
+        activations = [
+            self.create_activation(apps, promocode, user, minutes)
+            for minutes, user in enumerate((second, first))
+        ]
+
+        apps = self.migrate("0004_promocodeuniquecode")
+        PromocodeUniqueCode = apps.get_model("promo", "PromocodeUniqueCode")
+
+        unique_codes = PromocodeUniqueCode.objects.filter(
+            promocode_id=promocode.pk
+        ).order_by("position")
+
+        self.assertEqual(
+            [
+                (code.code, code.activated_by_id, code.activated_at)
+                for code in unique_codes[:2]
+            ],
+            [
+                ("code-0", second.pk, activations[0].timestamp),
+                ("code-1", first.pk, activations[1].timestamp),
+            ],
+        )
+        self.assertIsNone(unique_codes[2].activated_by_id)
+        self.assertIsNotNone(unique_codes[2].activated_at)
+        self.assertIsNone(unique_codes[3].activated_at)
+
+    def test_activation_codes_are_backfilled(self) -> None:
+        apps = self.migrate("0006_promocodeactivationbucket")
+        Promocode = apps.get_model("promo", "Promocode")
+        PromocodeTarget = apps.get_model("promo", "PromocodeTarget")
+        PromocodeUniqueCode = apps.get_model("promo", "PromocodeUniqueCode")
+
+        business, (first, second) = self.create_rows(apps, 2)
+
+        common = Promocode.objects.create(
+            business=business,
+            target=PromocodeTarget.objects.create(),
+            description="Common promocode",
+            max_count=10,
+            mode="COMMON",
+            promo_common="sale-10",
+        )
+        common_activation = self.create_activation(apps, common, first, 0)
+
+        unique = Promocode.objects.create(
+            business=business,
+            target=PromocodeTarget.objects.create(),
+            description="Unique promocode",
+            max_count=1,
+            mode="UNIQUE",
+            promo_unique=["code-0", "code-1", "code-2", "code-3"],
+        )
+        # The first user activated twice, around the second user
+        activations = [
+            self.create_activation(apps, unique, user, minutes)
+            for minutes, user in enumerate((first, second, first))
+        ]
+        for position, activation in enumerate(activations):
+            PromocodeUniqueCode.objects.create(
+                promocode=unique,
+                code=f"code-{position}",
+                position=position,
+                activated_by=activation.user,
+                activated_at=activation.timestamp,
+            )
+        PromocodeUniqueCode.objects.create(
+            promocode=unique, code="code-3", position=3
+        )
+
+        apps = self.migrate("0007_promocodeactivation_code")
+        PromocodeActivation = apps.get_model("promo", "PromocodeActivation")
+
+        self.assertEqual(
+            PromocodeActivation.objects.get(pk=common_activation.pk).code,
+            "sale-10",
+        )
+        self.assertEqual(
+            [
+                PromocodeActivation.objects.get(pk=activation.pk).code
+                for activation in activations
+            ],
+            ["code-0", "code-1", "code-2"],
+        )
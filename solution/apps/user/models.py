@@ -12,10 +12,10 @@ from django.db import models
 from django.utils import timezone
 from django_countries.fields import CountryField
 
-from apps.core.models import BaseModel
+from apps.core.models import BaseModel, TokenVersionMixin
 
 
-class User(BaseModel):
+class User(TokenVersionMixin, BaseModel):
     name = models.CharField(max_length=100, validators=[MinLengthValidator(1)])
     surname = models.CharField(
         max_length=120,
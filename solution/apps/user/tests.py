@@ -0,0 +1,70 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.user.models import User
+from config.errors import ConflictError
+
+
+def create_user(email: str) -> User:
+    user = User(
+        name="Steve",
+        surname="Jobs",
+        email=email,
+        age=30,
+        country="ru",
+        country_raw="ru",
+        password="WhoLiveSInCalifornia2000!",
+    )
+    user.save()
+    return user
+
+
+class UserSaveTests(TestCase):
+    def setUp(self) -> None:
+        create_user("taken@apple.com")
+        self.user = User.objects.get(pk=create_user("steve@apple.com").pk)
+
+    def test_update_fields_skip_unique_check_of_unchanged_fields(self) -> None:
+        self.user.name = "Bob"
+
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save(update_fields=["name"])
+
+        self.assertEqual(len(queries), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "Bob")
+
+    def test_changed_unique_field_is_still_checked(self) -> None:
+        self.user.email = "taken@apple.com"
+
+        with self.assertRaises(ConflictError):
+            self.user.save(update_fields=["email"])
+
+    def test_unsaved_field_is_checked_after_saving_other_fields(
+        self,
+    ) -> None:
+        self.user.email = "taken@apple.com"
+        self.user.name = "Bob"
+        self.user.save(update_fields=["name"])
+
+        with self.assertRaises(ConflictError):
+            self.user.save(update_fields=["email"])
+
+    def test_bump_token_version_is_a_single_update(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            self.user.bump_token_version()
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.user.token_version, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+
+    def test_stale_token_version_is_bumped_past_concurrent_sign_in(
+        self,
+    ) -> None:
+        User.objects.get(pk=self.user.pk).bump_token_version()
+
+        self.user.bump_token_version()
+
+        self.assertEqual(self.user.token_version, 2)
@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = settings.LOGGER
+
+
+class CircuitBreaker:
+    # State lives in the shared Django cache, so every worker and node
+    # sees the same breaker. While open, calls are refused without
+    # touching the dependency. Once reset_timeout passes, a single probe
+    # per reset_timeout is let through until one succeeds. Successes only
+    # clear the shared state once this process saw a failure or an open
+    # breaker, so the normal path costs no extra cache round trip.
+    # Failures a success misses still expire with failure_window.
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        failure_window: float,
+        reset_timeout: float,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_timeout = reset_timeout
+
+        self.failures_key = f"circuit_breaker:{name}:failures"
+        self.open_until_key = f"circuit_breaker:{name}:open_until"
+        self.probe_key = f"circuit_breaker:{name}:probe"
+
+        # The shared state is unknown until the first success clears it
+        self._needs_reset = True
+
+    def allow_request(self) -> bool:
+        try:
+            open_until = cache.get(self.open_until_key)
+
+            if open_until is None:
+                return True
+
+            self._needs_reset = True
+
+            if time.time() < open_until:
+                return False
+
+            return cache.add(
+                self.probe_key, 1, timeout=max(1, int(self.reset_timeout))
+            )
+        except Exception:
+            logger.exception("Circuit breaker state is unavailable")
+            return True
+
+    def record_success(self) -> None:
+        if not self._needs_reset:
+            return
+
+        self._needs_reset = False
+        try:
+            cache.delete_many(
+                [self.failures_key, self.open_until_key, self.probe_key]
+            )
+        except Exception:
+            self._needs_reset = True
+            logger.exception("Circuit breaker state is unavailable")
+
+    def record_failure(self) -> None:
+        self._needs_reset = True
+        try:
+            cache.add(self.failures_key, 0, timeout=int(self.failure_window))
+            failures = cache.incr(self.failures_key)
+
+            if (
+                failures >= self.failure_threshold
+                or cache.get(self.open_until_key) is not None
+            ):
+                cache.set(
+                    self.open_until_key,
+                    time.time() + self.reset_timeout,
+                    timeout=None,
+                )
+                cache.delete(self.probe_key)
+        except Exception:
+            logger.exception("Circuit breaker state is unavailable")
@@ -0,0 +1,82 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from django.core.cache import cache
+
+
+class VerdictCache:
+    # In-process LRU in front of the shared Django cache. Both tiers keep
+    # a verdict only until its absolute expiry timestamp.
+
+    def __init__(self, prefix: str, max_size: int) -> None:
+        self.prefix = prefix
+        self.max_size = max_size
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    def get(self, key: str) -> Any | None:
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.local_hits += 1
+                    return entry[1]
+
+                del self._entries[key]
+
+        entry = cache.get(key)
+        if entry is not None and entry[0] > now:
+            self._set_local(key, entry)
+            with self._lock:
+                self.shared_hits += 1
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        timeout = expires_at - time.time()
+        if timeout <= 0:
+            return
+
+        entry = (expires_at, value)
+        cache.set(key, entry, timeout=math.ceil(timeout))
+        self._set_local(key, entry)
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "local_size": len(self._entries),
+            }
+
+    def _set_local(self, key: str, entry: tuple[float, Any]) -> None:
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,105 @@
+import asyncio
+import atexit
+import os
+import threading
+from collections.abc import AsyncGenerator
+from typing import ClassVar, TypeVar
+
+import httpx
+from django.conf import settings
+
+ClientT = TypeVar("ClientT", httpx.Client, httpx.AsyncClient)
+
+
+class AntifraudClient:
+    _client: ClassVar[httpx.Client | None] = None
+    _pid: ClassVar[int | None] = None
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def get(cls) -> httpx.Client:
+        # A client inherited through fork shares its sockets with the
+        # parent process, so every process lazily builds its own pool.
+        if cls._client is None or cls._pid != os.getpid():
+            with cls._lock:
+                if cls._client is None or cls._pid != os.getpid():
+                    cls._client = cls._create()
+                    cls._pid = os.getpid()
+
+        return cls._client
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            if cls._client is not None and cls._pid == os.getpid():
+                cls._client.close()
+
+            cls._client = None
+            cls._pid = None
+
+    @staticmethod
+    def _create(client_class: type[ClientT] = httpx.Client) -> ClientT:
+        options = {
+            "limits": httpx.Limits(
+                max_connections=settings.ANTIFRAUD_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=(
+                    settings.ANTIFRAUD_HTTP_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                keepalive_expiry=settings.ANTIFRAUD_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "timeout": httpx.Timeout(
+                settings.ANTIFRAUD_HTTP_READ_TIMEOUT,
+                connect=settings.ANTIFRAUD_HTTP_CONNECT_TIMEOUT,
+            ),
+        }
+
+        try:
+            return client_class(http2=settings.ANTIFRAUD_HTTP2, **options)
+        except ImportError:
+            settings.LOGGER.warning(
+                "HTTP/2 support is not installed, falling back to HTTP/1.1"
+            )
+            return client_class(**options)
+
+
+class AsyncAntifraudClient:
+    # Async connection pools are bound to the event loop they were first
+    # used on, so every loop gets its own client, closed when the loop
+    # shuts down. ASGI workers run one loop. Under WSGI, async views get a
+    # new loop per request from async_to_sync and connect on every request.
+    _clients: ClassVar[dict[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+    _closers: ClassVar[
+        dict[asyncio.AbstractEventLoop, AsyncGenerator[None, None]]
+    ] = {}
+
+    @classmethod
+    async def get(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+
+        client = cls._clients.get(loop)
+        if client is None:
+            client = cls._clients[loop] = AntifraudClient._create(  # noqa: SLF001
+                httpx.AsyncClient
+            )
+
+            # The loop only keeps a weak reference to its async generators
+            closer = cls._closers[loop] = cls._close_on_shutdown(loop)
+            await anext(closer)
+
+        return client
+
+    @classmethod
+    async def _close_on_shutdown(
+        cls,
+        loop: asyncio.AbstractEventLoop,
+    ) -> AsyncGenerator[None, None]:
+        # Suspended until the loop finalizes its async generators on
+        # shutdown, as asyncio.run() and async_to_sync do
+        try:
+            yield
+        finally:
+            cls._closers.pop(loop, None)
+            await cls._clients.pop(loop).aclose()
+
+
+atexit.register(AntifraudClient.close)
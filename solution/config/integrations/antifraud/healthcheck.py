@@ -4,13 +4,15 @@ import httpx
 from django.conf import settings
 from health_check.backends import BaseHealthCheckBackend
 
+from config.integrations.antifraud.client import AntifraudClient
+
 
 class AntifraudHealthCheck(BaseHealthCheckBackend):
     critical_service = False
 
     def check_status(self) -> None:
         try:
-            response = httpx.get(
+            response = AntifraudClient.get().get(
                 f"{settings.ANTIFRAUD_ADDRESS}/api/ping", timeout=1
             )
             if response.status_code >= status.INTERNAL_SERVER_ERROR:
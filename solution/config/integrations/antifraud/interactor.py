@@ -1,105 +1,453 @@
+import asyncio
+import os
+import threading
 import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from http import HTTPStatus as status
-from typing import ClassVar
+from typing import Any, ClassVar
 
 import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
-from django.utils import timezone
 from pytz import timezone as tz
 
+from config.integrations.antifraud.breaker import CircuitBreaker
+from config.integrations.antifraud.cache import VerdictCache
+from config.integrations.antifraud.client import (
+    AntifraudClient,
+    AsyncAntifraudClient,
+)
+
 logger = settings.LOGGER
 
 
 class AntifraudServiceInteractor:
     HEADERS: ClassVar[dict[str, str]] = {"Content-Type": "application/json"}
-    CACHE_PREFIX = "antifraud_cache"
+    CACHE_PREFIX = "antifraud_verdict"
     ANTIFRAUD_ENDPOINT = f"{settings.ANTIFRAUD_ADDRESS}/api/validate"
     RETRY_COUNT: ClassVar[int] = 2
 
+    circuit_breaker = CircuitBreaker(
+        name="antifraud",
+        failure_threshold=settings.ANTIFRAUD_BREAKER_FAILURE_THRESHOLD,
+        failure_window=settings.ANTIFRAUD_BREAKER_FAILURE_WINDOW,
+        reset_timeout=settings.ANTIFRAUD_BREAKER_RESET_TIMEOUT,
+    )
+
+    _hedge_executor: ClassVar[ThreadPoolExecutor | None] = None
+    _hedge_executor_pid: ClassVar[int | None] = None
+    _hedge_executor_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    verdict_cache = VerdictCache(
+        prefix=CACHE_PREFIX,
+        max_size=settings.ANTIFRAUD_LOCAL_CACHE_SIZE,
+    )
+
     @classmethod
     def get_cache_key(cls, user_email: str, promo_id: str) -> str:
-        return f"{cls.CACHE_PREFIX}:{user_email}:{promo_id}"
+        return cls.verdict_cache.get_key(user_email, promo_id)
 
     @classmethod
-    def is_cache_valid(cls, cache_until: str) -> bool:
+    def get_cache_expiry(cls, cache_until: str | None) -> float | None:
         if cache_until:
             try:
-                cache_expiry = datetime.fromisoformat(cache_until).astimezone(
-                    tz(settings.TIME_ZONE)
+                return (
+                    datetime.fromisoformat(cache_until)
+                    .astimezone(tz(settings.TIME_ZONE))
+                    .timestamp()
                 )
-                return cache_expiry > timezone.now()
             except ValueError:
-                return False
-        return False
+                return None
+        return None
+
+    @classmethod
+    def _get_request_options(
+        cls,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        timeout: float,
+    ) -> dict[str, Any]:
+        return {
+            "json": payload,
+            "headers": headers,
+            "timeout": httpx.Timeout(
+                timeout,
+                connect=min(timeout, settings.ANTIFRAUD_HTTP_CONNECT_TIMEOUT),
+            ),
+        }
 
     @staticmethod
-    def _make_request(
+    def _check_response(
+        response: httpx.Response,
+        url: str,
+        attempt: int,
+        request_time: float,
+    ) -> httpx.Response | None:
+        logger.info(
+            "Attempt %d: Request to %s took %s seconds",
+            attempt,
+            url,
+            request_time,
+        )
+
+        if response.status_code == status.OK:
+            return response
+
+        logger.warning(
+            "Attempt %d failed with status %d",
+            attempt,
+            response.status_code,
+        )
+
+        return None
+
+    @classmethod
+    def _get_hedge_executor(cls) -> ThreadPoolExecutor:
+        # Only created once hedging is used, per process since worker
+        # threads don't survive a fork.
+        if (
+            cls._hedge_executor is None
+            or cls._hedge_executor_pid != os.getpid()
+        ):
+            with cls._hedge_executor_lock:
+                if (
+                    cls._hedge_executor is None
+                    or cls._hedge_executor_pid != os.getpid()
+                ):
+                    cls._hedge_executor = ThreadPoolExecutor(
+                        max_workers=settings.ANTIFRAUD_HEDGE_MAX_WORKERS,
+                        thread_name_prefix="antifraud-hedge",
+                    )
+                    cls._hedge_executor_pid = os.getpid()
+
+        return cls._hedge_executor
+
+    @staticmethod
+    def _get_hedge_delay(timeout: float) -> float | None:
+        # None when a single request is sent for the attempt
+        hedge_delay = settings.ANTIFRAUD_HEDGE_DELAY
+
+        if hedge_delay is None or hedge_delay >= timeout:
+            return None
+
+        return hedge_delay
+
+    @staticmethod
+    def _get_attempts(
+        url: str,
+        retries: int,
+        deadline: float,
+    ) -> Iterator[tuple[int, float]]:
+        # Attempt numbers with their timeout, clipped to what is left of
+        # the deadline. Stop iterating once a response is returned.
+        deadline_at = time.monotonic() + deadline
+
+        for attempt in range(1, retries + 1):
+            remaining = min(
+                deadline_at - time.monotonic(),
+                settings.ANTIFRAUD_HTTP_READ_TIMEOUT,
+            )
+            if remaining <= 0:
+                logger.warning(
+                    "Deadline of %s seconds for %s exceeded", deadline, url
+                )
+                break
+
+            yield attempt, remaining
+
+        logger.error("All %d attempts to %s failed", retries, url)
+
+    @classmethod
+    def _post(
+        cls,
         client: httpx.Client,
         url: str,
         payload: dict[str, str],
         headers: dict[str, str],
-        retries: int,
+        timeout: float,
+        attempt: int,
     ) -> httpx.Response | None:
-        for attempt in range(1, retries + 1):
-            start_time = time.time()
-            try:
-                response = client.post(url, json=payload, headers=headers)
-                request_time = time.time() - start_time
-                logger.info(
-                    "Attempt %d: Request to %s took %s seconds",
-                    attempt,
-                    url,
-                    request_time,
-                )
+        start_time = time.time()
+        try:
+            response = client.post(
+                url, **cls._get_request_options(payload, headers, timeout)
+            )
+        except httpx.HTTPError:
+            logger.exception(
+                "Attempt %d: HTTP error during request to %s",
+                attempt,
+                url,
+            )
+            return None
+
+        return cls._check_response(
+            response, url, attempt, time.time() - start_time
+        )
+
+    @classmethod
+    async def _apost(
+        cls,
+        client: httpx.AsyncClient,
+        url: str,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        timeout: float,
+        attempt: int,
+    ) -> httpx.Response | None:
+        start_time = time.time()
+        try:
+            response = await client.post(
+                url, **cls._get_request_options(payload, headers, timeout)
+            )
+        except httpx.HTTPError:
+            logger.exception(
+                "Attempt %d: HTTP error during request to %s",
+                attempt,
+                url,
+            )
+            return None
 
-                if response.status_code == status.OK:
+        return cls._check_response(
+            response, url, attempt, time.time() - start_time
+        )
+
+    @classmethod
+    def _hedged_post(
+        cls,
+        client: httpx.Client,
+        url: str,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        timeout: float,
+        attempt: int,
+    ) -> httpx.Response | None:
+        hedge_delay = cls._get_hedge_delay(timeout)
+
+        if hedge_delay is None:
+            return cls._post(client, url, payload, headers, timeout, attempt)
+
+        executor = cls._get_hedge_executor()
+        futures = [
+            executor.submit(
+                cls._post, client, url, payload, headers, timeout, attempt
+            )
+        ]
+        done, _ = wait(futures, timeout=hedge_delay)
+
+        if done:
+            return futures[0].result()
+
+        logger.info("Attempt %d: sending hedged request to %s", attempt, url)
+        futures.append(
+            executor.submit(
+                cls._post,
+                client,
+                url,
+                payload,
+                headers,
+                timeout - hedge_delay,
+                attempt,
+            )
+        )
+
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                response = future.result()
+                if response is not None:
                     return response
+        except FuturesTimeoutError:
+            pass
 
-                logger.warning(
-                    "Attempt %d failed with status %d",
-                    attempt,
-                    response.status_code,
-                )
-            except httpx.HTTPError:
-                logger.exception(
-                    "Attempt %d: HTTP error during request to %s",
-                    attempt,
+        return None
+
+    @classmethod
+    async def _ahedged_post(
+        cls,
+        client: httpx.AsyncClient,
+        url: str,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        timeout: float,
+        attempt: int,
+    ) -> httpx.Response | None:
+        hedge_delay = cls._get_hedge_delay(timeout)
+
+        if hedge_delay is None:
+            return await cls._apost(
+                client, url, payload, headers, timeout, attempt
+            )
+
+        tasks = [
+            asyncio.create_task(
+                cls._apost(client, url, payload, headers, timeout, attempt)
+            )
+        ]
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+
+        if done:
+            return tasks[0].result()
+
+        logger.info("Attempt %d: sending hedged request to %s", attempt, url)
+        tasks.append(
+            asyncio.create_task(
+                cls._apost(
+                    client,
                     url,
+                    payload,
+                    headers,
+                    timeout - hedge_delay,
+                    attempt,
                 )
+            )
+        )
+
+        try:
+            for future in asyncio.as_completed(tasks, timeout=timeout):
+                response = await future
+                if response is not None:
+                    return response
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Unlike threads, the slower request can be cancelled
+            for task in tasks:
+                task.cancel()
 
-        logger.exception("All %d attempts to %s failed", retries, url)
         return None
 
+    @classmethod
+    def _make_request(
+        cls,
+        client: httpx.Client,
+        url: str,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        retries: int,
+        deadline: float,
+    ) -> httpx.Response | None:
+        for attempt, timeout in cls._get_attempts(url, retries, deadline):
+            response = cls._hedged_post(
+                client, url, payload, headers, timeout, attempt
+            )
+
+            if response is not None:
+                return response
+
+        return None
+
+    @classmethod
+    async def _amake_request(
+        cls,
+        client: httpx.AsyncClient,
+        url: str,
+        payload: dict[str, str],
+        headers: dict[str, str],
+        retries: int,
+        deadline: float,
+    ) -> httpx.Response | None:
+        for attempt, timeout in cls._get_attempts(url, retries, deadline):
+            response = await cls._ahedged_post(
+                client, url, payload, headers, timeout, attempt
+            )
+
+            if response is not None:
+                return response
+
+        return None
+
+    @classmethod
+    def _get_known_result(cls, cache_key: str) -> dict[str, bool | str] | None:
+        # The cached verdict, or a rejection while the breaker is open
+        cached_result = cls.verdict_cache.get(cache_key)
+
+        if cached_result is not None:
+            return cached_result
+
+        if not cls.circuit_breaker.allow_request():
+            logger.warning("Antifraud circuit breaker is open")
+            return {"ok": False}
+
+        return None
+
+    @classmethod
+    def _handle_response(
+        cls,
+        cache_key: str,
+        response: httpx.Response | None,
+    ) -> dict[str, bool | str]:
+        if response is None:
+            cls.circuit_breaker.record_failure()
+            return {"ok": False}
+
+        cls.circuit_breaker.record_success()
+
+        result = response.json()
+
+        cache_expiry = cls.get_cache_expiry(result.get("cache_until"))
+        if cache_expiry is not None:
+            cls.verdict_cache.set(cache_key, result, cache_expiry)
+
+        return result
+
     @classmethod
     def validate(cls, user_email: str, promo_id: str) -> dict[str, bool | str]:
         cache_key = cls.get_cache_key(user_email, promo_id)
-        cached_result = cache.get(cache_key)
 
-        if cached_result and cls.is_cache_valid(
-            cached_result.get("cache_until")
-        ):
-            return cached_result
+        known_result = cls._get_known_result(cache_key)
+        if known_result is not None:
+            return known_result
 
         payload = {"user_email": user_email, "promo_id": promo_id}
         try:
-            with httpx.Client(timeout=5) as client:
-                response = cls._make_request(
-                    client,
-                    cls.ANTIFRAUD_ENDPOINT,
-                    payload,
-                    cls.HEADERS,
-                    retries=cls.RETRY_COUNT,
-                )
+            response = cls._make_request(
+                AntifraudClient.get(),
+                cls.ANTIFRAUD_ENDPOINT,
+                payload,
+                cls.HEADERS,
+                retries=cls.RETRY_COUNT,
+                deadline=settings.ANTIFRAUD_DEADLINE,
+            )
 
-                if response:
-                    result = response.json()
+            return cls._handle_response(cache_key, response)
+        except Exception:
+            logger.exception(
+                "Unexpected error during antifraud validation",
+            )
 
-                    if "cache_until" in result:
-                        cache.set(cache_key, result)
+        return {"ok": False}
 
-                    return result
+    @classmethod
+    async def avalidate(
+        cls,
+        user_email: str,
+        promo_id: str,
+    ) -> dict[str, bool | str]:
+        """Async ``validate``, the event loop is free while the service
+        responds. Verdict cache and breaker calls run in a thread.
+        """
+        cache_key = cls.get_cache_key(user_email, promo_id)
+
+        known_result = await sync_to_async(cls._get_known_result)(cache_key)
+        if known_result is not None:
+            return known_result
+
+        payload = {"user_email": user_email, "promo_id": promo_id}
+        try:
+            response = await cls._amake_request(
+                await AsyncAntifraudClient.get(),
+                cls.ANTIFRAUD_ENDPOINT,
+                payload,
+                cls.HEADERS,
+                retries=cls.RETRY_COUNT,
+                deadline=settings.ANTIFRAUD_DEADLINE,
+            )
+
+            return await sync_to_async(cls._handle_response)(
+                cache_key, response
+            )
         except Exception:
             logger.exception(
                 "Unexpected error during antifraud validation",
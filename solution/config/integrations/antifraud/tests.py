@@ -0,0 +1,381 @@
+import asyncio
+import datetime
+import threading
+import time
+from http import HTTPStatus as status
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from config.integrations.antifraud.breaker import CircuitBreaker
+from config.integrations.antifraud.cache import VerdictCache
+from config.integrations.antifraud.client import (
+    AntifraudClient,
+    AsyncAntifraudClient,
+)
+from config.integrations.antifraud.interactor import AntifraudServiceInteractor
+
+URL = "http://antifraud/api/validate"
+PAYLOAD = {"user_email": "user@mail.com", "promo_id": "promo"}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+        # Cache expiry follows the same clock
+        self.clock = FakeClock()
+        patcher = mock.patch("time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.breaker = CircuitBreaker(
+            name="test",
+            failure_threshold=3,
+            failure_window=10,
+            reset_timeout=30,
+        )
+
+    def fail(self, times: int) -> None:
+        for _ in range(times):
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold_failures(self) -> None:
+        self.fail(2)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.fail(1)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_failures_outside_the_window_are_forgotten(self) -> None:
+        self.fail(2)
+        self.clock.advance(11)
+        self.fail(2)
+
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_lets_a_single_probe_through(self) -> None:
+        self.fail(3)
+        self.clock.advance(31)
+
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self) -> None:
+        self.fail(3)
+        self.clock.advance(31)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.fail(1)
+
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.advance(31)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_success_on_a_closed_breaker_skips_the_cache(self) -> None:
+        self.breaker.record_success()
+
+        with mock.patch.object(
+            cache, "delete_many", wraps=cache.delete_many
+        ) as delete_many:
+            self.breaker.record_success()
+            delete_many.assert_not_called()
+
+            self.fail(1)
+            self.breaker.record_success()
+            self.breaker.record_success()
+
+        delete_many.assert_called_once()
+
+    def test_success_resets_a_breaker_opened_elsewhere(self) -> None:
+        self.breaker.record_success()
+        other_worker = CircuitBreaker(
+            name="test",
+            failure_threshold=3,
+            failure_window=10,
+            reset_timeout=30,
+        )
+        for _ in range(3):
+            other_worker.record_failure()
+
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.advance(31)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+
+        self.assertTrue(other_worker.allow_request())
+        self.assertTrue(other_worker.allow_request())
+
+    def test_success_resets(self) -> None:
+        self.fail(3)
+        self.clock.advance(31)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.breaker.record_success()
+        self.fail(2)
+
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    },
+)
+class VerdictCacheTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+        self.clock = FakeClock()
+        patcher = mock.patch("time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.verdicts = VerdictCache(prefix="test", max_size=2)
+
+    def test_verdict_expires_at_cache_until(self) -> None:
+        self.verdicts.set("a", {"ok": True}, self.clock.now + 10)
+
+        self.clock.advance(9.5)
+        self.assertEqual(self.verdicts.get("a"), {"ok": True})
+
+        self.clock.advance(0.5)
+        self.assertIsNone(self.verdicts.get("a"))
+
+    def test_shared_entry_is_not_served_past_cache_until(self) -> None:
+        # The shared timeout is rounded up to a whole second
+        self.verdicts.set("a", {"ok": True}, self.clock.now + 0.5)
+        self.clock.advance(0.6)
+
+        other_worker = VerdictCache(prefix="test", max_size=2)
+
+        self.assertIsNone(other_worker.get("a"))
+
+    def test_expired_verdict_is_not_stored(self) -> None:
+        self.verdicts.set("a", {"ok": True}, self.clock.now)
+
+        self.assertIsNone(self.verdicts.get("a"))
+        self.assertIsNone(cache.get("a"))
+
+    def test_local_tier_keeps_the_most_recently_used(self) -> None:
+        expires_at = self.clock.now + 60
+        for key in ("a", "b"):
+            self.verdicts.set(key, {"ok": True}, expires_at)
+
+        self.verdicts.get("a")
+        self.verdicts.set("c", {"ok": False}, expires_at)
+
+        self.assertEqual(self.verdicts.stats()["local_size"], 2)
+
+        # Evicted locally, still shared between workers
+        self.assertEqual(self.verdicts.get("b"), {"ok": True})
+        self.assertEqual(self.verdicts.get("c"), {"ok": False})
+        self.assertEqual(
+            self.verdicts.stats(),
+            {"local_hits": 2, "shared_hits": 1, "misses": 0, "local_size": 2},
+        )
+
+    def test_shared_tier_fills_other_workers(self) -> None:
+        self.verdicts.set("a", {"ok": True}, self.clock.now + 60)
+        other_worker = VerdictCache(prefix="test", max_size=2)
+
+        self.assertEqual(other_worker.get("a"), {"ok": True})
+        self.assertEqual(other_worker.get("a"), {"ok": True})
+        self.assertIsNone(other_worker.get("b"))
+        self.assertEqual(
+            other_worker.stats(),
+            {"local_hits": 1, "shared_hits": 1, "misses": 1, "local_size": 1},
+        )
+
+    def test_validate_reuses_verdict_until_cache_until(self) -> None:
+        interactor = AntifraudServiceInteractor
+        interactor.verdict_cache.clear_local()
+        self.addCleanup(interactor.verdict_cache.clear_local)
+
+        cache_until = datetime.datetime.fromtimestamp(
+            self.clock.now + 60, tz=datetime.timezone.utc
+        )
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(
+                status.OK,
+                json={"ok": True, "cache_until": cache_until.isoformat()},
+            )
+
+        with (
+            httpx.Client(transport=httpx.MockTransport(handler)) as client,
+            mock.patch.object(AntifraudClient, "get", return_value=client),
+        ):
+            for _ in range(2):
+                self.assertTrue(
+                    interactor.validate("user@mail.com", "a")["ok"]
+                )
+            self.assertEqual(len(calls), 1)
+
+            self.clock.advance(60)
+            interactor.validate("user@mail.com", "a")
+            self.assertEqual(len(calls), 2)
+
+
+@override_settings(
+    ANTIFRAUD_HTTP_READ_TIMEOUT=0.8,
+    ANTIFRAUD_HTTP_CONNECT_TIMEOUT=0.1,
+    ANTIFRAUD_HEDGE_DELAY=None,
+)
+class AntifraudRequestTests(SimpleTestCase):
+    def test_attempts_are_clipped_to_the_deadline(self) -> None:
+        clock = FakeClock()
+        timeouts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            timeouts.append(request.extensions["timeout"])
+            clock.advance(0.7)
+            return httpx.Response(status.INTERNAL_SERVER_ERROR)
+
+        with (
+            mock.patch("time.monotonic", clock),
+            httpx.Client(transport=httpx.MockTransport(handler)) as client,
+        ):
+            response = AntifraudServiceInteractor._make_request(  # noqa: SLF001
+                client, URL, PAYLOAD, {}, retries=3, deadline=1.0
+            )
+
+        self.assertIsNone(response)
+        # The third attempt would start after the deadline
+        self.assertEqual(len(timeouts), 2)
+        self.assertEqual(timeouts[0]["read"], 0.8)
+        self.assertEqual(timeouts[0]["connect"], 0.1)
+        self.assertAlmostEqual(timeouts[1]["read"], 0.3)
+
+    def test_first_successful_attempt_is_returned(self) -> None:
+        statuses = iter((status.BAD_GATEWAY, status.OK))
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(next(statuses), json={"ok": True})
+
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            response = AntifraudServiceInteractor._make_request(  # noqa: SLF001
+                client, URL, PAYLOAD, {}, retries=3, deadline=1.0
+            )
+
+        self.assertEqual(response.json(), {"ok": True})
+
+    @override_settings(ANTIFRAUD_HEDGE_DELAY=0.05)
+    def test_hedged_request_answers_for_a_slow_one(self) -> None:
+        hedge_sent = threading.Event()
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) == 1:
+                hedge_sent.wait(timeout=5)
+                return httpx.Response(status.OK, json={"ok": False})
+
+            hedge_sent.set()
+            return httpx.Response(status.OK, json={"ok": True})
+
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            response = AntifraudServiceInteractor._hedged_post(  # noqa: SLF001
+                client, URL, PAYLOAD, {}, timeout=1.0, attempt=1
+            )
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.json(), {"ok": True})
+
+    @override_settings(ANTIFRAUD_HEDGE_DELAY=0.05)
+    def test_async_hedged_request_cancels_the_slow_one(self) -> None:
+        calls = []
+        cancelled = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(request)
+                    raise
+
+            return httpx.Response(status.OK, json={"ok": True})
+
+        async def hedged_post() -> httpx.Response | None:
+            async with httpx.AsyncClient(
+                transport=httpx.MockTransport(handler)
+            ) as client:
+                return await AntifraudServiceInteractor._ahedged_post(  # noqa: SLF001
+                    client, URL, PAYLOAD, {}, timeout=1.0, attempt=1
+                )
+
+        started_at = time.perf_counter()
+        response = asyncio.run(hedged_post())
+
+        self.assertLess(time.perf_counter() - started_at, 1)
+        self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(len(cancelled), 1)
+
+    def test_hedge_executor_is_created_on_first_hedge(self) -> None:
+        interactor = AntifraudServiceInteractor
+
+        with mock.patch.object(interactor, "_hedge_executor", None):
+            with httpx.Client(
+                transport=httpx.MockTransport(
+                    lambda request: httpx.Response(status.OK, json={})
+                )
+            ) as client:
+                interactor._hedged_post(  # noqa: SLF001
+                    client, URL, PAYLOAD, {}, timeout=1.0, attempt=1
+                )
+                self.assertIsNone(interactor._hedge_executor)  # noqa: SLF001
+
+                with override_settings(ANTIFRAUD_HEDGE_DELAY=0.05):
+                    interactor._hedged_post(  # noqa: SLF001
+                        client, URL, PAYLOAD, {}, timeout=1.0, attempt=1
+                    )
+
+            self.assertIsNotNone(interactor._hedge_executor)  # noqa: SLF001
+
+
+class AsyncAntifraudClientTests(SimpleTestCase):
+    def test_loop_reuses_its_client(self) -> None:
+        async def get_twice() -> bool:
+            return (
+                await AsyncAntifraudClient.get()
+                is await AsyncAntifraudClient.get()
+            )
+
+        self.assertTrue(asyncio.run(get_twice()))
+
+    def test_client_is_closed_with_its_loop(self) -> None:
+        # Every async_to_sync call outside a loop runs its own loop
+        clients = [async_to_sync(AsyncAntifraudClient.get)() for _ in range(3)]
+
+        self.assertEqual(len(set(map(id, clients))), len(clients))
+        self.assertTrue(all(client.is_closed for client in clients))
+        self.assertEqual(AsyncAntifraudClient._clients, {})  # noqa: SLF001
+        self.assertEqual(AsyncAntifraudClient._closers, {})  # noqa: SLF001
@@ -0,0 +1,109 @@
+import time
+from collections.abc import Callable
+from contextlib import ExitStack
+from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+logger = settings.LOGGER
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Query-Time"
+
+
+def get_route(method: str, route: str | None) -> str | None:
+    if route is None:
+        return None
+
+    return f"{method} {route}"
+
+
+def get_query_budget(route: str | None) -> int | None:
+    if route is None:
+        return None
+
+    return settings.DB_QUERY_BUDGETS.get(route, settings.DB_QUERY_BUDGET)
+
+
+class QueryRecorder:
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(
+        self,
+        execute: Callable[..., Any],
+        sql: str,
+        params: Any,
+        many: bool,
+        context: dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    """Record database queries made by a request and check them against
+    the budget of its route.
+
+    Queries made while a streaming response is consumed happen after the
+    middleware returns and aren't counted. The middleware is sync only, so
+    while enabled, async views are adapted to run behind it.
+    """
+
+    def __init__(
+        self,
+        get_response: Callable[[HttpRequest], HttpResponse],
+    ) -> None:
+        if not settings.DB_QUERY_METRICS:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        recorder = QueryRecorder()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        duration_ms = round(recorder.duration * 1000, 3)
+        response[QUERY_COUNT_HEADER] = str(recorder.count)
+        response[QUERY_TIME_HEADER] = str(duration_ms)
+
+        resolver_match = request.resolver_match
+        route = get_route(
+            request.method,
+            resolver_match.route if resolver_match else None,
+        )
+        budget = get_query_budget(route)
+        fields = {
+            "route": route or request.path,
+            "status_code": response.status_code,
+            "db_queries": recorder.count,
+            "db_time_ms": duration_ms,
+            "db_query_budget": budget,
+        }
+
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                "Query budget exceeded: %s made %d queries (budget %d)",
+                route,
+                recorder.count,
+                budget,
+                extra=fields,
+            )
+        else:
+            logger.info(
+                "Database queries of %s", fields["route"], extra=fields
+            )
+
+        return response
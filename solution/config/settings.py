@@ -33,6 +33,158 @@ ANTIFRAUD_ADDRESS = (
     f"{env('ANTIFRAUD_ADDRESS', default='localhost:9090')}"
 )
 
+ANTIFRAUD_HTTP_MAX_CONNECTIONS = env(
+    "ANTIFRAUD_HTTP_MAX_CONNECTIONS",
+    int,
+    default=100,
+)
+
+ANTIFRAUD_HTTP_MAX_KEEPALIVE_CONNECTIONS = env(
+    "ANTIFRAUD_HTTP_MAX_KEEPALIVE_CONNECTIONS",
+    int,
+    default=20,
+)
+
+ANTIFRAUD_HTTP_KEEPALIVE_EXPIRY = env(
+    "ANTIFRAUD_HTTP_KEEPALIVE_EXPIRY",
+    float,
+    default=30.0,
+)
+
+ANTIFRAUD_HTTP_CONNECT_TIMEOUT = env(
+    "ANTIFRAUD_HTTP_CONNECT_TIMEOUT",
+    float,
+    default=5.0,
+)
+
+ANTIFRAUD_HTTP_READ_TIMEOUT = env(
+    "ANTIFRAUD_HTTP_READ_TIMEOUT",
+    float,
+    default=5.0,
+)
+
+# Requires the optional "h2" package
+ANTIFRAUD_HTTP2 = env("ANTIFRAUD_HTTP2", bool, default=False)
+
+ANTIFRAUD_LOCAL_CACHE_SIZE = env(
+    "ANTIFRAUD_LOCAL_CACHE_SIZE",
+    int,
+    default=10000,
+)
+
+# Overall time budget of one validation, retries included
+ANTIFRAUD_DEADLINE = env("ANTIFRAUD_DEADLINE", float, default=5.0)
+
+# Send a second request if the first one is slower, disabled when empty
+ANTIFRAUD_HEDGE_DELAY = env("ANTIFRAUD_HEDGE_DELAY", float, default=None)
+
+ANTIFRAUD_HEDGE_MAX_WORKERS = env(
+    "ANTIFRAUD_HEDGE_MAX_WORKERS",
+    int,
+    default=8,
+)
+
+ANTIFRAUD_BREAKER_FAILURE_THRESHOLD = env(
+    "ANTIFRAUD_BREAKER_FAILURE_THRESHOLD",
+    int,
+    default=5,
+)
+
+ANTIFRAUD_BREAKER_FAILURE_WINDOW = env(
+    "ANTIFRAUD_BREAKER_FAILURE_WINDOW",
+    float,
+    default=30.0,
+)
+
+ANTIFRAUD_BREAKER_RESET_TIMEOUT = env(
+    "ANTIFRAUD_BREAKER_RESET_TIMEOUT",
+    float,
+    default=10.0,
+)
+
+# Authenticated users and businesses are cached between requests
+AUTH_PRINCIPAL_CACHE_TTL = env("AUTH_PRINCIPAL_CACHE_TTL", int, default=300)
+
+AUTH_PRINCIPAL_LOCAL_TTL = env(
+    "AUTH_PRINCIPAL_LOCAL_TTL",
+    float,
+    default=5.0,
+)
+
+AUTH_PRINCIPAL_LOCAL_CACHE_SIZE = env(
+    "AUTH_PRINCIPAL_LOCAL_CACHE_SIZE",
+    int,
+    default=10000,
+)
+
+# Bulk promocode creation, items are inserted in batches of
+# PROMOCODE_BULK_BATCH_SIZE within one transaction
+PROMOCODE_BULK_MAX_ITEMS = env("PROMOCODE_BULK_MAX_ITEMS", int, default=1000)
+
+PROMOCODE_BULK_BATCH_SIZE = env("PROMOCODE_BULK_BATCH_SIZE", int, default=500)
+
+# Read promocode stats from the per-country rollup instead of grouping
+# activations. The rollup counts the user's country at activation time.
+PROMOCODE_STAT_ROLLUP = env("PROMOCODE_STAT_ROLLUP", bool, default=False)
+
+# Hourly activation buckets older than this are merged into daily ones
+# by the compact_activation_buckets command
+PROMOCODE_STAT_HOURLY_RETENTION_DAYS = env(
+    "PROMOCODE_STAT_HOURLY_RETENTION_DAYS",
+    int,
+    default=31,
+)
+
+# Rows fetched per database round trip by streaming exports
+EXPORT_CHUNK_SIZE = env("EXPORT_CHUNK_SIZE", int, default=2000)
+
+# Fields of GET /business/promo when "fields" isn't passed, all if empty.
+# Leaving out promo_unique keeps lists from shipping every unique code.
+PROMOCODE_LIST_DEFAULT_FIELDS = env(
+    "PROMOCODE_LIST_DEFAULT_FIELDS",
+    list,
+    default=[],
+)
+
+# Render API responses with orjson instead of the stdlib json module
+API_ORJSON_RENDERER = env("API_ORJSON_RENDERER", bool, default=True)
+
+# Cache ordered promocode ids of user feed segments (age, country, filters)
+FEED_SEGMENT_CACHE = env("FEED_SEGMENT_CACHE", bool, default=True)
+
+FEED_SEGMENT_CACHE_TTL = env("FEED_SEGMENT_CACHE_TTL", int, default=60)
+
+# Bigger segments are read from the database on every request
+FEED_SEGMENT_MAX_SIZE = env("FEED_SEGMENT_MAX_SIZE", int, default=10000)
+
+# Cache the ids of promocodes each user liked and activated
+USER_FLAGS_CACHE = env("USER_FLAGS_CACHE", bool, default=False)
+
+USER_FLAGS_CACHE_TTL = env("USER_FLAGS_CACHE_TTL", int, default=300)
+
+# Check feed and activation targeting against a per-process index
+TARGETING_INDEX = env("TARGETING_INDEX", bool, default=True)
+
+TARGETING_INDEX_FULL_REFRESH_INTERVAL = env(
+    "TARGETING_INDEX_FULL_REFRESH_INTERVAL",
+    float,
+    default=300.0,
+)
+
+# Record query count and time of every request, see config.middleware
+DB_QUERY_METRICS = env("DB_QUERY_METRICS", bool, default=False)
+
+# Queries a request may make before a warning is logged, per "METHOD route"
+# in DB_QUERY_BUDGETS and DB_QUERY_BUDGET for every other route
+DB_QUERY_BUDGET = env("DB_QUERY_BUDGET", int, default=10)
+
+DB_QUERY_BUDGETS = {
+    "POST api/business/promo": 16,
+    "POST api/business/promo/bulk": 20,
+    "PATCH api/business/promo/<promocode_id>": 16,
+    "POST api/user/promo/<promocode_id>/activate": 20,
+}
+
 # Register healthcheck
 
 plugin_dir.register(AntifraudHealthCheck)
@@ -61,7 +213,15 @@ CACHES = {
 
 DB_URI = env.db_url("POSTGRES_CONN", default="sqlite:///db.sqlite3")
 
-DATABASES = {"default": {**DB_URI, "CONN_MAX_AGE": 50}}
+# Connections persist per thread, ASGI servers run the sync code of every
+# request on a new thread, so there they must not persist. Sync gunicorn
+# workers reuse their threads and can raise it.
+DATABASES = {
+    "default": {
+        **DB_URI,
+        "CONN_MAX_AGE": env("POSTGRES_CONN_MAX_AGE", int, default=0),
+    },
+}
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -224,6 +384,7 @@ INTERNAL_IPS = env(
 
 MIDDLEWARE = [
     "django_guid.middleware.guid_middleware",
+    "config.middleware.QueryBudgetMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -0,0 +1,33 @@
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from config.middleware import QUERY_COUNT_HEADER, get_query_budget, get_route
+
+
+@override_settings(DB_QUERY_METRICS=True)
+class QueryBudgetTestCase(TestCase):
+    """TestCase with the query budget middleware enabled."""
+
+    def assertWithinQueryBudget(  # noqa: N802
+        self,
+        response: HttpResponse,
+        budget: int | None = None,
+    ) -> None:
+        """Fail if the request behind the response made more queries than
+        the budget declared for its route in DB_QUERY_BUDGETS, or than the
+        budget passed explicitly.
+        """
+        route = get_route(
+            response.request["REQUEST_METHOD"],
+            response.resolver_match.route,
+        )
+        if budget is None:
+            budget = get_query_budget(route)
+
+        self.assertIn(QUERY_COUNT_HEADER, response.headers)  # noqa: PT009
+        count = int(response.headers[QUERY_COUNT_HEADER])
+        self.assertLessEqual(  # noqa: PT009
+            count,
+            budget,
+            f"{route} made {count} queries, budget is {budget}",
+        )
@@ -0,0 +1,124 @@
+"""Gunicorn config for Promocode."""
+
+import contextlib
+import gc
+import os
+from pathlib import Path
+from typing import Any
+
+import environ
+from django.core.cache import caches
+from django.db import connections
+
+BASE_DIR = Path(__file__).resolve().parent
+
+env = environ.Env()
+environ.Env.read_env(BASE_DIR / ".env")
+
+
+def get_cpu_count() -> int:
+    # CPUs the process may run on, which is fewer than os.cpu_count() when
+    # the container is pinned to a CPU set. CPU quotas aren't visible
+    # here, set GUNICORN_WORKERS for those.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+CPU_COUNT = get_cpu_count()
+
+
+# Server
+
+bind = [env("SERVER_ADDRESS", default="127.0.0.1:8000")]
+
+worker_class = env(
+    "GUNICORN_WORKER_CLASS",
+    default="uvicorn_worker.UvicornWorker",
+)
+
+ASYNC_WORKER = "uvicorn" in worker_class
+
+wsgi_app = (
+    "config.asgi:application" if ASYNC_WORKER else "config.wsgi:application"
+)
+
+# An event loop keeps a core busy on its own, sync workers mostly wait on
+# the database and the antifraud service
+workers = env(
+    "GUNICORN_WORKERS",
+    int,
+    default=CPU_COUNT if ASYNC_WORKER else CPU_COUNT * 2 + 1,
+)
+
+# Threads per sync worker, more than one switches to the gthread worker.
+# Unused by ASGI workers.
+threads = env("GUNICORN_THREADS", int, default=1 if ASYNC_WORKER else 2)
+
+
+# Timeouts
+
+timeout = env("GUNICORN_TIMEOUT", int, default=30)
+
+graceful_timeout = env("GUNICORN_GRACEFUL_TIMEOUT", int, default=30)
+
+keepalive = env("GUNICORN_KEEPALIVE", int, default=5)
+
+# The worker heartbeat file, on tmpfs so a slow disk can't stall it
+worker_tmp_dir = "/dev/shm" if Path("/dev/shm").is_dir() else None  # noqa: S108
+
+
+# Worker recycling
+
+# Restart a worker after this many requests, 0 disables it. A random
+# jitter of up to max_requests_jitter keeps workers from restarting at once.
+max_requests = env("GUNICORN_MAX_REQUESTS", int, default=10000)
+
+max_requests_jitter = env(
+    "GUNICORN_MAX_REQUESTS_JITTER",
+    int,
+    default=max_requests // 10,
+)
+
+
+# Preloading
+
+# Import the app once in the master, workers share its memory pages until
+# they write to them
+preload_app = env("GUNICORN_PRELOAD", bool, default=True)
+
+if preload_app:
+    # Collections in the master would free objects between pages the
+    # workers share, gc.freeze() below keeps workers from touching them.
+    gc.disable()
+
+
+def pre_fork(server: Any, worker: Any) -> None:
+    if not preload_app:
+        return
+
+    # Closing a connection inherited by a worker would end it for the
+    # master and every other worker too
+    connections.close_all()
+
+    gc.freeze()
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    if not preload_app:
+        return
+
+    gc.enable()
+
+    # The app directory is only on sys.path once gunicorn loaded the app
+    from config.integrations.antifraud.client import (  # noqa: PLC0415
+        AntifraudClient,
+    )
+
+    # Cache and HTTP clients the master may have opened are rebuilt lazily
+    for alias in caches:
+        with contextlib.suppress(AttributeError):
+            del caches[alias]
+
+    AntifraudClient.close()